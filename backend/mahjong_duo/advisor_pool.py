@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Advisor 计算池：把 CPU 密集的 advisor 调用移出 asyncio 事件循环。
+
+- 默认使用独立进程池（spawn），避免一次慢的 AI 决策卡住同一 worker 里的所有 websocket；
+  规则核心不再受 GIL 限制后可改用线程池（MAHJONG_ADVISOR_EXECUTOR=thread）。
+- 局面以可序列化的快照（encode_state）送入工作进程，决策以普通 dict 返回。
+- 对局中的 AI 决策优先：提示请求最多占用 hint_slots 个工作槽，排队数超过 hint_queue 时直接拒绝，
+  提示洪水因此无法挤占对局流量。只有一个工作槽时提示不进主执行器，而是在单独的单工作者
+  执行器里排队（进程模式下降低其调度优先级），AI 决策永远不会排在提示后面。
+- 调用方取消（asyncio 任务被 cancel）时，尚未开始的计算会一并从执行器中撤销。
+
+环境变量：
+    MAHJONG_ADVISOR_EXECUTOR  process | thread（默认 process）
+    MAHJONG_ADVISOR_WORKERS   工作进程/线程数（默认 min(2, CPU 数)）
+    MAHJONG_HINT_QUEUE        同时排队的提示请求上限（默认 8）
+"""
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+from typing import Any, Dict, Optional
+
+from mahjong_duo.rules_core import GameState
+
+ADVICE_KINDS = ("draw", "opponent_discard")
+
+
+HINT_NICE = 10  # 独立提示进程的 nice 增量
+
+
+class AdvisorBusy(Exception):
+    """提示队列已满。"""
+
+
+def encode_state(state: GameState) -> bytes:
+    """局面快照：GameState 的紧凑二进制格式（见 rules_core.state_to_bytes），比 pickle 小且快。"""
+    return state.to_bytes()
+
+
+def decode_state(blob: bytes) -> GameState:
+    return GameState.from_bytes(blob)
+
+
+def _run_advice(kind: str, blob: bytes, seat: int) -> Dict[str, Any]:
+    """在工作进程/线程中执行；模块级函数以便被 spawn 出的进程导入。"""
+    from mahjong_duo.advisors.advisor import advise_on_draw, advise_on_opponent_discard
+
+    state = decode_state(blob)
+    if kind == "draw":
+        return advise_on_draw(state, seat) or {}
+    if kind == "opponent_discard":
+        return advise_on_opponent_discard(state, seat) or {}
+    raise ValueError(f"unknown advice kind: {kind}")
+
+
+def _lower_priority() -> None:
+    """独立提示进程的初始化函数：降低调度优先级，与 AI 决策争抢 CPU 时让路。"""
+    try:
+        os.nice(HINT_NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+class AdvisorPool:
+    def __init__(self, mode: str = "process", workers: int = 2, hint_queue: int = 8):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"unknown advisor executor: {mode}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.hint_queue = max(1, hint_queue)
+        # 至少留一个工作槽给对局中的 AI；为 0 时提示走独立的低优先级执行器
+        self.hint_slots = self.workers - 1
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._hint_executor: Optional[concurrent.futures.Executor] = None
+        self._hint_sem: Optional[asyncio.Semaphore] = None
+        self._hint_pending = 0
+
+    @classmethod
+    def from_env(cls) -> "AdvisorPool":
+        return cls(
+            mode=os.environ.get("MAHJONG_ADVISOR_EXECUTOR", "process"),
+            workers=int(os.environ.get("MAHJONG_ADVISOR_WORKERS", min(2, os.cpu_count() or 1))),
+            hint_queue=int(os.environ.get("MAHJONG_HINT_QUEUE", 8)),
+        )
+
+    def _new_executor(self, workers: int, name: str, low_priority: bool = False) -> concurrent.futures.Executor:
+        if self.mode == "thread":
+            # 线程无法单独降低优先级，只保证不占用 AI 的工作槽
+            return concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_lower_priority if low_priority else None)
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        # 懒创建：gunicorn fork 出 worker 之后才在各自进程里启动
+        if self._executor is None:
+            self._executor = self._new_executor(self.workers, "advisor")
+        return self._executor
+
+    def _get_hint_executor(self) -> concurrent.futures.Executor:
+        if self.hint_slots > 0:
+            return self._get_executor()
+        if self._hint_executor is None:
+            self._hint_executor = self._new_executor(1, "advisor-hint", low_priority=True)
+        return self._hint_executor
+
+    async def _submit(self, executor: concurrent.futures.Executor, kind: str, state: GameState,
+                      seat: int) -> Dict[str, Any]:
+        if kind not in ADVICE_KINDS:
+            raise ValueError(f"unknown advice kind: {kind}")
+        loop = asyncio.get_running_loop()
+        blob = encode_state(state)
+        return await loop.run_in_executor(executor, _run_advice, kind, blob, seat)
+
+    async def advise(self, kind: str, state: GameState, seat: int) -> Dict[str, Any]:
+        """对局中 AI 的决策：不限流，直接进入执行器。"""
+        return await self._submit(self._get_executor(), kind, state, seat)
+
+    async def hint(self, kind: str, state: GameState, seat: int) -> Dict[str, Any]:
+        """玩家提示：排队数超过上限时抛出 AdvisorBusy。"""
+        if self._hint_pending >= self.hint_queue:
+            raise AdvisorBusy()
+        if self._hint_sem is None:
+            self._hint_sem = asyncio.Semaphore(max(1, self.hint_slots))
+        self._hint_pending += 1
+        try:
+            async with self._hint_sem:
+                return await self._submit(self._get_hint_executor(), kind, state, seat)
+        finally:
+            self._hint_pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "hint_slots": self.hint_slots,
+            "hint_pending": self._hint_pending,
+            "hint_queue": self.hint_queue,
+        }
+
+    def shutdown(self) -> None:
+        for executor in (self._executor, self._hint_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._hint_executor = None
+
+
+advisor_pool = AdvisorPool.from_env()
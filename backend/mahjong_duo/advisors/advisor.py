@@ -16,6 +16,9 @@ AI 提示模块（Advisor）：在给定 GameState 下，为当前玩家提供
   （3）仅在**自己未来的摸牌序列**里搜索首张有效张出现的位置，推进一步并重估；
   直到向听=-1（胡）。这在大多数局面下给出合理的最短自摸轮数估计。
 - 对手 TTW 同理（使用对手的摸牌序列）。
+- 开局阶段（无副露、前几手）先查开局定式库，命中且不会被对手立即荣和时直接采用，跳过搜索。
+- TTW/番数估计与最终决策按 Zobrist 哈希存入有界置换表，不同打牌顺序到达的同一局面、
+  各候选间共享的对手手牌都只计算一次。
 
 接口：
 - advise_on_discard(state: GameState, seat: int) -> dict
@@ -30,16 +33,19 @@ AI 提示模块（Advisor）：在给定 GameState 下，为当前玩家提供
   "detail": {...}            # 包含评分、TTW/Fan、候选比较等
 }
 """
+from copy import deepcopy
 from dataclasses import replace
 from typing import List, Tuple, Optional, Dict, Any
 from functools import lru_cache
 
 from mahjong_duo.rules_core import (
-    TILE_TYPES, tile_to_str, GameState, Meld,
+    TILE_TYPES, tile_to_str, GameState, Meld, PlayerState,
     can_hu_four_plus_one, compute_score_summary, count_kongs,
     is_full_flush, is_menzen, is_all_triplets, count_concealed_triplets,
-    check_yakuman, is_tanyao
+    check_yakuman, is_tanyao, zobrist_wall, zobrist_player, canonicalize_counts
 )
+from mahjong_duo.advisors.transposition import TranspositionTable, MISSING
+from mahjong_duo.advisors.opening_book import get_default_book
 
 # ------------------------------
 #       向听与有效张估计
@@ -52,7 +58,7 @@ def _counts(tiles: Tuple[int, ...]) -> Tuple[int, ...]:
         c[t]+=1
     return tuple(c)
 
-@lru_cache(maxsize=128)
+@lru_cache(maxsize=1 << 15)
 def _min_adds_to_complete(counts: Tuple[int, ...], melds_done: int, has_pair: bool) -> int:
     """返回从当前（未包括明刻/杠）牌型到完成 4 面子 1 将所需最少“补牌张数”。
     这相当于一个标准的向听近似（返回值即“距离胡牌还差的张数”，胡=-1）。
@@ -131,7 +137,8 @@ def shanten_number(hand: Tuple[int, ...], melds: Tuple[Meld, ...]) -> int:
     """
     if can_hu_four_plus_one(hand, melds):
         return -1
-    c = _counts(hand)
+    # 在花色对称规范形上查缓存，同一对称类的手牌共享结果
+    c, _ = canonicalize_counts(_counts(hand))
     # 已有的明刻/杠都视作已成面子
     melds_done = len(melds)
     need = _min_adds_to_complete(c, melds_done, has_pair=False)
@@ -167,11 +174,15 @@ def _future_draw_indices(state: GameState, seat: int) -> List[int]:
       下一次在 wall[2]，然后 wall[4]，以此类推。
     - 否则，它从 wall[1] 开始，之后每隔 2 张。
     """
+    return list(range(_draw_start(state, seat), len(state.wall), 2))
+
+
+def _draw_start(state: GameState, seat: int) -> int:
     start = 0 if seat == state.turn else 1
     # 如果当前玩家手牌已经是 14 张（刚摸到），下一次摸牌要等到对方摸->自己再摸，因此偏移 +2
     if seat == state.turn and len(state.players[seat].hand) % 3 == 2:
         start = 2  # 自己这轮将先打出，再轮到对方摸，下一次自己摸的位置
-    return list(range(start, len(state.wall), 2))
+    return start
 
 
 def estimate_ttw_by_greedy(state: GameState, seat: int, hand: Tuple[int,...], melds: Tuple[Meld,...]) -> Optional[int]:
@@ -215,6 +226,85 @@ def estimate_ttw_by_greedy(state: GameState, seat: int, hand: Tuple[int,...], me
         rounds += 1
 
 
+# ------------------------------
+#        置换表（评估缓存）
+# ------------------------------
+
+ADVISOR_TT_BITS = 16  # 2^16 个桶 × 2 槽
+_tt = TranspositionTable(ADVISOR_TT_BITS)
+
+# 各类评估的键盐，避免同一局面的 TTW / 番数 / 决策互相覆盖
+_SALT_TTW = 0x243F6A8885A308D3
+_SALT_FAN = 0x13198A2E03707344
+_SALT_DRAW_START = (0xA4093822299F31D0, 0x082EFA98EC4E6C89, 0x452821E638D01377)
+_SALT_DECISION = {
+    "discard": 0xBE5466CF34E90C6C,
+    "opponent_discard": 0xC0AC29B7C97C50DD,
+    "draw": 0x3F84D5B5B5470917,
+}
+_SALT_OPENING = 0x34E90C6CC0AC29B7
+
+
+def _cached_ttw(state: GameState, seat: int, hand: Tuple[int,...], melds: Tuple[Meld,...]) -> Optional[int]:
+    """estimate_ttw_by_greedy 的置换表版本：TTW 只取决于牌墙位置、摸牌起点与该座位手牌/副露。"""
+    key = (zobrist_wall(state.seed, len(state.wall)) ^ _SALT_DRAW_START[_draw_start(state, seat)]
+           ^ zobrist_player(seat, hand, melds) ^ _SALT_TTW)
+    hit = _tt.lookup(key)
+    if hit is not MISSING:
+        return hit
+    ttw = estimate_ttw_by_greedy(state, seat, hand, melds)
+    # 轮数越多重算越贵，作为替换深度
+    _tt.store(key, ttw if ttw is not None else len(state.wall), ttw)
+    return ttw
+
+
+def _cached_fan(state: GameState, seat: int, hand: Tuple[int,...], melds: Tuple[Meld,...]) -> int:
+    """estimate_final_fan_upper(reason="zimo") 的置换表版本：番数只取决于手牌与副露，与座位无关。"""
+    key = zobrist_player(0, hand, melds) ^ _SALT_FAN
+    hit = _tt.lookup(key)
+    if hit is not MISSING:
+        return hit
+    fan = estimate_final_fan_upper(state, seat, hand, melds)
+    _tt.store(key, 0, fan)
+    return fan
+
+
+def _decision_key(state: GameState, seat: int, kind: str) -> int:
+    """决策缓存键：覆盖决策读取的全部输入。
+
+    Zobrist 哈希已含牌墙位置、轮次与双方手牌/副露；此外决策还读取
+    last_discard（响应对象）和是否仍在定式阶段（取决于弃牌张数，不在哈希中）。
+    """
+    key = state.zobrist ^ _SALT_DECISION[kind] ^ (seat + 1)
+    if state.last_discard is not None:
+        from_seat, tile = state.last_discard
+        key ^= ((from_seat * TILE_TYPES + tile + 1) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    if _in_opening(state.players[seat]):
+        key ^= _SALT_OPENING
+    return key
+
+
+def _cached_decision(state: GameState, seat: int, kind: str, compute) -> Dict[str, Any]:
+    key = _decision_key(state, seat, kind)
+    hit = _tt.lookup(key)
+    if hit is MISSING:
+        hit = compute()
+        _tt.store(key, len(state.players[seat].hand), hit)
+    # 建议含嵌套的 detail，缓存里的那份不能交给调用方修改
+    return deepcopy(hit)
+
+
+def transposition_stats() -> Dict[str, Any]:
+    return _tt.stats()
+
+
+def clear_caches() -> None:
+    """清空本模块的全部缓存：置换表（TTW、番数与决策缓存）以及向听计算的 lru_cache。"""
+    _tt.clear()
+    _counts.cache_clear()
+    _min_adds_to_complete.cache_clear()
+
+
 # ------------------------------
 #        Fan 估计（终局上限）
 # ------------------------------
@@ -277,7 +367,7 @@ def _opponent_ttw(state: GameState, seat: int) -> Optional[int]:
     opp = 1 - seat
     ph = state.players[opp].hand
     pm = state.players[opp].melds
-    return estimate_ttw_by_greedy(state, opp, ph, pm)
+    return _cached_ttw(state, opp, ph, pm)
 
 
 # ------------------------------
@@ -289,8 +379,45 @@ def _points_from_summary(summary: Dict[str, Any], winner: int) -> int:
     return summary["players"][str(winner)]["net_change"]
 
 def advise_on_discard(state: GameState, seat: int) -> Dict[str, Any]:
+    assert len(state.players[seat].hand) % 3 == 2, "需要在 14 张时调用"
+    return _cached_decision(state, seat, "discard", lambda: _advise_on_discard(state, seat))
+
+
+OPENING_BOOK_PLIES = 4  # 自己打出的前几张内查定式
+
+
+def _in_opening(me: PlayerState) -> bool:
+    return not me.melds and len(me.discards) < OPENING_BOOK_PLIES
+
+
+def _opening_book_discard(state: GameState, seat: int) -> Optional[int]:
+    me = state.players[seat]
+    if not _in_opening(me):
+        return None
+    book = get_default_book()
+    if book is None:
+        return None
+    tile = book.lookup(me.hand)
+    if tile is None or tile not in me.hand:
+        return None
+    # 定式不看牌墙，仍要避开会被对手立即荣和的张
+    opp = state.players[1-seat]
+    if can_hu_four_plus_one(tuple(sorted(opp.hand + (tile,))), opp.melds):
+        return None
+    return tile
+
+
+def _advise_on_discard(state: GameState, seat: int, *, use_book: bool = True) -> Dict[str, Any]:
     me = state.players[seat]
-    assert len(me.hand) % 3 == 2, "需要在 14 张时调用"
+    if use_book:
+        tile = _opening_book_discard(state, seat)
+        if tile is not None:
+            return {
+                "action": "discard",
+                "tile": tile,
+                "reason": f"建议打出【{tile_to_str(tile)}】。开局定式：保留向听数最小、有效张最多的牌型。",
+                "detail": {"picked": {"discard": tile}, "source": "opening_book"},
+            }
 
     opp_ttw = _opponent_ttw(state, seat)
 
@@ -324,8 +451,8 @@ def advise_on_discard(state: GameState, seat: int) -> Dict[str, Any]:
         # 模拟打出 t
         new_hand = list(me.hand); new_hand.remove(t); new_hand = tuple(new_hand)
 
-        my_ttw = estimate_ttw_by_greedy(state, seat, new_hand, me.melds)
-        my_fan = estimate_final_fan_upper(state, seat, new_hand, me.melds)
+        my_ttw = _cached_ttw(state, seat, new_hand, me.melds)
+        my_fan = _cached_fan(state, seat, new_hand, me.melds)
         # 若处于听牌，可将“荣和上界”作为进攻参考（不替代真实 fan，仅作加成或注释）
         if my_ron_fan_upper is not None and (my_ttw is None or my_ttw > 0):
             # 处于听牌 → 可能通过荣和比自摸更快，这里不直接替换 fan，只在说明里展示
@@ -402,8 +529,12 @@ def advise_on_discard(state: GameState, seat: int) -> Dict[str, Any]:
 def advise_on_opponent_discard(state: GameState, seat: int) -> Dict[str, Any]:
     """当对手打出一张（state.last_discard 不为空）时，给出 荣/碰/杠/过 的建议。"""
     assert state.last_discard is not None, "需要在对手打出后调用"
+    assert state.last_discard[0] != seat
+    return _cached_decision(state, seat, "opponent_discard", lambda: _advise_on_opponent_discard(state, seat))
+
+
+def _advise_on_opponent_discard(state: GameState, seat: int) -> Dict[str, Any]:
     from_seat, tile = state.last_discard
-    assert from_seat != seat
 
     me = state.players[seat]
     merged = tuple(sorted(me.hand + (tile,)))
@@ -439,8 +570,8 @@ def advise_on_opponent_discard(state: GameState, seat: int) -> Dict[str, Any]:
             new_melds = list(me.melds)
             new_melds.append(Meld("kong_exposed", (tile,tile,tile,tile)))
             new_hand = tuple(sorted(new_hand))
-            my_ttw_A = estimate_ttw_by_greedy(state, seat, new_hand, tuple(new_melds))
-            my_fan_A = estimate_final_fan_upper(state, seat, new_hand, tuple(new_melds), reason="zimo")
+            my_ttw_A = _cached_ttw(state, seat, new_hand, tuple(new_melds))
+            my_fan_A = _cached_fan(state, seat, new_hand, tuple(new_melds))
             best_A = ("kong", my_ttw_A, my_fan_A)
         else:
             new_hand = list(me.hand)
@@ -448,14 +579,14 @@ def advise_on_opponent_discard(state: GameState, seat: int) -> Dict[str, Any]:
             new_melds = list(me.melds)
             new_melds.append(Meld("pong", (tile,tile,tile)))
             new_hand = tuple(sorted(new_hand))
-            my_ttw_A = estimate_ttw_by_greedy(state, seat, new_hand, tuple(new_melds))
+            my_ttw_A = _cached_ttw(state, seat, new_hand, tuple(new_melds))
             # 门清失去
-            my_fan_A = estimate_final_fan_upper(state, seat, new_hand, tuple(new_melds), reason="zimo")
+            my_fan_A = _cached_fan(state, seat, new_hand, tuple(new_melds))
             best_A = ("peng", my_ttw_A, my_fan_A)
 
     # 路径B：过
-    my_ttw_B = estimate_ttw_by_greedy(state, seat, me.hand, me.melds)
-    my_fan_B = estimate_final_fan_upper(state, seat, me.hand, me.melds, reason="zimo")
+    my_ttw_B = _cached_ttw(state, seat, me.hand, me.melds)
+    my_fan_B = _cached_fan(state, seat, me.hand, me.melds)
 
     if best_A is not None:
         act, ttwA, fanA = best_A
@@ -486,8 +617,12 @@ def advise_on_opponent_discard(state: GameState, seat: int) -> Dict[str, Any]:
 
 def advise_on_draw(state: GameState, seat: int) -> Dict[str, Any]:
     """自己摸牌到 14 张后的决策：优先检查胡、再比较杠与不杠的路径；若不杠，则给出打牌建议。"""
+    assert len(state.players[seat].hand) % 3 == 2, "需要在 14 张时调用"
+    return _cached_decision(state, seat, "draw", lambda: _advise_on_draw(state, seat))
+
+
+def _advise_on_draw(state: GameState, seat: int) -> Dict[str, Any]:
     me = state.players[seat]
-    assert len(me.hand) % 3 == 2, "需要在 14 张时调用"
 
     # 1) 能自摸直接建议胡
     if can_hu_four_plus_one(me.hand, me.melds):
@@ -539,13 +674,16 @@ def advise_on_draw(state: GameState, seat: int) -> Dict[str, Any]:
     # 比较“杠后路径”与“不杠直接打牌”
     best_kong = None
     for kind, tile, nh, nm in kong_candidates:
-        ttwA = estimate_ttw_by_greedy(state, seat, nh, nm)
-        fanA = estimate_final_fan_upper(state, seat, nh, nm)
+        ttwA = _cached_ttw(state, seat, nh, nm)
+        fanA = _cached_fan(state, seat, nh, nm)
         scoreA = _score(fanA, ttwA)
         best_kong = (kind, tile, ttwA, fanA, scoreA)
 
-    # 不杠：走打牌建议
-    discard_plan = advise_on_discard(state, seat)
+    # 不杠：走打牌建议（需要与杠比较评分时不走定式）
+    if kong_candidates:
+        discard_plan = _advise_on_discard(state, seat, use_book=False)
+    else:
+        discard_plan = advise_on_discard(state, seat)
 
     if best_kong is not None:
         kind, tile, ttwA, fanA, scoreA = best_kong
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+开局定式库（Opening Book）：预先算好常见 14 张开局手牌的推荐弃张，存为可内存映射的紧凑文件。
+
+- 三门花色（万/条/筒）可任意置换、单门 1↔9 可翻转：先用 rules_core.canonicalize_counts
+  把手牌映射到规范形再查表，最后把规范形下的弃张映射回原编号，表项最多可缩小 48 倍；
+- 定式只依据手牌本身（向听数 → 有效张枚数），与牌墙无关，因此才能利用上述对称；
+- 文件格式（小端）：
+    header  : magic b"MJOB" | u16 version | u16 reserved | u32 count
+    keys    : count × u64，升序；键为 27 种牌张数的 5 进制打包（5^27 < 2^63）
+    values  : count × u8，规范形下的推荐弃张
+  查表为 mmap 上的二分查找，不需要把整表读入内存。
+
+生成工具见 scripts/build_opening_book.py。
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from mahjong_duo.rules_core import (
+    TILE_TYPES, counts_from_tiles, canonicalize_counts, canonical_tile_to_original,
+)
+
+BOOK_MAGIC = b"MJOB"
+BOOK_VERSION = 2  # v2：键改用含 1↔9 翻转的规范形
+_HEADER = struct.Struct("<4sHHI")
+_KEY = struct.Struct("<Q")
+
+DEFAULT_BOOK_PATH = Path(__file__).resolve().parent / "opening_book.bin"
+
+logger = logging.getLogger("mahjong_duo.opening_book")
+
+
+def pack_counts(counts: Sequence[int]) -> int:
+    key = 0
+    for c in counts:
+        key = key * 5 + c
+    return key
+
+
+class OpeningBook:
+    """只读定式库：mmap 打开文件，按键二分查找。"""
+
+    def __init__(self, path: os.PathLike):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        magic, version, _, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError(f"bad opening book file: {self.path}")
+        expected = _HEADER.size + count * (_KEY.size + 1)
+        if len(self._mm) < expected:
+            self.close()
+            raise ValueError(f"truncated opening book file: {self.path}")
+        self.count = count
+        self._keys_off = _HEADER.size
+        self._vals_off = _HEADER.size + count * _KEY.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key_at(self, i: int) -> int:
+        return _KEY.unpack_from(self._mm, self._keys_off + i * _KEY.size)[0]
+
+    def _find(self, key: int) -> Optional[int]:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = self._key_at(mid)
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return self._mm[self._vals_off + mid]
+        return None
+
+    def lookup(self, hand: Tuple[int, ...]) -> Optional[int]:
+        """返回该手牌的定式弃张（原花色编号），未收录返回 None。"""
+        canon, transform = canonicalize_counts(counts_from_tiles(hand))
+        tile = self._find(pack_counts(canon))
+        if tile is None:
+            return None
+        return canonical_tile_to_original(tile, transform)
+
+    def close(self) -> None:
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+            self._mm = None
+        self._file.close()
+
+
+def write_book(path: os.PathLike, entries: Iterable[Tuple[Sequence[int], int]]) -> int:
+    """写出定式库。entries 为 (规范形张数, 规范形弃张)；重复键保留第一条。返回写入条数。"""
+    table = {}
+    for counts, tile in entries:
+        if not 0 <= tile < TILE_TYPES:
+            raise ValueError(f"bad tile in opening book entry: {tile}")
+        table.setdefault(pack_counts(counts), tile)
+    keys: List[int] = sorted(table)
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, 0, len(keys)))
+        f.write(b"".join(_KEY.pack(k) for k in keys))
+        f.write(bytes(table[k] for k in keys))
+    os.replace(tmp, path)
+    return len(keys)
+
+
+_book: Optional[OpeningBook] = None
+_book_loaded = False
+_book_lock = threading.Lock()  # 线程池模式下多个 advisor 线程可能同时首次加载
+
+
+def get_default_book() -> Optional[OpeningBook]:
+    """按环境变量 MAHJONG_OPENING_BOOK（或默认路径）懒加载定式库。
+
+    文件不存在或无法解析时返回 None（后者记一条 warning），调用方照常搜索。
+    """
+    global _book, _book_loaded
+    if _book_loaded:
+        return _book
+    with _book_lock:
+        if not _book_loaded:
+            path = Path(os.environ.get("MAHJONG_OPENING_BOOK", DEFAULT_BOOK_PATH))
+            if path.is_file():
+                try:
+                    _book = OpeningBook(path)
+                except (OSError, ValueError) as e:
+                    logger.warning("opening book %s not loaded: %s", path, e)
+            _book_loaded = True
+    return _book
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+置换表（Transposition Table）：以 64 位 Zobrist 哈希为键，缓存 advisor 的局面评估结果。
+
+- 容量固定（2 的幂个桶），内存有上界；
+- 每个桶两个槽：深度优先槽（保留计算代价更高的条目）+ 总是替换槽；
+- 条目保存完整 64 位键，取用时校验，桶冲突不会返回错误结果；
+- 读写加锁：线程池模式（MAHJONG_ADVISOR_EXECUTOR=thread）下多个线程共用同一张表，
+  store 要改写两个槽的三个数组，不加锁时并发 get 可能拿到另一条目的值。
+"""
+import threading
+from typing import Any, List, Optional
+
+MISSING = object()  # lookup 未命中时的哨兵
+
+
+class TranspositionTable:
+    def __init__(self, size_bits: int = 16):
+        self.size_bits = size_bits
+        self._mask = (1 << size_bits) - 1
+        slots = 2 << size_bits
+        self._keys: List[Optional[int]] = [None] * slots
+        self._depths: List[int] = [0] * slots
+        self._values: List[Any] = [None] * slots
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: int, default: Any = None) -> Any:
+        i = (key & self._mask) << 1
+        with self._lock:
+            if self._keys[i] == key:
+                self.hits += 1
+                return self._values[i]
+            if self._keys[i + 1] == key:
+                self.hits += 1
+                return self._values[i + 1]
+            self.misses += 1
+            return default
+
+    def lookup(self, key: int) -> Any:
+        """与 get 相同，但未命中时返回哨兵 MISSING（值本身可以是 None）。"""
+        return self.get(key, MISSING)
+
+    def store(self, key: int, depth: int, value: Any) -> None:
+        """depth 代表重新计算该条目的代价；代价不低于深度槽时占据深度槽，原条目降到替换槽。"""
+        i = (key & self._mask) << 1
+        with self._lock:
+            self.stores += 1
+            keys, depths, values = self._keys, self._depths, self._values
+            if keys[i] == key or keys[i] is None or depth >= depths[i]:
+                if keys[i] is not None and keys[i] != key:
+                    keys[i + 1], depths[i + 1], values[i + 1] = keys[i], depths[i], values[i]
+                elif keys[i + 1] == key:
+                    keys[i + 1] = None
+                keys[i], depths[i], values[i] = key, depth, value
+            else:
+                keys[i + 1], depths[i + 1], values[i + 1] = key, depth, value
+
+    def clear(self) -> None:
+        n = len(self._keys)
+        with self._lock:
+            self._keys = [None] * n
+            self._depths = [0] * n
+            self._values = [None] * n
+            self.hits = self.misses = self.stores = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            used = sum(1 for k in self._keys if k is not None)
+            total = self.hits + self.misses
+        return {
+            "capacity": len(self._keys),
+            "used": used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
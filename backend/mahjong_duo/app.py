@@ -1,25 +1,45 @@
 # -*- coding: utf-8 -*-
-import json, asyncio, random, secrets
+import asyncio, os, random, time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dataclasses import replace
-from typing import Dict, Optional
+from typing import Dict, Optional, Set, Tuple, Union
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from mahjong_duo.rules_core import (
     GameState, sort_hand, compute_score_summary, init_game, legal_choices,
     resolve_rob_kong_pass, resolve_rob_kong_hu, draw, discard,
     kong_concealed, prepare_added_kong, claim_peng, claim_kong_exposed,
-    can_peng, can_kong_exposed, can_hu_four_plus_one
-    
 )
-from mahjong_duo.advisors.advisor import advise_on_draw, advise_on_opponent_discard
-from mahjong_duo.database import db, init_database
+from mahjong_duo.advisor_pool import advisor_pool, AdvisorBusy
+from mahjong_duo.database import GameResult, db, init_database
+from mahjong_duo import metrics, watchdog
+from mahjong_duo.encoding import EncodedMessage, encode, encode_draw, encode_discard, encode_pass
+from mahjong_duo.sync import SyncTracker
+from mahjong_duo.ratelimit import RateLimiter, rate_limit_hook
+from mahjong_duo.token_store import token_store
+from mahjong_duo.sharding import shards
+from mahjong_duo.room_registry import RoomRegistry, RoomError, deep_sizeof
+from mahjong_duo.result_writer import result_writer
+from mahjong_duo.room_store import RoomSnapshot, room_persister
+from mahjong_duo import replay
+from mahjong_duo.replay import GameRecorder, replay_logs
+from mahjong_duo.wire import WIRE_VERSION
+from mahjong_duo.dispatch import (
+    Dispatcher, timing_hook, match_choice,
+    Empty, Authenticate, JoinRoom, Act, SyncMode, SyncAck, Wire,
+    parse_authenticate, parse_join_room, parse_act, parse_sync_mode, parse_sync_ack, parse_wire,
+)
 
 STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
 INDEX_FILE = STATIC_DIR / "index.html"
 
+SEND_TIMEOUT = 5.0               # 单次发送超时（秒）
+SEND_BUFFER_LIMIT = 256 * 1024   # 单个连接积压的未发送字节上限
+INBOUND_QUEUE = int(os.environ.get("MAHJONG_INBOUND_QUEUE", 32))  # 单个连接待处理的入站消息上限
+
 BASE_SCORE = 8  # 初始分为 1000 时，1 番起始变动约为 16 分
 
 
@@ -43,6 +63,23 @@ app.add_middleware(
 async def startup_event():
     """启动时初始化数据库"""
     await init_database()
+    if watchdog.enabled():
+        watchdog.watchdog.start()
+    rooms.start()
+    room_persister.start()
+    result_writer.start()
+    replay_logs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await rooms.stop()
+    await room_persister.stop()
+    await result_writer.stop()
+    await replay_logs.stop()
+    await db.close()
+    await watchdog.watchdog.stop()
+    await token_store.close()
+    advisor_pool.shutdown()
 
 @app.post("/api/login")
 async def login(request: Request):
@@ -59,13 +96,12 @@ async def login(request: Request):
             )
 
         # 验证用户
-        user = await db.authenticate_user(username, password)
+        user = result_writer.overlay(await db.authenticate_user(username, password))
         if user:
-            token = secrets.token_urlsafe(32)
-            authenticated_sessions[token] = {
+            token = await token_store.issue({
                 "user_id": user["id"],
                 "username": user["username"],
-            }
+            })
             return JSONResponse(content={
                 "success": True,
                 "user": user,
@@ -86,10 +122,10 @@ async def login(request: Request):
 async def get_user_info(username: str):
     """获取用户信息"""
     try:
-        user = await db.get_user_by_username(username)
+        user = result_writer.overlay(await db.get_user_by_username(username))
         if user:
             # 获取用户统计信息
-            stats = await db.get_user_stats(user["id"])
+            stats = result_writer.overlay_stats(user["id"], await db.get_user_stats(user["id"]))
             return JSONResponse(content={
                 "user": user,
                 "stats": stats
@@ -128,7 +164,7 @@ async def get_user_records(username: str, limit: int = 20):
 async def get_leaderboard(limit: int = 10):
     """获取排行榜"""
     try:
-        leaderboard = await db.get_leaderboard(limit)
+        leaderboard = await result_writer.leaderboard(limit)
         return JSONResponse(content={"leaderboard": leaderboard})
     except Exception as e:
         return JSONResponse(
@@ -136,8 +172,38 @@ async def get_leaderboard(limit: int = 10):
             content={"error": f"服务器错误: {str(e)}"}
         )
 
-# 存储已登录的用户会话
-authenticated_sessions: Dict[str, Dict] = {}
+@app.get("/api/route")
+async def route_room(room_id: str = "default"):
+    """房间所在的分片（多进程分片部署时客户端据此选择连接地址）"""
+    return JSONResponse(content=shards.locate(room_id))
+
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+def _require_local(request: Request) -> None:
+    """运维接口仅允许本机访问；对外表现为不存在"""
+    if request.client is None or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=404)
+
+@app.get("/api/metrics")
+async def get_metrics(request: Request):
+    """websocket 发送延迟（按消息类型）、失败与断开计数，仅允许本机访问"""
+    _require_local(request)
+    return JSONResponse(content={**metrics.snapshot(), "rooms": rooms.stats()})
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """Prometheus 文本格式指标，仅允许本机访问"""
+    _require_local(request)
+    room_stats = rooms.stats()
+    text = metrics.render_prometheus({
+        "mahjong_rooms": room_stats["rooms"],
+        "mahjong_rooms_occupied": room_stats["occupied"],
+        "mahjong_rooms_memory_bytes": room_stats["memory_bytes"],
+        "mahjong_sessions": sum(len(r.sess) for r in rooms.values()),
+        "mahjong_hint_pending": advisor_pool.stats()["hint_pending"],
+    })
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
 
 
 class Session:
@@ -148,21 +214,197 @@ class Session:
         self.user_id: Optional[int] = None
         self.username: Optional[str] = None
         self.vip_level: int = 0
-
-    async def send(self, data: dict):
-        await self.ws.send_text(json.dumps(data, ensure_ascii=False))
+        self.pending_bytes = 0
+        self.dropped = False
+        self.sync = SyncTracker()
+        self.binary = False  # 已协商二进制线协议（见 mahjong_duo/wire.py）
+        self.close_code: Optional[int] = None  # 客户端断开时的关闭码
+        self.limiter = RateLimiter()
+
+    async def send(self, data: Union[dict, EncodedMessage]):
+        msg = data if isinstance(data, EncodedMessage) else encode(data, binary=self.binary)
+        await self.send_encoded(msg)
+
+    async def send_encoded(self, msg: EncodedMessage) -> bool:
+        """发送已编码的消息；超时或积压超限的连接会被标记并断开。返回是否发送成功。"""
+        if self.dropped:
+            return False
+        msg_type = msg.type
+        use_binary = self.binary and msg.binary is not None
+        size = len(msg.binary) if use_binary else msg.size
+        self.pending_bytes += size
+        try:
+            if self.pending_bytes > SEND_BUFFER_LIMIT:
+                await self.drop("send_buffer")
+                return False
+            t0 = time.perf_counter()
+            try:
+                if use_binary:
+                    await asyncio.wait_for(self.ws.send_bytes(msg.binary), SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(self.ws.send_text(msg.text), SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self.drop("send_timeout")
+                return False
+            except Exception:
+                metrics.send_failures.inc(msg_type)
+                return False
+            metrics.send_latency.observe(msg_type, time.perf_counter() - t0)
+            metrics.outbound_messages.inc(msg_type)
+            metrics.outbound_bytes.inc(msg_type, size)
+            return True
+        finally:
+            self.pending_bytes -= size
+
+    async def drop(self, reason: str):
+        """慢连接：标记后主动关闭，读循环随后按断线流程清理座位。"""
+        if self.dropped:
+            return
+        self.dropped = True
+        metrics.dropped_sessions.inc(reason)
+        print(f"断开慢连接: user={self.username} seat={self.seat} reason={reason}")
+        try:
+            await asyncio.wait_for(self.ws.close(code=1013), 1.0)
+        except Exception:
+            pass
 
 class Room:
     def __init__(self, room_id: str):
         self.id = room_id
         self.sess: Dict[int, Session] = {}
         self.ready = {0: False, 1: False}
-        self.state: Optional[GameState] = None
+        self._state: Optional[GameState] = None
+        self.version = 0  # 每次局面变化 +1，用于丢弃过期的 advisor 结果
+        self._hints: Dict[int, Tuple[int, str, asyncio.Future]] = {}  # 座位 -> (version, phase, 计算任务)
         self.lock = asyncio.Lock()
+        self._lock_owner: Optional[asyncio.Task] = None  # 通过 locked() 持有 room.lock 的任务
         self.player_names: Dict[int, str] = {}  # 座位对应的玩家名称
         self.ai_seat: Optional[int] = None
         self.practice_mode: bool = False
         self.ai_name = "AI陪练"
+        self.recorder: Optional[GameRecorder] = None  # 本局动作日志（见 replay.py）
+        self.started_at: Optional[float] = None  # 本局开始的 unix 时间；从存储恢复的对局未知
+
+    @property
+    def state(self) -> Optional[GameState]:
+        return self._state
+
+    @state.setter
+    def state(self, value: Optional[GameState]) -> None:
+        self._state = value
+        if value is None:
+            self.close_recorder()
+        self.version += 1
+        # 局面已变，尚未返回的提示都作废
+        for _, _, task in self._hints.values():
+            task.cancel()
+        self._hints.clear()
+
+    @asynccontextmanager
+    async def locked(self):
+        """获取 room.lock，并按当前消息类型记录等待时间。"""
+        t0 = time.perf_counter()
+        async with self.lock:
+            metrics.lock_wait.observe(metrics.current_message_type.get(), time.perf_counter() - t0)
+            self._lock_owner = asyncio.current_task()
+            try:
+                yield
+            finally:
+                self._lock_owner = None
+
+    @asynccontextmanager
+    async def unlocked(self):
+        """等待 advisor 时临时释放本任务持有的 room.lock，结束后重新获取。
+
+        其间其它消息（同步、提示、离开、重新开局）照常处理，局面可能已变；
+        调用方须在之后比较 version，丢弃过期的结果。本任务未持有锁时什么也不做。
+        """
+        me = asyncio.current_task()
+        if self._lock_owner is not me:
+            yield
+            return
+        self._lock_owner = None
+        self.lock.release()
+        try:
+            yield
+        finally:
+            # 即使本任务被取消也要拿回锁：外层 locked() 退出时会释放它
+            acquire = asyncio.ensure_future(self.lock.acquire())
+            cancelled = False
+            while not acquire.done():
+                try:
+                    await asyncio.shield(acquire)
+                except asyncio.CancelledError:
+                    cancelled = True
+            self._lock_owner = me
+            if cancelled:
+                raise asyncio.CancelledError()
+
+    def pending_hint(self, seat: int, version: int) -> Optional[Tuple[str, asyncio.Future]]:
+        """同一局面下已提交的提示计算（进行中或已成功）；重复请求直接复用。"""
+        entry = self._hints.get(seat)
+        if entry is None or entry[0] != version:
+            return None
+        _, phase, task = entry
+        if task.done() and (task.cancelled() or task.exception() is not None):
+            return None
+        return phase, task
+
+    def track_hint(self, seat: int, version: int, phase: str, task: asyncio.Future) -> None:
+        self._hints[seat] = (version, phase, task)
+
+    def record(self, op: int, seat: int = 0, tile: int = 0) -> None:
+        """记录刚执行的动作；对局结束时关闭日志。"""
+        if self.recorder is None:
+            return
+        self.recorder.record(op, seat, tile, self._state)
+        if self._state is None or self._state.ended:
+            self.close_recorder()
+
+    def close_recorder(self) -> None:
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def persist_key(self) -> tuple:
+        """房间指纹：局面版本与座位信息，变化时才需要重新持久化。"""
+        return (self.version, tuple(self.ready.items()), tuple(self.player_names.items()),
+                self.ai_seat, self.practice_mode)
+
+    def snapshot(self) -> RoomSnapshot:
+        return RoomSnapshot(self.id, self._state, dict(self.ready), dict(self.player_names),
+                            self.ai_seat, self.practice_mode)
+
+    def restore(self, snap: RoomSnapshot, recorder: Optional[GameRecorder] = None) -> None:
+        self.state = snap.state
+        self.started_at = None
+        self.recorder = recorder
+        self.ready = dict(snap.ready)
+        self.player_names = dict(snap.player_names)
+        self.ai_seat = snap.ai_seat
+        self.practice_mode = snap.practice_mode
+
+    def persist(self) -> None:
+        room_persister.track(self.id, self.persist_key(), self.snapshot)
+
+    async def resume(self) -> None:
+        """从存储恢复后继续推进：轮到 AI 行动，或停在行动方摸牌之前。"""
+        async with self.locked():
+            st = self.state
+            if st is None or st.ended:
+                return
+            if self.is_ai_seat(st.turn):
+                if st.last_discard is not None:
+                    await self.step_after_discard(lock_held=True)
+                else:
+                    await self.step_auto(lock_held=True)
+            elif st.last_discard is None and st.pending_rob_kong is None and len(st.players[st.turn].hand) % 3 == 1:
+                await self.step_auto(lock_held=True)
+
+    def memory_usage(self) -> int:
+        """估算本房间持有的数据量：局面、玩家名以及各连接的同步视图。"""
+        views = [(s.sync.base, s.sync.pending) for s in self.sess.values()]
+        return deep_sizeof((self._state, self.player_names, self._hints, views))
 
     def opponent(self, seat: int) -> Optional[Session]:
         return self.sess.get(1-seat)
@@ -220,12 +462,14 @@ class Room:
         await self.broadcast({"type":"ready_status","ready":dict(self.ready)})
         await self.try_start()
 
-    async def broadcast(self, data: dict):
-        for s in self.sess.values():
-            try:
-                await s.send(data)
-            except:
-                pass
+    async def broadcast(self, data: Union[dict, EncodedMessage]):
+        # 只编码一次，并发发给所有人，避免一个卡住的客户端拖慢另一方
+        recipients = list(self.sess.values())
+        if isinstance(data, EncodedMessage):
+            msg = data
+        else:
+            msg = encode(data, binary=any(s.binary for s in recipients))
+        await asyncio.gather(*(s.send_encoded(msg) for s in recipients))
 
     def _serialize_melds(self, melds, *, reveal_hidden: bool):
         serialized = []
@@ -278,6 +522,7 @@ class Room:
         except ValueError:
             return
         self.state = result.state
+        self.record(replay.OP_ROB_KONG_HU, robber, result.tile)
 
         await self.broadcast({
             "type": "event",
@@ -300,7 +545,8 @@ class Room:
         except ValueError:
             return
         self.state = result.state
-        await self.broadcast({"type": "event", "ev": {"type": "pass", "seat": robber}})
+        self.record(replay.OP_ROB_KONG_PASS, robber)
+        await self.broadcast(encode_pass(robber))
         await self.broadcast({
             "type": "event",
             "ev": {"type": "kong", "style": "added", "seat": result.kong_owner, "tile": result.tile},
@@ -308,18 +554,25 @@ class Room:
         await self.sync_all()
         await self.step_auto(lock_held=True)
 
-    async def sync_player(self, seat: int):
+    async def sync_player(self, seat: int, *, full: bool = False):
         if not self.state: return
         sess = self.sess.get(seat)
         if not sess: return
         view = self._view_payload(seat)
-        await sess.send({"type":"sync_hand","hand": view.get("hand", [])})
         # 在同步游戏状态时也要同步对手名字
-        await sess.send({
-            "type":"sync_view",
-            **view,
-            "opponent": self.get_player_name(1-seat),
-        })
+        view["opponent"] = self.get_player_name(1-seat)
+        tracker = sess.sync
+        if tracker.enabled:
+            if not full and tracker.base is not None:
+                delta = tracker.delta(self.version, view)
+                if delta is not None:
+                    await sess.send(delta)
+                return
+            tracker.snapshot(self.version, view)
+            await sess.send({"type":"sync_view", "seq": self.version, **view})
+            return
+        await sess.send({"type":"sync_hand","hand": view.get("hand", [])})
+        await sess.send({"type":"sync_view", **view})
 
     async def sync_all(self):
         if not self.state: return
@@ -343,6 +596,9 @@ class Room:
         seed = random.randint(1, 10**9)
         first_turn = random.randint(0, 1)
         self.state = init_game(seed, first_turn=first_turn)
+        self.started_at = time.time()
+        self.close_recorder()
+        self.recorder = replay_logs.create(self.id, seed, first_turn, self.ai_seat)
         self.ready = {0: False, 1: False}
 
         await self.broadcast({
@@ -352,6 +608,7 @@ class Room:
         })
         # 给两位下发各自可见信息
         for seat, s in self.sess.items():
+            s.sync.reset()
             view = self._view_payload(seat)
             await s.send({
                 "type":"you_are",
@@ -392,6 +649,7 @@ class Room:
         if len(self.state.players[seat].hand)%3==1 and self.state.last_discard is None:
             if not self.state.wall:
                 self.state = replace(self.state, ended=True)
+                self.record(replay.OP_END)
                 score_summary = compute_score_summary(self.state, None, "wall")
                 await self.broadcast({
                     "type": "game_end",
@@ -402,9 +660,10 @@ class Room:
             if lock_held:
                 self.state, tile = draw(self.state, seat)
             else:
-                async with self.lock:
+                async with self.locked():
                     self.state, tile = draw(self.state, seat)
-            await self.broadcast({"type":"event","ev":{"type":"draw","seat":seat,"tile": (tile if True else None)}})
+            self.record(replay.OP_DRAW, seat)
+            await self.broadcast(encode_draw(seat, tile))
         await self.sync_player(seat)
         if ai_turn:
             await self._ai_take_turn(lock_held=lock_held)
@@ -423,7 +682,7 @@ class Room:
             if lock_held:
                 await self._ai_respond_to_discard(lock_held=True)
             else:
-                async with self.lock:
+                async with self.locked():
                     await self._ai_respond_to_discard(lock_held=True)
             return
 
@@ -437,7 +696,8 @@ class Room:
                 return
             if len(actions) == 1 and actions[0].get("type") == "pass":
                 self.state = replace(self.state, last_discard=None)
-                await self.broadcast({"type":"event","ev":{"type":"pass","seat":seat}})
+                self.record(replay.OP_PASS, seat)
+                await self.broadcast(encode_pass(seat))
                 await self.sync_all()
                 await self.step_auto(lock_held=True)
                 return
@@ -446,7 +706,7 @@ class Room:
         if lock_held:
             await _inner()
         else:
-            async with self.lock:
+            async with self.locked():
                 await _inner()
 
     async def _ai_take_turn(self, *, lock_held: bool):
@@ -456,7 +716,11 @@ class Room:
             seat = self.state.turn
             if not self.is_ai_seat(seat):
                 return
-            advice = advise_on_draw(self.state, seat) or {}
+            version = self.version
+            async with self.unlocked():
+                advice = await advisor_pool.advise("draw", self.state, seat)
+            if self.version != version or not self.state or self.state.ended:
+                return
             action = advice.get("action")
 
             if action == "hu":
@@ -467,6 +731,7 @@ class Room:
                 )
                 reason = "zimo_kong" if is_kong_draw else "zimo"
                 self.state = replace(self.state, ended=True)
+                self.record(replay.OP_HU, seat)
                 score_summary = compute_score_summary(self.state, seat, reason)
                 await self.broadcast({
                     "type": "game_end",
@@ -485,9 +750,11 @@ class Room:
                     try:
                         if style == "concealed":
                             self.state = kong_concealed(self.state, seat, tile)
+                            self.record(replay.OP_KONG_CONCEALED, seat, tile)
                         elif style == "added":
                             result = prepare_added_kong(self.state, seat, tile)
                             self.state = result.state
+                            self.record(replay.OP_KONG_ADDED, seat, tile)
                             if result.rob_pending:
                                 await self.sync_all()
                                 await self.step_auto(lock_held=True)
@@ -496,6 +763,7 @@ class Room:
                         else:
                             # 默认按明杠处理（一般不会出现）
                             self.state = kong_concealed(self.state, seat, tile)
+                            self.record(replay.OP_KONG_CONCEALED, seat, tile)
                             style = "concealed"
                     except Exception:
                         action = "discard"
@@ -522,14 +790,15 @@ class Room:
                 self.state = discard(self.state, seat, tile)
             except Exception:
                 return
-            await self.broadcast({"type": "event", "ev": {"type": "discard", "seat": seat, "tile": tile}})
+            self.record(replay.OP_DISCARD, seat, tile)
+            await self.broadcast(encode_discard(seat, tile))
             await self.sync_all()
             await self.step_after_discard(lock_held=True)
 
         if lock_held:
             await inner()
         else:
-            async with self.lock:
+            async with self.locked():
                 await inner()
 
     async def _ai_respond_to_discard(self, *, lock_held: bool):
@@ -543,12 +812,17 @@ class Room:
             if not self.is_ai_seat(seat):
                 return
             from_seat, tile_from = self.state.last_discard
-            advice = advise_on_opponent_discard(self.state, seat) or {}
+            version = self.version
+            async with self.unlocked():
+                advice = await advisor_pool.advise("opponent_discard", self.state, seat)
+            if self.version != version or not self.state or self.state.ended:
+                return
             action = advice.get("action") or "pass"
             tile = advice.get("tile") if advice.get("tile") is not None else tile_from
 
             if action == "hu":
                 self.state = replace(self.state, ended=True)
+                self.record(replay.OP_HU, seat)
                 score_summary = compute_score_summary(self.state, seat, "ron")
                 await self.broadcast({
                     "type": "game_end",
@@ -564,6 +838,7 @@ class Room:
                 except Exception:
                     action = "pass"
                 else:
+                    self.record(replay.OP_PENG, seat, tile)
                     await self.broadcast({"type": "event", "ev": {"type": "peng", "seat": seat, "tile": tile}})
                     await self.sync_all()
                     await self.step_auto(lock_held=True)
@@ -575,6 +850,7 @@ class Room:
                 except Exception:
                     action = "pass"
                 else:
+                    self.record(replay.OP_KONG_EXPOSED, seat, tile)
                     await self.broadcast({"type": "event", "ev": {"type": "kong", "style": "exposed", "seat": seat, "tile": tile}})
                     await self.sync_all()
                     await self.step_auto(lock_held=True)
@@ -582,358 +858,23 @@ class Room:
 
             # pass 或无法执行其他动作
             self.state = replace(self.state, last_discard=None)
-            await self.broadcast({"type": "event", "ev": {"type": "pass", "seat": seat}})
+            self.record(replay.OP_PASS, seat)
+            await self.broadcast(encode_pass(seat))
             await self.sync_all()
             await self.step_auto(lock_held=True)
 
         if lock_held:
             await inner()
         else:
-            async with self.lock:
+            async with self.locked():
                 await inner()
 
-rooms: Dict[str, Room] = {}
+rooms: RoomRegistry[Room] = RoomRegistry.from_env(Room, on_evict=room_persister.forget)
 
 async def attach(ws: WebSocket) -> Session:
     await ws.accept()
     return Session(ws)
 
-@app.websocket("/ws/auth")
-async def auth_ws_endpoint(ws: WebSocket):
-    """需要认证的WebSocket端点"""
-    sess = await attach(ws)
-    try:
-        while True:
-            raw = await ws.receive_text()
-            msg = json.loads(raw)
-            t = msg.get("type")
-
-            if t == "authenticate":
-                # 用户认证
-                username = msg.get("username")
-                password = msg.get("password")
-                token = msg.get("token")  # token 认证更安全，优先使用
-
-                if token:
-                    session_info = authenticated_sessions.get(token)
-                    if not session_info:
-                        await sess.send({
-                            "type": "error",
-                            "detail": "登录状态已过期，请重新登录"
-                        })
-                        continue
-
-                    user = await db.get_user_by_username(session_info.get("username", ""))
-                    if not user:
-                        await sess.send({
-                            "type": "error",
-                            "detail": "用户信息不存在，请重新登录"
-                        })
-                        continue
-
-                    session_info["user_id"] = user["id"]
-                    authenticated_sessions[token] = session_info
-
-                    sess.user_id = user["id"]
-                    sess.username = user["username"]
-                    sess.vip_level = int(user.get("vip_level", 0))
-                    await sess.send({
-                        "type": "authentication_success",
-                        "user": user
-                    })
-                    continue
-
-                if username and password:
-                    user = await db.authenticate_user(username, password)
-                    if user:
-                        sess.user_id = user["id"]
-                        sess.username = user["username"]
-                        sess.vip_level = int(user.get("vip_level", 0))
-                        await sess.send({
-                            "type": "authentication_success",
-                            "user": user
-                        })
-                        continue
-                    else:
-                        await sess.send({
-                            "type": "error",
-                            "detail": "用户名或密码错误"
-                        })
-                        continue
-                else:
-                    await sess.send({
-                        "type": "error",
-                        "detail": "缺少认证信息"
-                    })
-                    continue
-
-            elif t == "join_room":
-                # 检查用户是否已认证
-                if not sess.user_id or not sess.username:
-                    await sess.send({"type":"error","detail":"请先登录"})
-                    continue
-
-                # 使用原始的join_room逻辑
-                rid = msg.get("room_id","default")
-                room = rooms.setdefault(rid, Room(rid))
-
-                # 检查是否允许加入
-                # 1. 检查是否房间已满且没有掉线的同名额玩家
-                if len(room.sess) == 2:
-                    # 检查是否有掉线的同名额玩家
-                    seat_to_replace = None
-                    for seat, existing_username in room.player_names.items():
-                        if existing_username == sess.username and seat not in room.sess:
-                            seat_to_replace = seat
-                            break
-
-                    if seat_to_replace is not None:
-                        # 找到掉线的同名额玩家，允许重连
-                        seat = seat_to_replace
-
-                    else:
-                        await sess.send({"type":"error","detail":"房间已满且没有找到匹配的离线玩家"})
-                        continue
-                else:
-                    # 分配新座位
-                    if 0 not in room.sess:
-                        seat = 0
-                    elif 1 not in room.sess:
-                        seat = 1
-                    else:
-                        await sess.send({"type":"error","detail":"房间已满"})
-                        continue
-
-                # 检查重名限制：不允许同一个房间有两个相同名字的玩家
-                for existing_seat, existing_username in room.player_names.items():
-                    if existing_username == sess.username and existing_seat != seat:
-                        if existing_seat in room.sess:
-                            # 如果同名玩家已经在线，不允许新玩家加入并提示昵称已被使用
-                            await sess.send({"type":"error","detail":"用户名已被此房间其他玩家使用"})
-                            continue
-                        else:
-                            # 如果同名玩家离线，不允许新玩家加入
-                            await sess.send({"type":"error","detail":"用户名已被此房间其他玩家占用"})
-                            continue
-
-                # 加入房间
-                if room.is_ai_seat(seat):
-                    room.disable_ai_practice()
-                room.sess[seat] = sess
-                room.player_names[seat] = sess.username
-                sess.room, sess.seat = room, seat
-                room.ready[seat] = False
-                await sess.send({"type":"room_joined","room_id":rid,"seat":seat})
-                room._ensure_ai_ready()
-                await room.broadcast({"type":"ready_status","ready":dict(room.ready)})
-                await room._broadcast_room_status()
-
-                # 通知房间有玩家重新加入
-                await room.broadcast({"type":"player_reconnected","seat":seat,"username":sess.username})
-
-                # 如果房间有游戏状态，同步给重新加入的玩家
-                if room.state:
-                    await room.sync_player(seat)
-                    # 如果游戏进行中且轮到该玩家，重新发送可执行操作
-                    if room.state and not room.state.ended and room.state.turn == seat:
-                        choices = legal_choices(room.state, seat)
-                        await sess.send({"type":"choices","actions":choices})
-                    # 如果是对家响应阶段，检查是否需要发送操作
-                    elif room.state and not room.state.ended and room.state.last_discard is not None:
-                        # 检查是否是对家的回合（可以响应）
-                        if room.state.turn == seat:
-                            choices = legal_choices(room.state, seat)
-                            if choices:
-                                await sess.send({"type":"choices","actions":choices})
-
-            elif t == "ready":
-                if not sess.room or sess.seat is None: continue
-                sess.room.ready[sess.seat] = True
-                sess.room._ensure_ai_ready()
-                await sess.room.broadcast({"type":"ready_status","ready":dict(sess.room.ready)})
-                await sess.room.try_start()
-
-            elif t == "practice_ai":
-                if not sess.room:
-                    continue
-                await sess.room.enable_ai_practice(sess)
-
-            elif t == "request_hint":
-                await handle_ai_hint_request(sess)
-
-            elif t == "end_game":
-                await handle_end_game_request(sess)
-
-            elif t == "act":
-                if not sess.room or sess.seat is None: continue
-                action = msg.get("action",{})
-                room = sess.room
-                async with room.lock:
-                    st = room.state
-                    if st is None: continue
-
-                    # 自己回合的行动
-                    if st.turn == sess.seat and st.last_discard is None:
-                        if action.get("type") == "discard":
-                            tile = int(action["tile"])
-                            room.state = discard(st, sess.seat, tile)
-                            await room.broadcast({"type":"event","ev":{"type":"discard","seat":sess.seat,"tile":tile}})
-                            await room.sync_all()
-                            await sess.send({"type":"choices","actions":[]})
-                            # 出牌后让对家选择响应
-                            await room.step_after_discard(lock_held=True)
-
-                        elif action.get("type") == "kong":
-                            style = action.get("style")
-                            tile = int(action["tile"])
-                            if style == "concealed":
-                                room.state = kong_concealed(st, sess.seat, tile)
-                            elif style == "added":
-                                try:
-                                    result = prepare_added_kong(st, sess.seat, tile)
-                                except ValueError as exc:
-                                    detail = {
-                                        "ILLEGAL_KONG_ADDED": "tile not in hand",
-                                        "NO_PONG_TO_UPGRADE": "no pong to upgrade",
-                                    }.get(str(exc), "bad kong request")
-                                    await sess.send({"type": "error", "detail": detail})
-                                    continue
-                                room.state = result.state
-                                if result.rob_pending:
-                                    await room.sync_all()
-                                    await room.step_auto(lock_held=True)
-                                    continue
-                                style = "added"
-                            else:
-                                await sess.send({"type":"error","detail":"bad kong style"}); continue
-                            ev_payload = {"type":"kong","style":style,"seat":sess.seat}
-                            if style != "concealed":
-                                ev_payload["tile"] = tile
-                            await room.broadcast({"type":"event","ev":ev_payload})
-                            # 杠后继续摸牌
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-
-                        elif action.get("type") == "hu" and action.get("style")=="self":
-                            # 自摸胡
-                            if can_hu_four_plus_one(st.players[sess.seat].hand, st.players[sess.seat].melds):
-                                is_kong_draw = (
-                                    st.last_draw_info is not None
-                                    and st.last_draw_info[0] == sess.seat
-                                    and st.last_draw_info[1] == "kong"
-                                )
-                                reason = "zimo_kong" if is_kong_draw else "zimo"
-                                room.state = replace(st, ended=True)
-                                score_summary = compute_score_summary(room.state, sess.seat, reason)
-                                await room.broadcast({
-                                    "type": "game_end",
-                                    "result": {"winner": sess.seat, "reason": reason, "score": score_summary},
-                                    "final_view": room._final_view_payload(),
-                                })
-                                # 更新积分和记录
-                                await update_game_scores(room, sess.seat, reason, score_summary)
-                            else:
-                                await sess.send({"type":"error","detail":"not hu"})
-                        elif action.get("type") == "draw":
-                            room.state, tile = draw(st, sess.seat)
-                            await room.broadcast({"type":"event","ev":{"type":"draw","seat":sess.seat,"tile":tile}})
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        else:
-                            await sess.send({"type":"error","detail":"illegal or unsupported action in turn"})
-
-                    # 对家响应阶段（有人刚出牌或存在抢杠）
-                    else:
-                        if st.pending_rob_kong is not None:
-                            kong_owner, pending_tile = st.pending_rob_kong
-                            robber = 1 - kong_owner
-                            if sess.seat != robber:
-                                await sess.send({"type": "error", "detail": "not your rob opportunity"})
-                                continue
-                            style = action.get("type")
-                            if style == "hu" and action.get("style") == "rob":
-                                merged = tuple(sorted(st.players[sess.seat].hand + (pending_tile,)))
-                                if can_hu_four_plus_one(merged, st.players[sess.seat].melds):
-                                    await room._resolve_rob_kong_hu(sess.seat, pending_tile, lock_held=True)
-                                else:
-                                    await sess.send({"type": "error", "detail": "not hu"})
-                            elif style == "pass":
-                                await room._resolve_rob_kong_pass(sess.seat, lock_held=True)
-                            else:
-                                await sess.send({"type": "error", "detail": "unsupported rob_kong action"})
-                            continue
-
-                        if st.last_discard is None:
-                            await sess.send({"type":"error","detail":"no claimable discard"}); continue
-                        from_seat, tile = st.last_discard
-                        if from_seat == sess.seat:
-                            await sess.send({"type":"error","detail":"cannot claim own discard"}); continue
-
-                        style = action.get("type")
-                        if style == "pass":
-                            # 放弃权利，轮到出牌方的对家（st.turn 已是对家），自动进入其抽牌流程
-                            room.state = replace(st, last_discard=None)
-                            await room.broadcast({"type":"event","ev":{"type":"pass","seat":sess.seat}})
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        elif style == "peng":
-                            if not can_peng(st.players[sess.seat].hand, tile):
-                                await sess.send({"type":"error","detail":"cannot peng"}); continue
-                            room.state = claim_peng(st, sess.seat, from_seat, tile)
-                            await room.broadcast({"type":"event","ev":{"type":"peng","seat":sess.seat,"tile":tile}})
-                            # 碰后必须打出一张
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        elif style == "kong" and action.get("style")=="exposed":
-                            if not can_kong_exposed(st.players[sess.seat].hand, tile):
-                                await sess.send({"type":"error","detail":"cannot exposed kong"}); continue
-                            room.state = claim_kong_exposed(st, sess.seat, from_seat, tile)
-                            await room.broadcast({"type":"event","ev":{"type":"kong","style":"exposed","seat":sess.seat,"tile":tile}})
-                            # 杠后继续摸牌
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        elif style == "hu" and action.get("style")=="ron":
-                            merged = tuple(sorted(st.players[sess.seat].hand + (tile,)))
-                            if can_hu_four_plus_one(merged, st.players[sess.seat].melds):
-                                room.state = replace(st, ended=True)
-                                score_summary = compute_score_summary(room.state, sess.seat, "ron")
-                                await room.broadcast({
-                                    "type": "game_end",
-                                    "result": {"winner": sess.seat, "reason": "ron", "tile": tile, "score": score_summary},
-                                    "final_view": room._final_view_payload({sess.seat: tile}),
-                                })
-                                # 更新积分和记录
-                                await update_game_scores(room, sess.seat, "ron", score_summary)
-                            else:
-                                await sess.send({"type":"error","detail":"not hu"})
-                        else:
-                            await sess.send({"type":"error","detail":"unsupported claim action"})
-
-            else:
-                await sess.send({"type":"error","detail":"unknown message type"})
-
-    except WebSocketDisconnect:
-        # 处理断线：保留玩家名称记录，允许重新加入
-        r = sess.room
-        seat = sess.seat
-        if r and seat in r.sess:
-            del r.sess[seat]
-            if seat in r.ready:
-                r.ready[seat] = False
-            # 保留 player_names 记录，允许重新加入
-            # 只有当两个玩家都断线时才重置游戏
-            if len(r.sess) == 0:
-                r.disable_ai_practice()
-                r.state = None
-                r.ready = {0: False, 1: False}
-                # 清理玩家名称记录
-                r.player_names.clear()
-            # 通知房间玩家状态变化（包含在线/离线状态）
-            await r._broadcast_room_status()
-            await r.broadcast({"type":"ready_status","ready":dict(r.ready)})
-            # 通知有玩家掉线
-            await r.broadcast({"type":"player_disconnected","seat":seat,"username":sess.username})
-
 async def update_game_scores(room: Room, winner_seat: int, reason: str, score_summary: dict):
     """更新游戏积分和记录"""
     try:
@@ -943,6 +884,8 @@ async def update_game_scores(room: Room, winner_seat: int, reason: str, score_su
 
         if not winner_session or not loser_session:
             return
+        if winner_session.user_id is None or loser_session.user_id is None:
+            return
 
         # 计算积分变化（基于番数）
         winner_fan = score_summary.get("players", {}).get(str(winner_seat), {}).get("fan_total", 0)
@@ -950,35 +893,22 @@ async def update_game_scores(room: Room, winner_seat: int, reason: str, score_su
         # 积分变化规则：胜者获得 base * 2^fan，败者扣除同等积分
         score_change = fan_to_points(winner_fan)
 
-        # 更新胜者积分
-        await db.update_user_score(winner_session.user_id, score_change)
-
-        # 更新败者积分
-        await db.update_user_score(loser_session.user_id, -score_change)
-
-        # 获取当前积分
-        winner_info = await db.get_user_by_username(winner_session.username)
-        loser_info = await db.get_user_by_username(loser_session.username)
-
-        if winner_info and loser_info:
-            # 添加对局记录
-            await db.add_game_record(
-                winner_session.user_id,
-                loser_session.username,
-                winner_seat == 0,  # 先手
-                score_change,
-                "win",
-                winner_info["score"]
-            )
-
-            await db.add_game_record(
-                loser_session.user_id,
-                winner_session.username,
-                loser_seat == 0,  # 先手
-                -score_change,
-                "lose",
-                loser_info["score"]
-            )
+        # 入队由后台批量写入（双方积分、对局记录与对局详情同一事务），不阻塞后续消息
+        result_writer.submit(GameResult(
+            winner_id=winner_session.user_id,
+            loser_id=loser_session.user_id,
+            winner_username=winner_session.username,
+            loser_username=loser_session.username,
+            winner_first=winner_seat == 0,  # 先手
+            score_change=score_change,
+            reason=reason,
+            fan_total=winner_fan,
+            fan_breakdown=score_summary.get("players", {}).get(str(winner_seat), {}).get("fan_breakdown", []),
+            room_id=room.id,
+            seed=room.state.seed if room.state else None,
+            started_at=room.started_at,
+            ended_at=time.time(),
+        ))
 
     except Exception as e:
         print(f"更新积分错误: {e}")
@@ -995,10 +925,7 @@ async def handle_ai_hint_request(sess: Session):
         return
 
     room = sess.room
-    hint_payload: Optional[dict] = None
-    phase: Optional[str] = None
-
-    async with room.lock:
+    async with room.locked():
         state = room.state
         if state is None or getattr(state, "ended", False):
             await sess.send({"type": "ai_hint", "error": "当前没有进行中的对局"})
@@ -1008,29 +935,52 @@ async def handle_ai_hint_request(sess: Session):
             await sess.send({"type": "ai_hint", "error": "当前不是你的操作回合"})
             return
 
-        try:
-            if state.last_discard is None:
-                hand_len = len(state.players[sess.seat].hand)
-                if hand_len % 3 != 2:
-                    raise ValueError("hand not ready for advice")
-                hint_payload = advise_on_draw(state, sess.seat) or {}
-                phase = "self_turn"
-            else:
-                hint_payload = advise_on_opponent_discard(state, sess.seat) or {}
-                phase = "opponent_discard"
-        except AssertionError:
-            await sess.send({"type": "ai_hint", "error": "当前状态无法生成AI提示"})
-            return
-        except Exception as e:
-            print(f"AI hint error: {e}")
-            await sess.send({"type": "ai_hint", "error": "AI提示计算失败，请稍后重试"})
-            return
-
-    if not hint_payload:
-        await sess.send({"type": "ai_hint", "error": "AI暂时没有可用提示"})
-        return
-
-    await sess.send({"type": "ai_hint", "hint": hint_payload, "phase": phase})
+        if state.last_discard is None:
+            if len(state.players[sess.seat].hand) % 3 != 2:
+                await sess.send({"type": "ai_hint", "error": "当前状态无法生成AI提示"})
+                return
+            kind, phase = "draw", "self_turn"
+        else:
+            kind, phase = "opponent_discard", "opponent_discard"
+        version = room.version
+
+    # 在锁外计算：快照已取，玩家可继续操作；局面一变，room.state 的 setter 会取消计算任务。
+    # 同一局面的重复请求合并到同一次计算
+    pending = room.pending_hint(sess.seat, version)
+    if pending is not None:
+        phase, compute = pending
+        metrics.hint_coalesced.inc(phase)
+    else:
+        compute = asyncio.ensure_future(advisor_pool.hint(kind, state, sess.seat))
+        room.track_hint(sess.seat, version, phase, compute)
+    job = asyncio.create_task(_deliver_hint(sess, room, version, phase, compute))
+    _hint_jobs.add(job)
+    job.add_done_callback(_hint_jobs.discard)
+
+
+_hint_jobs: Set[asyncio.Task] = set()
+
+
+async def _deliver_hint(sess: Session, room: Room, version: int, phase: str, compute: asyncio.Future):
+    # asyncio.wait 不会因 compute 被取消而抛出，保证客户端总能收到一条 ai_hint
+    await asyncio.wait({compute})
+    if compute.cancelled() or room.version != version:
+        msg = {"type": "ai_hint", "error": "局面已变化，提示已取消"}
+    elif isinstance(compute.exception(), AdvisorBusy):
+        msg = {"type": "ai_hint", "error": "AI提示繁忙，请稍后重试"}
+    elif isinstance(compute.exception(), AssertionError):
+        msg = {"type": "ai_hint", "error": "当前状态无法生成AI提示"}
+    elif compute.exception() is not None:
+        print(f"AI hint error: {compute.exception()}")
+        msg = {"type": "ai_hint", "error": "AI提示计算失败，请稍后重试"}
+    elif not compute.result():
+        msg = {"type": "ai_hint", "error": "AI暂时没有可用提示"}
+    else:
+        msg = {"type": "ai_hint", "hint": compute.result(), "phase": phase}
+    try:
+        await sess.send(msg)
+    except Exception:
+        pass
 
 
 async def handle_end_game_request(sess: Session):
@@ -1041,12 +991,13 @@ async def handle_end_game_request(sess: Session):
     room = sess.room
     final_view: Optional[dict] = None
 
-    async with room.lock:
+    async with room.locked():
         state = room.state
         if state is None or getattr(state, "ended", False):
             return
 
         room.state = replace(state, ended=True)
+        room.record(replay.OP_END, sess.seat)
         final_view = room._final_view_payload()
         room.ready = {0: False, 1: False}
 
@@ -1058,275 +1009,444 @@ async def handle_end_game_request(sess: Session):
     await room.broadcast(payload)
     await room.broadcast({"type": "ready_status", "ready": dict(room.ready)})
 
-@app.websocket("/ws")
-async def ws_endpoint(ws: WebSocket):
-    sess = await attach(ws)
+# ---------- websocket 消息处理（/ws 与 /ws/auth 共用，见 mahjong_duo/dispatch.py） ----------
+
+dispatcher = Dispatcher()
+dispatcher.add_hook(timing_hook)
+dispatcher.add_hook(rate_limit_hook)
+
+
+async def activity_hook(sess: Session, msg, call_next):
+    # 记录房间的最后活动时间（空闲回收据此判断），并持久化本次消息引起的变化
+    await call_next()
+    if sess.room is not None:
+        rooms.touch(sess.room.id)
+        sess.room.persist()
+
+
+dispatcher.add_hook(activity_hook)
+
+
+@dispatcher.route("authenticate", parse_authenticate)
+async def on_authenticate(sess: Session, msg: Authenticate):
+    # token 认证更安全，优先使用
+    if msg.token:
+        session_info = await token_store.get(msg.token)
+        if not session_info:
+            await sess.send({"type": "error", "detail": "登录状态已过期，请重新登录"})
+            return
+
+        user = await db.get_user_by_username(session_info.get("username", ""))
+        if not user:
+            await sess.send({"type": "error", "detail": "用户信息不存在，请重新登录"})
+            return
+    elif msg.username and msg.password:
+        user = await db.authenticate_user(msg.username, msg.password)
+        if not user:
+            await sess.send({"type": "error", "detail": "用户名或密码错误"})
+            return
+    else:
+        await sess.send({"type": "error", "detail": "缺少认证信息"})
+        return
+
+    user = result_writer.overlay(user)
+    sess.user_id = user["id"]
+    sess.username = user["username"]
+    sess.vip_level = int(user.get("vip_level", 0))
+    await sess.send({"type": "authentication_success", "user": user})
+
+
+# 两个端点原有的“房间已满”提示不同（/ws 为英文），客户端可能按原文匹配，保持不变
+ROOM_FULL_DETAILS = ("房间已满且没有找到匹配的离线玩家", "房间已满")
+LEGACY_ROOM_FULL_DETAILS = ("Room full and no matching offline player found", "Room full")
+
+
+@dispatcher.route("join_room", parse_join_room)
+async def on_join_room(sess: Session, msg: JoinRoom):
+    await join_room(sess, msg, ROOM_FULL_DETAILS)
+
+
+async def join_room(sess: Session, msg: JoinRoom, full_details: Tuple[str, str]):
+    # 检查用户是否已认证
+    if not sess.user_id or not sess.username:
+        await sess.send({"type":"error","detail":"请先登录"})
+        return
+
+    rid = msg.room_id
+    # 分片模式下房间归其他进程负责时，让客户端改连
+    if not shards.owns(rid):
+        await sess.send(shards.redirect(rid))
+        return
+    # 房间不在内存中（进程重启、空闲回收或从其他分片迁来）时，先尝试从存储恢复
+    snap = await room_persister.load(rid) if rid not in rooms else None
+    recorder = None
+    if snap is not None and snap.state is not None:
+        recorder = await replay_logs.resume(rid, snap.state.seed)
+    restored = snap is not None and rid not in rooms
+    try:
+        room = rooms.get_or_create(rid)
+    except RoomError as e:
+        await sess.send({"type":"error","detail":str(e)})
+        return
+    if restored:
+        room.restore(snap, recorder)
+    elif recorder is not None:
+        recorder.close()
+
+    # 检查是否允许加入
+    # 1. 检查是否房间已满且没有掉线的同名额玩家
+    if len(room.sess) == 2:
+        # 检查是否有掉线的同名额玩家
+        seat_to_replace = None
+        for seat, existing_username in room.player_names.items():
+            if existing_username == sess.username and seat not in room.sess:
+                seat_to_replace = seat
+                break
+
+        if seat_to_replace is not None:
+            # 找到掉线的同名额玩家，允许重连
+            seat = seat_to_replace
+        else:
+            await sess.send({"type":"error","detail":full_details[0]})
+            return
+    else:
+        # 分配新座位；优先回到自己原来的座位（如恢复的房间中双方都离线）
+        own_seat = next((s for s, name in room.player_names.items()
+                         if name == sess.username and s not in room.sess and not room.is_ai_seat(s)), None)
+        if own_seat is not None:
+            seat = own_seat
+        elif 0 not in room.sess:
+            seat = 0
+        elif 1 not in room.sess:
+            seat = 1
+        else:
+            await sess.send({"type":"error","detail":full_details[1]})
+            return
+
+    # 检查重名限制：不允许同一个房间有两个相同名字的玩家
+    for existing_seat, existing_username in room.player_names.items():
+        if existing_username == sess.username and existing_seat != seat:
+            if existing_seat in room.sess:
+                # 如果同名玩家已经在线，不允许新玩家加入并提示昵称已被使用
+                await sess.send({"type":"error","detail":"用户名已被此房间其他玩家使用"})
+            else:
+                # 如果同名玩家离线，不允许新玩家加入
+                await sess.send({"type":"error","detail":"用户名已被此房间其他玩家占用"})
+            return
+
+    # 加入房间
+    if room.is_ai_seat(seat):
+        room.disable_ai_practice()
+    room.sess[seat] = sess
+    room.player_names[seat] = sess.username
+    sess.room, sess.seat = room, seat
+    room.ready[seat] = False
+    await sess.send({"type":"room_joined","room_id":rid,"seat":seat})
+    room._ensure_ai_ready()
+    await room.broadcast({"type":"ready_status","ready":dict(room.ready)})
+    await room._broadcast_room_status()
+
+    # 通知房间有玩家重新加入
+    await room.broadcast({"type":"player_reconnected","seat":seat,"username":sess.username})
+
+    if restored:
+        await room.resume()
+
+    # 如果房间有游戏状态，同步给重新加入的玩家
+    if room.state:
+        sess.sync.reset()
+        await room.sync_player(seat, full=True)
+        # 对局进行中且轮到该玩家（自己回合或响应对家出牌），重新发送可执行操作
+        if not room.state.ended and room.state.turn == seat:
+            choices = legal_choices(room.state, seat)
+            if choices:
+                await sess.send({"type":"choices","actions":choices})
+
+
+@dispatcher.route("ready")
+async def on_ready(sess: Session, msg: Empty):
+    if not sess.room or sess.seat is None:
+        return
+    sess.room.ready[sess.seat] = True
+    sess.room._ensure_ai_ready()
+    await sess.room.broadcast({"type":"ready_status","ready":dict(sess.room.ready)})
+    await sess.room.try_start()
+
+
+@dispatcher.route("practice_ai")
+async def on_practice_ai(sess: Session, msg: Empty):
+    if not sess.room:
+        return
+    await sess.room.enable_ai_practice(sess)
+
+
+@dispatcher.route("request_hint")
+async def on_request_hint(sess: Session, msg: Empty):
+    await handle_ai_hint_request(sess)
+
+
+@dispatcher.route("end_game")
+async def on_end_game(sess: Session, msg: Empty):
+    await handle_end_game_request(sess)
+
+
+@dispatcher.route("sync_mode", parse_sync_mode)
+async def on_sync_mode(sess: Session, msg: SyncMode):
+    # 可选的增量同步协议，见 mahjong_duo/sync.py
+    sess.sync.enabled = msg.mode == "delta"
+    sess.sync.reset()
+    if sess.room and sess.seat is not None:
+        await sess.room.sync_player(sess.seat, full=True)
+
+
+@dispatcher.route("sync_ack", parse_sync_ack)
+async def on_sync_ack(sess: Session, msg: SyncAck):
+    sess.sync.ack(msg.seq)
+
+
+@dispatcher.route("wire", parse_wire)
+async def on_wire(sess: Session, msg: Wire):
+    # 可选的二进制线协议，见 mahjong_duo/wire.py
+    sess.binary = msg.format == "binary"
+    await sess.send({"type": "wire", "format": "binary" if sess.binary else "json", "version": WIRE_VERSION})
+
+
+@dispatcher.route("act", parse_act)
+async def on_act(sess: Session, msg: Act):
+    if not sess.room or sess.seat is None:
+        return
+    room = sess.room
+    async with room.locked():
+        st = room.state
+        if st is None or st.ended:
+            return
+        # 统一按 legal_choices 校验：自己回合、对家出牌后的响应、抢杠都在其中
+        choice = match_choice(msg.action, legal_choices(st, sess.seat))
+        if choice is None:
+            await sess.send({"type":"error","detail":"illegal action"})
+            return
+        await ACT_HANDLERS[(choice["type"], choice.get("style"))](room, sess.seat, st, choice)
+
+
+async def _act_discard(room: Room, seat: int, st: GameState, choice: dict):
+    tile = choice["tile"]
+    room.state = discard(st, seat, tile)
+    room.record(replay.OP_DISCARD, seat, tile)
+    await room.broadcast(encode_discard(seat, tile))
+    await room.sync_all()
+    sess = room.sess.get(seat)
+    if sess:
+        await sess.send({"type":"choices","actions":[]})
+    # 出牌后让对家选择响应
+    await room.step_after_discard(lock_held=True)
+
+
+async def _act_draw(room: Room, seat: int, st: GameState, choice: dict):
+    room.state, tile = draw(st, seat)
+    room.record(replay.OP_DRAW, seat)
+    await room.broadcast(encode_draw(seat, tile))
+    await room.sync_all()
+    await room.step_auto(lock_held=True)
+
+
+async def _act_kong_concealed(room: Room, seat: int, st: GameState, choice: dict):
+    try:
+        room.state = kong_concealed(st, seat, choice["tile"])
+    except ValueError:
+        sess = room.sess.get(seat)
+        if sess:
+            await sess.send({"type": "error", "detail": "bad kong request"})
+        return
+    room.record(replay.OP_KONG_CONCEALED, seat, choice["tile"])
+    await room.broadcast({"type":"event","ev":{"type":"kong","style":"concealed","seat":seat}})
+    # 杠后继续摸牌
+    await room.sync_all()
+    await room.step_auto(lock_held=True)
+
+
+async def _act_kong_added(room: Room, seat: int, st: GameState, choice: dict):
+    tile = choice["tile"]
+    try:
+        result = prepare_added_kong(st, seat, tile)
+    except ValueError as exc:
+        detail = {
+            "ILLEGAL_KONG_ADDED": "tile not in hand",
+            "NO_PONG_TO_UPGRADE": "no pong to upgrade",
+        }.get(str(exc), "bad kong request")
+        sess = room.sess.get(seat)
+        if sess:
+            await sess.send({"type": "error", "detail": detail})
+        return
+    room.state = result.state
+    room.record(replay.OP_KONG_ADDED, seat, tile)
+    if not result.rob_pending:
+        await room.broadcast({"type":"event","ev":{"type":"kong","style":"added","seat":seat,"tile":tile}})
+    # 杠后继续摸牌；有抢杠机会时先交给对家决定
+    await room.sync_all()
+    await room.step_auto(lock_held=True)
+
+
+async def _act_hu_self(room: Room, seat: int, st: GameState, choice: dict):
+    # 自摸胡
+    is_kong_draw = (
+        st.last_draw_info is not None
+        and st.last_draw_info[0] == seat
+        and st.last_draw_info[1] == "kong"
+    )
+    reason = "zimo_kong" if is_kong_draw else "zimo"
+    room.state = replace(st, ended=True)
+    room.record(replay.OP_HU, seat)
+    score_summary = compute_score_summary(room.state, seat, reason)
+    await room.broadcast({
+        "type": "game_end",
+        "result": {"winner": seat, "reason": reason, "score": score_summary},
+        "final_view": room._final_view_payload(),
+    })
+    # 更新积分和记录
+    await update_game_scores(room, seat, reason, score_summary)
+
+
+async def _act_hu_rob(room: Room, seat: int, st: GameState, choice: dict):
+    await room._resolve_rob_kong_hu(seat, choice["tile"], lock_held=True)
+
+
+async def _act_pass(room: Room, seat: int, st: GameState, choice: dict):
+    if st.pending_rob_kong is not None:
+        await room._resolve_rob_kong_pass(seat, lock_held=True)
+        return
+    # 放弃权利，轮到出牌方的对家（st.turn 已是对家），自动进入其抽牌流程
+    room.state = replace(st, last_discard=None)
+    room.record(replay.OP_PASS, seat)
+    await room.broadcast(encode_pass(seat))
+    await room.sync_all()
+    await room.step_auto(lock_held=True)
+
+
+async def _act_peng(room: Room, seat: int, st: GameState, choice: dict):
+    from_seat, tile = st.last_discard
+    room.state = claim_peng(st, seat, from_seat, tile)
+    room.record(replay.OP_PENG, seat, tile)
+    await room.broadcast({"type":"event","ev":{"type":"peng","seat":seat,"tile":tile}})
+    # 碰后必须打出一张
+    await room.sync_all()
+    await room.step_auto(lock_held=True)
+
+
+async def _act_kong_exposed(room: Room, seat: int, st: GameState, choice: dict):
+    from_seat, tile = st.last_discard
+    room.state = claim_kong_exposed(st, seat, from_seat, tile)
+    room.record(replay.OP_KONG_EXPOSED, seat, tile)
+    await room.broadcast({"type":"event","ev":{"type":"kong","style":"exposed","seat":seat,"tile":tile}})
+    # 杠后继续摸牌
+    await room.sync_all()
+    await room.step_auto(lock_held=True)
+
+
+async def _act_hu_ron(room: Room, seat: int, st: GameState, choice: dict):
+    tile = st.last_discard[1]
+    room.state = replace(st, ended=True)
+    room.record(replay.OP_HU, seat)
+    score_summary = compute_score_summary(room.state, seat, "ron")
+    await room.broadcast({
+        "type": "game_end",
+        "result": {"winner": seat, "reason": "ron", "tile": tile, "score": score_summary},
+        "final_view": room._final_view_payload({seat: tile}),
+    })
+    # 更新积分和记录
+    await update_game_scores(room, seat, "ron", score_summary)
+
+
+# 键为 legal_choices 中的 (type, style)
+ACT_HANDLERS = {
+    ("discard", None): _act_discard,
+    ("draw", None): _act_draw,
+    ("kong", "concealed"): _act_kong_concealed,
+    ("kong", "added"): _act_kong_added,
+    ("kong", "exposed"): _act_kong_exposed,
+    ("hu", "self"): _act_hu_self,
+    ("hu", "ron"): _act_hu_ron,
+    ("hu", "rob"): _act_hu_rob,
+    ("peng", None): _act_peng,
+    ("pass", None): _act_pass,
+}
+
+
+async def handle_disconnect(sess: Session):
+    # 处理断线：保留玩家名称记录，允许重新加入
+    r = sess.room
+    seat = sess.seat
+    if r and seat in r.sess:
+        del r.sess[seat]
+        if seat in r.ready:
+            r.ready[seat] = False
+        # 保留 player_names 记录，允许重新加入
+        # 只有当两个玩家都断线时才重置游戏
+        if len(r.sess) == 0:
+            r.disable_ai_practice()
+            r.state = None
+            r.ready = {0: False, 1: False}
+            # 清理玩家名称记录
+            r.player_names.clear()
+        # 通知房间玩家状态变化（包含在线/离线状态）
+        await r._broadcast_room_status()
+        await r.broadcast({"type":"ready_status","ready":dict(r.ready)})
+        # 通知有玩家掉线
+        await r.broadcast({"type":"player_disconnected","seat":seat,"username":sess.username})
+        rooms.touch(r.id)
+        # 服务重启（1012）导致的断开不落盘，保留快照以便重启后恢复对局
+        if sess.close_code != 1012:
+            r.persist()
+
+
+async def _read_inbound(sess: Session, queue: "asyncio.Queue[Optional[str]]"):
+    # 队列满时 put 阻塞、不再读取，积压由 websocket 协议层的流控传回客户端
+    ws = sess.ws
     try:
         while True:
             raw = await ws.receive_text()
-            msg = json.loads(raw)
-            t = msg.get("type")
-
-            if t == "join_room":
-                rid = msg.get("room_id","default")
-                # 检查用户是否已认证
-                if not sess.user_id or not sess.username:
-                    await sess.send({"type":"error","detail":"请先登录"})
-                    continue
-
-                room = rooms.setdefault(rid, Room(rid))
-                room = rooms.setdefault(rid, Room(rid))
-
-                # 检查是否允许加入
-                # 1. 检查是否房间已满且没有掉线的同名额玩家
-                if len(room.sess) == 2:
-                    # 检查是否有掉线的同名额玩家
-                    seat_to_replace = None
-                    for seat, existing_username in room.player_names.items():
-                        if existing_username == sess.username and seat not in room.sess:
-                            seat_to_replace = seat
-                            break
-
-                    if seat_to_replace is not None:
-                        # 找到掉线的同名额玩家，允许重连
-                        seat = seat_to_replace
+            if queue.full():
+                metrics.inbound_queue_full.inc(ws.url.path)
+            await queue.put(raw)
+    except WebSocketDisconnect as e:
+        sess.close_code = e.code
+    except RuntimeError:  # 连接已被服务器关闭（慢连接）
+        pass
+    await queue.put(None)  # 处理循环取到 None 即结束；被取消时处理循环已退出，无需通知
 
-                    else:
-                        await sess.send({"type":"error","detail":"Room full and no matching offline player found"})
-                        continue
-                else:
-                    # 分配新座位
-                    if 0 not in room.sess:
-                        seat = 0
-                    elif 1 not in room.sess:
-                        seat = 1
-                    else:
-                        await sess.send({"type":"error","detail":"Room full"})
-                        continue
-
-                # 检查重名限制：不允许同一个房间有两个相同名字的玩家
-                for existing_seat, existing_username in room.player_names.items():
-                    if existing_username == sess.username and existing_seat != seat:
-                        if existing_seat in room.sess:
-                            # 如果同名玩家已经在线，不允许新玩家加入并提示昵称已被使用
-                            await sess.send({"type":"error","detail":"用户名已被此房间其他玩家使用"})
-                            continue
-                        else:
-                            # 如果同名玩家离线，不允许新玩家加入
-                            await sess.send({"type":"error","detail":"用户名已被此房间其他玩家占用"})
-                            continue
-
-                # 加入房间
-                if room.is_ai_seat(seat):
-                    room.disable_ai_practice()
-                room.sess[seat] = sess
-                room.player_names[seat] = sess.username
-                sess.room, sess.seat = room, seat
-                room.ready[seat] = False
-                await sess.send({"type":"room_joined","room_id":rid,"seat":seat})
-                room._ensure_ai_ready()
-                await room.broadcast({"type":"ready_status","ready":dict(room.ready)})
-                await room._broadcast_room_status()
-
-                # 通知房间有玩家重新加入
-                await room.broadcast({"type":"player_reconnected","seat":seat,"username":sess.username})
-
-                # 如果房间有游戏状态，同步给重新加入的玩家
-                if room.state:
-                    await room.sync_player(seat)
-                    # 如果游戏进行中且轮到该玩家，重新发送可执行操作
-                    if room.state and not room.state.ended and room.state.turn == seat:
-                        choices = legal_choices(room.state, seat)
-                        await sess.send({"type":"choices","actions":choices})
-                    # 如果是对家响应阶段，检查是否需要发送操作
-                    elif room.state and not room.state.ended and room.state.last_discard is not None:
-                        # 检查是否是对家的回合（可以响应）
-                        if room.state.turn == seat:
-                            choices = legal_choices(room.state, seat)
-                            if choices:
-                                await sess.send({"type":"choices","actions":choices})
-
-            elif t == "ready":
-                if not sess.room or sess.seat is None: continue
-                sess.room.ready[sess.seat] = True
-                sess.room._ensure_ai_ready()
-                await sess.room.broadcast({"type":"ready_status","ready":dict(sess.room.ready)})
-                await sess.room.try_start()
-
-            elif t == "practice_ai":
-                if not sess.room:
-                    continue
-                await sess.room.enable_ai_practice(sess)
-
-            elif t == "end_game":
-                await handle_end_game_request(sess)
-
-            elif t == "act":
-                if not sess.room or sess.seat is None: continue
-                action = msg.get("action",{})
-                room = sess.room
-                async with room.lock:
-                    st = room.state
-                    if st is None: continue
-
-                    # 自己回合的行动
-                    if st.turn == sess.seat and st.last_discard is None:
-                        if action.get("type") == "discard":
-                            tile = int(action["tile"])
-                            room.state = discard(st, sess.seat, tile)
-                            await room.broadcast({"type":"event","ev":{"type":"discard","seat":sess.seat,"tile":tile}})
-                            await room.sync_all()
-                            await sess.send({"type":"choices","actions":[]})
-                            # 出牌后让对家选择响应
-                            await room.step_after_discard(lock_held=True)
-
-                        elif action.get("type") == "kong":
-                            style = action.get("style")
-                            tile = int(action["tile"])
-                            if style == "concealed":
-                                room.state = kong_concealed(st, sess.seat, tile)
-                            elif style == "added":
-                                try:
-                                    result = prepare_added_kong(st, sess.seat, tile)
-                                except ValueError as exc:
-                                    detail = {
-                                        "ILLEGAL_KONG_ADDED": "tile not in hand",
-                                        "NO_PONG_TO_UPGRADE": "no pong to upgrade",
-                                    }.get(str(exc), "bad kong request")
-                                    await sess.send({"type": "error", "detail": detail})
-                                    continue
-                                room.state = result.state
-                                if result.rob_pending:
-                                    await room.sync_all()
-                                    await room.step_auto(lock_held=True)
-                                    continue
-                                style = "added"
-                            else:
-                                await sess.send({"type":"error","detail":"bad kong style"}); continue
-                            ev_payload = {"type":"kong","style":style,"seat":sess.seat}
-                            if style != "concealed":
-                                ev_payload["tile"] = tile
-                            await room.broadcast({"type":"event","ev":ev_payload})
-                            # 杠后继续摸牌
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-
-                        elif action.get("type") == "hu" and action.get("style")=="self":
-                            # 自摸胡
-                            if can_hu_four_plus_one(st.players[sess.seat].hand, st.players[sess.seat].melds):
-                                is_kong_draw = (
-                                    st.last_draw_info is not None
-                                    and st.last_draw_info[0] == sess.seat
-                                    and st.last_draw_info[1] == "kong"
-                                )
-                                reason = "zimo_kong" if is_kong_draw else "zimo"
-                                room.state = replace(st, ended=True)
-                                score_summary = compute_score_summary(room.state, sess.seat, reason)
-                                await room.broadcast({
-                                    "type": "game_end",
-                                    "result": {"winner": sess.seat, "reason": reason, "score": score_summary},
-                                    "final_view": room._final_view_payload(),
-                                })
-                                await update_game_scores(room, sess.seat, reason, score_summary)
-                            else:
-                                await sess.send({"type":"error","detail":"not hu"})
-                        elif action.get("type") == "draw":
-                            room.state, tile = draw(st, sess.seat)
-                            await room.broadcast({"type":"event","ev":{"type":"draw","seat":sess.seat,"tile":tile}})
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        else:
-                            await sess.send({"type":"error","detail":"illegal or unsupported action in turn"})
 
-                    # 对家响应阶段（有人刚出牌或存在抢杠）
-                    else:
-                        if st.pending_rob_kong is not None:
-                            kong_owner, pending_tile = st.pending_rob_kong
-                            robber = 1 - kong_owner
-                            if sess.seat != robber:
-                                await sess.send({"type": "error", "detail": "not your rob opportunity"})
-                                continue
-                            style = action.get("type")
-                            if style == "hu" and action.get("style") == "rob":
-                                merged = tuple(sorted(st.players[sess.seat].hand + (pending_tile,)))
-                                if can_hu_four_plus_one(merged, st.players[sess.seat].melds):
-                                    await room._resolve_rob_kong_hu(sess.seat, pending_tile, lock_held=True)
-                                else:
-                                    await sess.send({"type": "error", "detail": "not hu"})
-                            elif style == "pass":
-                                await room._resolve_rob_kong_pass(sess.seat, lock_held=True)
-                            else:
-                                await sess.send({"type": "error", "detail": "unsupported rob_kong action"})
-                            continue
-
-                        if st.last_discard is None:
-                            await sess.send({"type":"error","detail":"no claimable discard"}); continue
-                        from_seat, tile = st.last_discard
-                        if from_seat == sess.seat:
-                            await sess.send({"type":"error","detail":"cannot claim own discard"}); continue
-
-                        style = action.get("type")
-                        if style == "pass":
-                            # 放弃权利，轮到出牌方的对家（st.turn 已是对家），自动进入其抽牌流程
-                            room.state = replace(st, last_discard=None)
-                            await room.broadcast({"type":"event","ev":{"type":"pass","seat":sess.seat}})
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        elif style == "peng":
-                            if not can_peng(st.players[sess.seat].hand, tile):
-                                await sess.send({"type":"error","detail":"cannot peng"}); continue
-                            room.state = claim_peng(st, sess.seat, from_seat, tile)
-                            await room.broadcast({"type":"event","ev":{"type":"peng","seat":sess.seat,"tile":tile}})
-                            # 碰后必须打出一张
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        elif style == "kong" and action.get("style")=="exposed":
-                            if not can_kong_exposed(st.players[sess.seat].hand, tile):
-                                await sess.send({"type":"error","detail":"cannot exposed kong"}); continue
-                            room.state = claim_kong_exposed(st, sess.seat, from_seat, tile)
-                            await room.broadcast({"type":"event","ev":{"type":"kong","style":"exposed","seat":sess.seat,"tile":tile}})
-                            # 杠后继续摸牌
-                            await room.sync_all()
-                            await room.step_auto(lock_held=True)
-                        elif style == "hu" and action.get("style")=="ron":
-                            merged = tuple(sorted(st.players[sess.seat].hand + (tile,)))
-                            if can_hu_four_plus_one(merged, st.players[sess.seat].melds):
-                                room.state = replace(st, ended=True)
-                                score_summary = compute_score_summary(room.state, sess.seat, "ron")
-                                await room.broadcast({
-                                    "type": "game_end",
-                                    "result": {"winner": sess.seat, "reason": "ron", "tile": tile, "score": score_summary},
-                                    "final_view": room._final_view_payload({sess.seat: tile}),
-                                })
-                            else:
-                                await sess.send({"type":"error","detail":"not hu"})
-                        else:
-                            await sess.send({"type":"error","detail":"unsupported claim action"})
+async def serve_session(ws: WebSocket, table: Dispatcher):
+    sess = await attach(ws)
+    queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=INBOUND_QUEUE)
+    reader = asyncio.create_task(_read_inbound(sess, queue))
+    try:
+        while True:
+            raw = await queue.get()
+            if raw is None:
+                break
+            await table.dispatch(sess, raw)
+    finally:
+        reader.cancel()
+        await handle_disconnect(sess)
 
-            else:
-                await sess.send({"type":"error","detail":"unknown message type"})
-
-    except WebSocketDisconnect:
-        # 处理断线：保留玩家名称记录，允许重新加入
-        r = sess.room
-        seat = sess.seat
-        if r and seat in r.sess:
-            del r.sess[seat]
-            if seat in r.ready:
-                r.ready[seat] = False
-            # 保留 player_names 记录，允许重新加入
-            # 只有当两个玩家都断线时才重置游戏
-            if len(r.sess) == 0:
-                r.disable_ai_practice()
-                r.state = None
-                r.ready = {0: False, 1: False}
-                # 清理玩家名称记录
-                r.player_names.clear()
-            # 通知房间玩家状态变化（包含在线/离线状态）
-            await r._broadcast_room_status()
-            await r.broadcast({"type":"ready_status","ready":dict(r.ready)})
-            # 通知有玩家掉线
-            await r.broadcast({"type":"player_disconnected","seat":seat,"username":sess.username})
+
+# 旧端点不支持认证与 AI 提示
+legacy_dispatcher = dispatcher.subset(exclude=("authenticate", "request_hint"))
+
+
+@legacy_dispatcher.route("join_room", parse_join_room)
+async def on_legacy_join_room(sess: Session, msg: JoinRoom):
+    await join_room(sess, msg, LEGACY_ROOM_FULL_DETAILS)
+
+
+@app.websocket("/ws/auth")
+async def auth_ws_endpoint(ws: WebSocket):
+    """需要认证的WebSocket端点"""
+    await serve_session(ws, dispatcher)
+
+
+@app.websocket("/ws")
+async def ws_endpoint(ws: WebSocket):
+    await serve_session(ws, legacy_dispatcher)
 
 
 @app.get("/", include_in_schema=False)
@@ -1,25 +1,164 @@
 # -*- coding: utf-8 -*-
+"""
+用户、积分与对局记录（SQLite，WAL 模式）。
+
+一个写连接加若干只读连接：写操作经 _write_lock 串行走写连接，
+排行榜、个人信息、统计等读操作分到负载最小的读连接上，不必排在结算写入后面。
+aiosqlite 每个连接一个后台线程，读连接数即可并行执行的读查询数。
+
+环境变量：
+    MAHJONG_DB_READERS  只读连接数（默认 2；0 表示读写共用一个连接）
+"""
 import asyncio
+import os
+from contextlib import asynccontextmanager
 import aiosqlite
+import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import AsyncIterator, Optional, List, Dict, Any, NamedTuple, Sequence
 import hashlib
 
+
+class GameResult(NamedTuple):
+    """一局已结束对局的结算信息，由 record_game_result(s) 一次性写入。"""
+    winner_id: int
+    loser_id: int
+    winner_username: str
+    loser_username: str
+    winner_first: bool          # 胜者是否先手（对局记录的 is_first_hand）
+    score_change: int           # 胜者得分，败者扣除同等积分
+    reason: str
+    fan_total: int
+    fan_breakdown: List[Dict[str, Any]]
+    room_id: Optional[str] = None
+    seed: Optional[int] = None
+    started_at: Optional[float] = None  # unix 时间戳
+    ended_at: Optional[float] = None
+
+
+# 结构迁移：按 PRAGMA user_version 依次执行尚未执行的步骤，每步一个事务。
+# 只能在末尾追加新步骤，已发布的步骤不要修改。
+SCHEMA_MIGRATIONS: List[Sequence[str]] = [
+    # 1: 按玩家查对局记录（个人记录按时间倒序、按胜负计数）
+    (
+        "CREATE INDEX IF NOT EXISTS idx_game_records_player_time ON game_records(player_id, game_time)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_player_result ON game_records(player_id, result)",
+    ),
+    # 2: 每个用户的累计统计，写对局记录时同一事务内增量更新；从已有记录回填
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0,
+            max_score_change INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO user_stats (user_id, total_games, wins, losses, draws, max_score_change)
+        SELECT player_id, COUNT(*), SUM(result = 'win'), SUM(result = 'lose'), SUM(result = 'draw'),
+               COALESCE(MAX(ABS(score_change)), 0)
+        FROM game_records GROUP BY player_id
+        ''',
+    ),
+]
+
+# 累加一局到 user_stats；用命名参数（sqlite3 不再支持 ?1 编号占位符配合序列参数）
+_UPSERT_USER_STATS = '''
+    INSERT INTO user_stats (user_id, total_games, wins, losses, draws, max_score_change)
+    VALUES (:user_id, 1, :win, :lose, :draw, :change)
+    ON CONFLICT(user_id) DO UPDATE SET
+        total_games = total_games + 1,
+        wins = wins + :win,
+        losses = losses + :lose,
+        draws = draws + :draw,
+        max_score_change = MAX(max_score_change, :change)
+'''
+
+
+def _stats_row(player_id: int, result: str, score_change: int) -> Dict[str, int]:
+    return {
+        "user_id": player_id,
+        "win": int(result == "win"),
+        "lose": int(result == "lose"),
+        "draw": int(result == "draw"),
+        "change": abs(score_change),
+    }
+
+
+def _leaderboard_rows(rows) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": row[0],
+            "username": row[1],
+            "score": row[2],
+            "created_at": row[3]
+        }
+        for row in rows
+        if row[1] != "C"
+    ]
+
+
 class Database:
-    def __init__(self, db_path: str = "database.db"):
+    def __init__(self, db_path: str = "database.db", readers: int = 2):
         self.db_path = db_path
-        self._connection: Optional[aiosqlite.Connection] = None
+        self.readers = max(0, readers)
+        self._connection: Optional[aiosqlite.Connection] = None  # 写连接
+        self._readers: List[aiosqlite.Connection] = []
+        self._reader_load: List[int] = []  # 每个读连接上正在执行的查询数
+        self._connect_lock = asyncio.Lock()
+        # 共享连接上的事务不能被其他协程的 commit 打断，写操作串行执行
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Database":
+        return cls(readers=int(os.environ.get("MAHJONG_DB_READERS", 2)))
 
     async def connect(self):
         """连接到数据库"""
-        if self._connection is None:
-            self._connection = await aiosqlite.connect(self.db_path)
-            await self._connection.execute("PRAGMA foreign_keys = ON")
-            await self._connection.execute("PRAGMA journal_mode = WAL")
-            await self._connection.commit()
+        if self._connection is not None:
+            return
+        async with self._connect_lock:
+            if self._connection is not None:
+                return
+            conn = await aiosqlite.connect(self.db_path)
+            await conn.execute("PRAGMA foreign_keys = ON")
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute("PRAGMA busy_timeout = 5000")
+            await conn.commit()
+            # 内存数据库无法被其他连接共享，只用写连接
+            if self.db_path != ":memory:":
+                for _ in range(self.readers):
+                    reader = await aiosqlite.connect(self.db_path)
+                    await reader.execute("PRAGMA query_only = ON")
+                    await reader.execute("PRAGMA busy_timeout = 5000")
+                    self._readers.append(reader)
+                    self._reader_load.append(0)
+            self._connection = conn
+
+    @asynccontextmanager
+    async def _read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """借一个读连接（没有读连接时用写连接）。"""
+        await self.connect()
+        if not self._readers:
+            yield self._connection
+            return
+        i = min(range(len(self._readers)), key=self._reader_load.__getitem__)
+        self._reader_load[i] += 1
+        try:
+            yield self._readers[i]
+        finally:
+            self._reader_load[i] -= 1
 
     async def close(self):
         """关闭数据库连接"""
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._reader_load.clear()
         if self._connection:
             await self._connection.close()
             self._connection = None
@@ -28,42 +167,100 @@ class Database:
         """初始化数据库表"""
         await self.connect()
 
-        # 创建用户表
-        await self._connection.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                score INTEGER DEFAULT 1000,
-                vip_level INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Ensure vip_level column exists for legacy databases
-        cursor = await self._connection.execute("PRAGMA table_info(users)")
-        columns = [row[1] for row in await cursor.fetchall()]
-        if "vip_level" not in columns:
-            await self._connection.execute(
-                "ALTER TABLE users ADD COLUMN vip_level INTEGER NOT NULL DEFAULT 0"
-            )
-
-        # 创建对局记录表
-        await self._connection.execute('''
-            CREATE TABLE IF NOT EXISTS game_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                player_id INTEGER NOT NULL,
-                opponent_username TEXT NOT NULL,
-                game_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_first_hand BOOLEAN NOT NULL,
-                score_change INTEGER NOT NULL,
-                result TEXT NOT NULL,
-                final_score INTEGER NOT NULL,
-                FOREIGN KEY (player_id) REFERENCES users(id)
-            )
-        ''')
-
-        await self._connection.commit()
+        # 多个 worker 同时启动时，建表与补列放在同一个写事务里，避免两边都看到缺列后重复 ALTER
+        async with self._write_lock:
+            await self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # 创建用户表
+                await self._connection.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT UNIQUE NOT NULL,
+                        password_hash TEXT NOT NULL,
+                        score INTEGER DEFAULT 1000,
+                        vip_level INTEGER DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+
+                # Ensure vip_level column exists for legacy databases
+                cursor = await self._connection.execute("PRAGMA table_info(users)")
+                columns = [row[1] for row in await cursor.fetchall()]
+                if "vip_level" not in columns:
+                    await self._connection.execute(
+                        "ALTER TABLE users ADD COLUMN vip_level INTEGER NOT NULL DEFAULT 0"
+                    )
+
+                # 创建对局记录表
+                await self._connection.execute('''
+                    CREATE TABLE IF NOT EXISTS game_records (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        player_id INTEGER NOT NULL,
+                        opponent_username TEXT NOT NULL,
+                        game_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_first_hand BOOLEAN NOT NULL,
+                        score_change INTEGER NOT NULL,
+                        result TEXT NOT NULL,
+                        final_score INTEGER NOT NULL,
+                        FOREIGN KEY (player_id) REFERENCES users(id)
+                    )
+                ''')
+
+                # 对局详情：每局一行，两条 game_records 通过 game_id 指向它
+                await self._connection.execute('''
+                    CREATE TABLE IF NOT EXISTS games (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        room_id TEXT,
+                        seed INTEGER,
+                        reason TEXT NOT NULL,
+                        winner_id INTEGER,
+                        loser_id INTEGER,
+                        score_change INTEGER NOT NULL,
+                        fan_total INTEGER NOT NULL,
+                        fan_breakdown TEXT NOT NULL,
+                        started_at REAL,
+                        ended_at REAL,
+                        duration REAL,
+                        FOREIGN KEY (winner_id) REFERENCES users(id),
+                        FOREIGN KEY (loser_id) REFERENCES users(id)
+                    )
+                ''')
+
+                cursor = await self._connection.execute("PRAGMA table_info(game_records)")
+                columns = [row[1] for row in await cursor.fetchall()]
+                if "game_id" not in columns:
+                    await self._connection.execute(
+                        "ALTER TABLE game_records ADD COLUMN game_id INTEGER REFERENCES games(id)"
+                    )
+
+                await self._connection.commit()
+            except BaseException:
+                await self._connection.rollback()
+                raise
+        await self.migrate()
+
+    async def migrate(self):
+        """执行 SCHEMA_MIGRATIONS 中尚未执行的步骤"""
+        await self.connect()
+        conn = self._connection
+        async with self._write_lock:
+            for target in range(1, len(SCHEMA_MIGRATIONS) + 1):
+                # 多个 worker 同时启动时，拿到写锁后再确认版本
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor = await conn.execute("PRAGMA user_version")
+                    version = (await cursor.fetchone())[0]
+                    if version >= target:
+                        await conn.rollback()
+                        continue
+                    for sql in SCHEMA_MIGRATIONS[target - 1]:
+                        await conn.execute(sql)
+                    await conn.execute(f"PRAGMA user_version = {target}")
+                    await conn.commit()
+                except BaseException:
+                    await conn.rollback()
+                    raise
+                print(f"数据库结构已迁移到版本 {target}")
 
     def _hash_password(self, password: str) -> str:
         """密码哈希"""
@@ -75,11 +272,12 @@ class Database:
             await self.connect()
             password_hash = self._hash_password(password)
 
-            await self._connection.execute(
-                "INSERT INTO users (username, password_hash, score, vip_level) VALUES (?, ?, ?, ?)",
-                (username, password_hash, initial_score, vip_level)
-            )
-            await self._connection.commit()
+            async with self._write_lock:
+                await self._connection.execute(
+                    "INSERT INTO users (username, password_hash, score, vip_level) VALUES (?, ?, ?, ?)",
+                    (username, password_hash, initial_score, vip_level)
+                )
+                await self._connection.commit()
             return True
         except aiosqlite.IntegrityError:
             # 用户名已存在
@@ -91,14 +289,14 @@ class Database:
     async def authenticate_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
         """验证用户登录"""
         try:
-            await self.connect()
             password_hash = self._hash_password(password)
 
-            cursor = await self._connection.execute(
-                "SELECT id, username, score, vip_level FROM users WHERE username = ? AND password_hash = ?",
-                (username, password_hash)
-            )
-            result = await cursor.fetchone()
+            async with self._read() as conn:
+                cursor = await conn.execute(
+                    "SELECT id, username, score, vip_level FROM users WHERE username = ? AND password_hash = ?",
+                    (username, password_hash)
+                )
+                result = await cursor.fetchone()
 
             if result:
                 return {
@@ -115,12 +313,12 @@ class Database:
     async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """根据用户名获取用户信息"""
         try:
-            await self.connect()
-            cursor = await self._connection.execute(
-                "SELECT id, username, score, vip_level FROM users WHERE username = ?",
-                (username,)
-            )
-            result = await cursor.fetchone()
+            async with self._read() as conn:
+                cursor = await conn.execute(
+                    "SELECT id, username, score, vip_level FROM users WHERE username = ?",
+                    (username,)
+                )
+                result = await cursor.fetchone()
 
             if result:
                 return {
@@ -138,11 +336,12 @@ class Database:
         """更新用户积分"""
         try:
             await self.connect()
-            await self._connection.execute(
-                "UPDATE users SET score = score + ? WHERE id = ?",
-                (score_change, user_id)
-            )
-            await self._connection.commit()
+            async with self._write_lock:
+                await self._connection.execute(
+                    "UPDATE users SET score = score + ? WHERE id = ?",
+                    (score_change, user_id)
+                )
+                await self._connection.commit()
             return True
         except Exception as e:
             print(f"更新积分错误: {e}")
@@ -154,32 +353,111 @@ class Database:
         """添加对局记录"""
         try:
             await self.connect()
-            await self._connection.execute(
-                """INSERT INTO game_records
-                   (player_id, opponent_username, is_first_hand, score_change, result, final_score)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (player_id, opponent_username, is_first_hand, score_change, result, final_score)
-            )
-            await self._connection.commit()
+            async with self._write_lock:
+                await self._connection.execute(
+                    """INSERT INTO game_records
+                       (player_id, opponent_username, is_first_hand, score_change, result, final_score)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (player_id, opponent_username, is_first_hand, score_change, result, final_score)
+                )
+                await self._connection.execute(_UPSERT_USER_STATS, _stats_row(player_id, result, score_change))
+                await self._connection.commit()
             return True
         except Exception as e:
             print(f"添加对局记录错误: {e}")
             return False
 
+    async def record_game_result(self, result: GameResult) -> Optional[Dict[int, int]]:
+        """结算一局：双方积分、两条对局记录与对局详情在同一个事务中写入"""
+        return await self.record_game_results([result])
+
+    async def record_game_results(self, results: Sequence[GameResult]) -> Optional[Dict[int, int]]:
+        """批量结算多局，返回相关用户结算后的积分；失败时整批回滚并返回 None"""
+        try:
+            return await self.write_game_results(results)
+        except Exception as e:
+            print(f"对局结算错误: {e}")
+            return None
+
+    async def write_game_results(self, results: Sequence[GameResult]) -> Dict[int, int]:
+        """record_game_results 的实现：整批一个事务、一次提交，出错时回滚并抛出异常（供重试）
+
+        BEGIN IMMEDIATE 先拿到写锁再读积分，按顺序累加得到每条记录的 final_score，
+        其他进程的写入不会穿插进来。
+        """
+        if not results:
+            return {}
+        await self.connect()
+        conn = self._connection
+        user_ids = sorted({r.winner_id for r in results} | {r.loser_id for r in results})
+        async with self._write_lock:
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await conn.execute(
+                    f"SELECT id, score FROM users WHERE id IN ({','.join('?' * len(user_ids))})",
+                    user_ids,
+                )
+                scores: Dict[int, int] = dict(await cursor.fetchall())
+                # 对局 id 由 SQLite 分配（lastrowid），对局记录与统计再整批用 executemany 插入
+                record_rows = []
+                for r in results:
+                    if r.winner_id not in scores or r.loser_id not in scores:
+                        raise ValueError(f"未知用户: {r.winner_id}/{r.loser_id}")
+                    scores[r.winner_id] += r.score_change
+                    scores[r.loser_id] -= r.score_change
+                    duration = None
+                    if r.started_at is not None and r.ended_at is not None:
+                        duration = r.ended_at - r.started_at
+                    fans = json.dumps([{"name": f["name"], "fan": f["fan"]} for f in r.fan_breakdown],
+                                      ensure_ascii=False)
+                    cursor = await conn.execute(
+                        """INSERT INTO games
+                           (room_id, seed, reason, winner_id, loser_id, score_change, fan_total,
+                            fan_breakdown, started_at, ended_at, duration)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (r.room_id, r.seed, r.reason, r.winner_id, r.loser_id,
+                         r.score_change, r.fan_total, fans, r.started_at, r.ended_at, duration)
+                    )
+                    game_id = cursor.lastrowid
+                    record_rows.append((r.winner_id, r.loser_username, r.winner_first, r.score_change,
+                                        "win", scores[r.winner_id], game_id))
+                    record_rows.append((r.loser_id, r.winner_username, not r.winner_first, -r.score_change,
+                                        "lose", scores[r.loser_id], game_id))
+
+                await conn.executemany(
+                    "UPDATE users SET score = ? WHERE id = ?",
+                    [(score, user_id) for user_id, score in scores.items()]
+                )
+                await conn.executemany(
+                    """INSERT INTO game_records
+                       (player_id, opponent_username, is_first_hand, score_change, result, final_score, game_id)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    record_rows
+                )
+                await conn.executemany(
+                    _UPSERT_USER_STATS,
+                    [_stats_row(row[0], row[4], row[3]) for row in record_rows]
+                )
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        return scores
+
     async def get_user_game_records(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
         """获取用户对局记录"""
         try:
-            await self.connect()
-            cursor = await self._connection.execute(
-                """SELECT id, opponent_username, game_time, is_first_hand,
-                          score_change, result, final_score
-                   FROM game_records
-                   WHERE player_id = ?
-                   ORDER BY game_time DESC
-                   LIMIT ?""",
-                (user_id, limit)
-            )
-            rows = await cursor.fetchall()
+            async with self._read() as conn:
+                cursor = await conn.execute(
+                    """SELECT id, opponent_username, game_time, is_first_hand,
+                              score_change, result, final_score
+                       FROM game_records
+                       WHERE player_id = ?
+                       ORDER BY game_time DESC
+                       LIMIT ?""",
+                    (user_id, limit)
+                )
+                rows = await cursor.fetchall()
 
             return [
                 {
@@ -198,44 +476,16 @@ class Database:
             return []
 
     async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
-        """获取用户统计信息"""
+        """获取用户统计信息（读 user_stats 的一行，不扫描对局记录）"""
         try:
-            await self.connect()
-
-            # 获取总对局数
-            cursor = await self._connection.execute(
-                "SELECT COUNT(*) FROM game_records WHERE player_id = ?",
-                (user_id,)
-            )
-            total_games = (await cursor.fetchone())[0]
-
-            # 获取胜利次数
-            cursor = await self._connection.execute(
-                "SELECT COUNT(*) FROM game_records WHERE player_id = ? AND result = 'win'",
-                (user_id,)
-            )
-            wins = (await cursor.fetchone())[0]
-
-            # 获取失败次数
-            cursor = await self._connection.execute(
-                "SELECT COUNT(*) FROM game_records WHERE player_id = ? AND result = 'lose'",
-                (user_id,)
-            )
-            losses = (await cursor.fetchone())[0]
-
-            # 获取平局次数
-            cursor = await self._connection.execute(
-                "SELECT COUNT(*) FROM game_records WHERE player_id = ? AND result = 'draw'",
-                (user_id,)
-            )
-            draws = (await cursor.fetchone())[0]
-
-            # 获取最大积分变化
-            cursor = await self._connection.execute(
-                "SELECT MAX(ABS(score_change)) FROM game_records WHERE player_id = ?",
-                (user_id,)
-            )
-            max_score_change = (await cursor.fetchone())[0] or 0
+            async with self._read() as conn:
+                cursor = await conn.execute(
+                    """SELECT total_games, wins, losses, draws, max_score_change
+                       FROM user_stats WHERE user_id = ?""",
+                    (user_id,)
+                )
+                row = await cursor.fetchone()
+            total_games, wins, losses, draws, max_score_change = row or (0, 0, 0, 0, 0)
 
             return {
                 "total_games": total_games,
@@ -252,32 +502,42 @@ class Database:
     async def get_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """获取排行榜"""
         try:
-            await self.connect()
-            cursor = await self._connection.execute(
-                """SELECT id, username, score, created_at
-                   FROM users
-                   ORDER BY score DESC
-                   LIMIT ?""",
-                (limit,)
-            )
-            rows = await cursor.fetchall()
+            async with self._read() as conn:
+                cursor = await conn.execute(
+                    """SELECT id, username, score, created_at
+                       FROM users
+                       ORDER BY score DESC
+                       LIMIT ?""",
+                    (limit,)
+                )
+                rows = await cursor.fetchall()
+
+            return _leaderboard_rows(rows)
+        except Exception as e:
+            print(f"获取排行榜错误: {e}")
+            return []
 
-            return [
-                {
-                    "id": row[0],
-                    "username": row[1],
-                    "score": row[2],
-                    "created_at": row[3]
-                }
-                for row in rows
-                if row[1] != "C"
-            ]
+    async def get_leaderboard_users(self, user_ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """按 id 取排行榜格式的用户行（用于把排名窗口之外的用户并入排行榜）"""
+        if not user_ids:
+            return []
+        try:
+            async with self._read() as conn:
+                cursor = await conn.execute(
+                    f"""SELECT id, username, score, created_at
+                        FROM users
+                        WHERE id IN ({','.join('?' * len(user_ids))})""",
+                    list(user_ids)
+                )
+                rows = await cursor.fetchall()
+
+            return _leaderboard_rows(rows)
         except Exception as e:
             print(f"获取排行榜错误: {e}")
             return []
 
 # 全局数据库实例
-db = Database()
+db = Database.from_env()
 
 async def init_database():
     """初始化数据库"""
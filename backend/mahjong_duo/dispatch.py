@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+websocket 消息分发：表驱动，/ws 与 /ws/auth 共用。
+
+- 每种消息类型注册一个解析函数和一个处理函数；原始 JSON 只解析、校验一次，
+  处理函数拿到的是带类型的 NamedTuple；
+- 钩子（hook）按注册顺序包在处理函数外层，形如 hook(sess, msg, call_next)，
+  用于计时、限流等横切逻辑，两个端点只需实现一次；
+- 解析失败或未知类型直接回 error，不进入处理函数。
+"""
+import json
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from mahjong_duo import metrics
+
+
+class BadMessage(ValueError):
+    """消息格式或字段取值不合法；detail 原样返回给客户端。"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+# ---------- 消息类型 ----------
+
+class Empty(NamedTuple):
+    type: str
+
+
+class Authenticate(NamedTuple):
+    type: str
+    username: Optional[str]
+    password: Optional[str]
+    token: Optional[str]
+
+
+class JoinRoom(NamedTuple):
+    type: str
+    room_id: str
+
+
+class Action(NamedTuple):
+    type: str
+    style: Optional[str]
+    tile: Optional[int]
+
+
+class Act(NamedTuple):
+    type: str
+    action: Action
+
+
+class SyncMode(NamedTuple):
+    type: str
+    mode: Optional[str]
+
+
+class SyncAck(NamedTuple):
+    type: str
+    seq: int
+
+
+class Wire(NamedTuple):
+    type: str
+    format: Optional[str]
+
+
+def _opt_str(raw: Dict[str, Any], key: str) -> Optional[str]:
+    v = raw.get(key)
+    if v is not None and not isinstance(v, str):
+        raise BadMessage(f"bad field: {key}")
+    return v
+
+
+def _opt_tile(raw: Dict[str, Any]) -> Optional[int]:
+    v = raw.get("tile")
+    if v is None:
+        return None
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        raise BadMessage("bad tile")
+
+
+def parse_empty(raw: Dict[str, Any]) -> Empty:
+    return Empty(raw["type"])
+
+
+def parse_authenticate(raw: Dict[str, Any]) -> Authenticate:
+    return Authenticate(raw["type"], _opt_str(raw, "username"), _opt_str(raw, "password"), _opt_str(raw, "token"))
+
+
+def parse_join_room(raw: Dict[str, Any]) -> JoinRoom:
+    return JoinRoom(raw["type"], _opt_str(raw, "room_id") or "default")
+
+
+def parse_act(raw: Dict[str, Any]) -> Act:
+    action = raw.get("action") or {}
+    if not isinstance(action, dict) or not isinstance(action.get("type"), str):
+        raise BadMessage("bad action")
+    return Act(raw["type"], Action(action["type"], _opt_str(action, "style"), _opt_tile(action)))
+
+
+def parse_sync_mode(raw: Dict[str, Any]) -> SyncMode:
+    return SyncMode(raw["type"], _opt_str(raw, "mode"))
+
+
+def parse_sync_ack(raw: Dict[str, Any]) -> SyncAck:
+    seq = raw.get("seq")
+    if not isinstance(seq, int):
+        raise BadMessage("bad field: seq")
+    return SyncAck(raw["type"], seq)
+
+
+def parse_wire(raw: Dict[str, Any]) -> Wire:
+    return Wire(raw["type"], _opt_str(raw, "format"))
+
+
+# legal_choices 对暗杠 / 加杠只列出第一个候选，其余候选的牌由规则函数自行校验
+_ANY_TILE = {("kong", "concealed"), ("kong", "added")}
+# 必须由请求指明牌的动作；摸牌、过、胡的牌由局面决定
+_TILE_REQUIRED = {"discard", "peng", "kong"}
+
+
+def match_choice(action: Action, choices: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """在 legal_choices 的结果里找与请求一致的一项；只有胡 / 过 / 摸牌可以不带牌，沿用该项的牌。"""
+    if action.tile is None and action.type in _TILE_REQUIRED:
+        return None
+    for c in choices:
+        if c.get("type") != action.type or c.get("style") != action.style:
+            continue
+        if action.tile is not None and "tile" in c and c["tile"] != action.tile:
+            if (action.type, action.style) not in _ANY_TILE:
+                continue
+            return {**c, "tile": action.tile}
+        return c
+    return None
+
+
+# ---------- 分发 ----------
+
+Handler = Callable[[Any, Any], Awaitable[None]]
+Hook = Callable[[Any, Any, Callable[[], Awaitable[None]]], Awaitable[None]]
+
+
+class Route(NamedTuple):
+    parse: Callable[[Dict[str, Any]], Any]
+    handler: Handler
+
+
+class Dispatcher:
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self.hooks: List[Hook] = []
+
+    def route(self, msg_type: str, parse: Callable[[Dict[str, Any]], Any] = parse_empty):
+        def decorator(handler: Handler) -> Handler:
+            self.routes[msg_type] = Route(parse, handler)
+            return handler
+        return decorator
+
+    def add_hook(self, hook: Hook) -> None:
+        self.hooks.append(hook)
+
+    def subset(self, exclude: Iterable[str]) -> "Dispatcher":
+        """共用处理函数和钩子、去掉部分消息类型的分发器（/ws 不支持认证与提示）。"""
+        d = Dispatcher()
+        d.routes = {k: v for k, v in self.routes.items() if k not in set(exclude)}
+        d.hooks = self.hooks
+        return d
+
+    def parse(self, text: str):
+        try:
+            raw = json.loads(text)
+        except ValueError:
+            metrics.messages_total.inc("invalid")
+            raise BadMessage("bad json")
+        if not isinstance(raw, dict):
+            metrics.messages_total.inc("invalid")
+            raise BadMessage("bad message")
+        route = self.routes.get(raw.get("type")) if isinstance(raw.get("type"), str) else None
+        if route is None:
+            metrics.messages_total.inc("unknown")
+            raise BadMessage("unknown message type")
+        return route, route.parse(raw)
+
+    async def dispatch(self, sess, text: str) -> None:
+        try:
+            route, msg = self.parse(text)
+        except BadMessage as e:
+            await sess.send({"type": "error", "detail": e.detail})
+            return
+        await self._call(0, sess, msg, route.handler)
+
+    async def _call(self, i: int, sess, msg, handler: Handler) -> None:
+        if i == len(self.hooks):
+            await handler(sess, msg)
+            return
+        await self.hooks[i](sess, msg, lambda: self._call(i + 1, sess, msg, handler))
+
+
+async def timing_hook(sess, msg, call_next) -> None:
+    with metrics.track_message(msg.type):
+        await call_next()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+出站消息编码：每条消息只序列化一次，编码结果在所有接收者之间复用。
+
+- 安装了 orjson 时用它序列化（约快一个数量级），否则回退到标准库 json；
+- 摸牌 / 打牌 / 过 这几类最频繁的事件在导入时按所有取值预先编码好，发送时查表；
+- 两种后端都输出紧凑格式（无多余空格），字节数取自编码结果本身，不再二次编码；
+- 有客户端协商了二进制线协议（见 wire.py）时，同时生成一份二进制帧。
+"""
+import json
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from mahjong_duo import wire
+from mahjong_duo.rules_core import TILE_TYPES
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS  # ready_status 等消息用 int 作键
+
+    def _serialize(data: Any) -> Tuple[str, int]:
+        raw = orjson.dumps(data, option=_ORJSON_OPTS)
+        return raw.decode("utf-8"), len(raw)
+else:
+    def _serialize(data: Any) -> Tuple[str, int]:
+        # 与 orjson 输出一致的紧凑格式
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return text, len(text.encode("utf-8"))
+
+
+def dumps(data: Any) -> str:
+    return _serialize(data)[0]
+
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+class EncodedMessage(NamedTuple):
+    text: str
+    size: int      # UTF-8 字节数，用于发送积压统计
+    type: str      # 消息类型，用于按类型统计
+    binary: Optional[bytes] = None  # 二进制帧；该类型不支持二进制时为 None
+
+
+def encode(data: Dict[str, Any], *, binary: bool = False) -> EncodedMessage:
+    text, size = _serialize(data)
+    return EncodedMessage(text, size, data.get("type", ""), wire.pack(data) if binary else None)
+
+
+# 热点事件（摸牌 / 打牌 / 过）取值有限：导入时按所有座位与牌各编码一次，发送时直接取用
+def _event(ev_type: str, seat: int, tile: Optional[int] = None, *, with_tile: bool = True) -> EncodedMessage:
+    ev: Dict[str, Any] = {"type": ev_type, "seat": seat}
+    if with_tile:
+        ev["tile"] = tile
+    return encode({"type": "event", "ev": ev}, binary=True)
+
+
+_SEATS = (0, 1)
+_TILES = range(TILE_TYPES)
+_DRAW = {(seat, tile): _event("draw", seat, tile) for seat in _SEATS for tile in (*_TILES, None)}
+_DISCARD = {(seat, tile): _event("discard", seat, tile) for seat in _SEATS for tile in _TILES}
+_PASS = {seat: _event("pass", seat, with_tile=False) for seat in _SEATS}
+
+
+def encode_draw(seat: int, tile: Optional[int]) -> EncodedMessage:
+    hit = _DRAW.get((seat, tile))
+    return hit if hit is not None else _event("draw", seat, tile)
+
+
+def encode_discard(seat: int, tile: int) -> EncodedMessage:
+    hit = _DISCARD.get((seat, tile))
+    return hit if hit is not None else _event("discard", seat, tile)
+
+
+def encode_pass(seat: int) -> EncodedMessage:
+    hit = _PASS.get(seat)
+    return hit if hit is not None else _event("pass", seat, with_tile=False)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+进程内指标：计数器与直方图，按标签（如消息类型）分组，可导出为 Prometheus 文本格式。
+
+只在事件循环线程里更新，不加锁。
+"""
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# 发送延迟的直方图桶（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估计分位数。"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+REGISTRY: List[Union["LabeledHistogram", "LabeledCounter"]] = []
+
+
+class LabeledHistogram:
+    def __init__(self, name: str, help: str, label: str = "type", buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.series: Dict[str, Histogram] = {}
+        REGISTRY.append(self)
+
+    def observe(self, label: str, value: float) -> None:
+        h = self.series.get(label)
+        if h is None:
+            h = self.series[label] = Histogram(self.buckets)
+        h.observe(value)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {label: h.snapshot() for label, h in sorted(self.series.items())}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, h in sorted(self.series.items()):
+            lv = _escape(value)
+            acc = 0
+            for le, c in zip(self.buckets, h.counts):
+                acc += c
+                lines.append(f'{self.name}_bucket{{{self.label}="{lv}",le="{le}"}} {acc}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{lv}",le="+Inf"}} {h.count}')
+            lines.append(f'{self.name}_sum{{{self.label}="{lv}"}} {h.sum}')
+            lines.append(f'{self.name}_count{{{self.label}="{lv}"}} {h.count}')
+        return lines
+
+
+class LabeledCounter:
+    def __init__(self, name: str, help: str, label: str = "type"):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values: Dict[str, float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, label: str, amount: float = 1) -> None:
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        return dict(sorted(self.values.items()))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for value, v in sorted(self.values.items()):
+            lines.append(f'{self.name}{{{self.label}="{_escape(value)}"}} {v}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# websocket 入站
+messages_total = LabeledCounter("mahjong_ws_messages_total", "Inbound websocket messages by type.")
+handler_latency = LabeledHistogram("mahjong_ws_handler_seconds", "Time spent handling an inbound message, by type.")
+lock_wait = LabeledHistogram("mahjong_room_lock_wait_seconds", "Time spent waiting for room.lock, by inbound message type.")
+inbound_queue_full = LabeledCounter(
+    "mahjong_ws_inbound_queue_full_total", "Times a connection's inbound queue was full and reading paused.", label="endpoint")
+hint_coalesced = LabeledCounter(
+    "mahjong_hint_coalesced_total", "AI hint requests served by an already submitted computation.", label="phase")
+
+# websocket 出站
+send_latency = LabeledHistogram("mahjong_ws_send_seconds", "Outbound send latency by message type.")
+send_failures = LabeledCounter("mahjong_ws_send_failures_total", "Failed outbound sends by message type.")
+dropped_sessions = LabeledCounter("mahjong_ws_dropped_sessions_total", "Sessions dropped as slow clients, by reason.", label="reason")
+outbound_messages = LabeledCounter("mahjong_ws_outbound_messages_total", "Outbound messages by type.")
+outbound_bytes = LabeledCounter("mahjong_ws_outbound_bytes_total", "Outbound payload bytes by type.")
+
+
+# 当前正在处理的入站消息类型；锁等待等指标据此归类（新建的任务会继承）
+current_message_type: contextvars.ContextVar[str] = contextvars.ContextVar("current_message_type", default="internal")
+
+
+@contextmanager
+def track_message(msg_type: Optional[str]) -> Iterator[None]:
+    label = msg_type if isinstance(msg_type, str) else "invalid"
+    messages_total.inc(label)
+    token = current_message_type.set(label)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        handler_latency.observe(label, time.perf_counter() - t0)
+        current_message_type.reset(token)
+
+
+def snapshot() -> Dict[str, Dict]:
+    return {m.name: m.snapshot() for m in REGISTRY}
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+入站消息限流：每个连接一组令牌桶。
+
+- 消息按类别（game / hint / control）各有一个桶，另有一个连接级总桶，两者都有令牌才放行；
+- 被拒绝的消息不进入处理函数；连续被拒时只回一次错误，避免刷屏的客户端反过来放大出站流量；
+- 以 dispatcher 钩子的形式挂载（见 dispatch.py），/ws 与 /ws/auth 共用。
+
+环境变量：
+    MAHJONG_RATE_LIMITS  形如 "game=10/20,hint=1/2"，每项为 每秒速率/突发上限，未给出的类别用默认值；
+                         设为 0 关闭限流
+"""
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from mahjong_duo import metrics
+
+# 类别 -> (每秒补充的令牌数, 桶容量)
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "session": (40.0, 80.0),
+    "game": (10.0, 20.0),
+    "hint": (1.0, 2.0),
+    "control": (30.0, 60.0),
+}
+
+MESSAGE_CLASSES: Dict[str, str] = {
+    "act": "game",
+    "ready": "game",
+    "join_room": "game",
+    "practice_ai": "game",
+    "end_game": "game",
+    "authenticate": "game",
+    "request_hint": "hint",
+    "sync_ack": "control",
+    "sync_mode": "control",
+    "wire": "control",
+}
+
+rate_limited = metrics.LabeledCounter(
+    "mahjong_ws_rate_limited_total", "Inbound messages rejected by the rate limiter, by message class.", label="class")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+def parse_limits(spec: Optional[str]) -> Optional[Dict[str, Tuple[float, float]]]:
+    """解析 MAHJONG_RATE_LIMITS；返回 None 表示关闭限流。"""
+    limits = dict(DEFAULT_LIMITS)
+    if spec is None or not spec.strip():
+        return limits
+    if spec.strip() == "0":
+        return None
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        rate, _, burst = value.partition("/")
+        if name not in limits:
+            raise ValueError(f"unknown rate limit class: {name}")
+        limits[name] = (float(rate), float(burst or rate))
+    return limits
+
+
+LIMITS = parse_limits(os.environ.get("MAHJONG_RATE_LIMITS"))
+
+
+class RateLimiter:
+    """单个连接的限流状态。"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        limits = LIMITS if limits is None else limits
+        self.enabled = limits is not None
+        self.buckets: Dict[str, TokenBucket] = (
+            {name: TokenBucket(rate, burst) for name, (rate, burst) in limits.items()} if limits else {})
+        self.notified = False  # 本轮连续拒绝是否已回过错误
+
+    def allow(self, msg_type: str) -> bool:
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        bucket = self.buckets[MESSAGE_CLASSES.get(msg_type, "control")]
+        session = self.buckets["session"]
+        # 先看类别桶再扣总桶：被类别桶拒绝的消息不消耗总额度
+        bucket.refill(now)
+        if bucket.tokens < 1.0 or not session.take(now):
+            return False
+        bucket.tokens -= 1.0
+        return True
+
+
+async def rate_limit_hook(sess, msg, call_next) -> None:
+    limiter = sess.limiter
+    if limiter.allow(msg.type):
+        limiter.notified = False
+        await call_next()
+        return
+    cls = MESSAGE_CLASSES.get(msg.type, "control")
+    rate_limited.inc(cls)
+    if limiter.notified or cls == "control":
+        return
+    limiter.notified = True
+    if cls == "hint":
+        await sess.send({"type": "ai_hint", "error": "请求过于频繁，请稍后重试"})
+    else:
+        await sess.send({"type": "error", "detail": "请求过于频繁，请稍后重试"})
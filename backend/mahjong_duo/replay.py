@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+对局动作日志与回放。
+
+牌墙由 build_wall(seed) 唯一确定，一局完全由 (seed, 先手, 动作序列) 决定，因此只需记录动作：
+
+- 每局一个只追加的日志文件，每个动作 3 字节 (操作码, 座位, 牌)；
+- 头部与局面快照是带长度前缀的帧：0xF0/0xF1 | 长度(u16) | 内容；
+- 每隔 snapshot_every 个动作追加一个局面快照（GameState.to_bytes），回放任意一步时
+  从最近的快照开始，至多重放 snapshot_every 个动作；
+- 回放使用可变引擎（手牌为张数数组，原地修改），只在最后生成一次 GameState。
+
+写入由后台任务批量进行，进程崩溃时丢失最近一个写盘间隔内的动作，文件末尾也可能是半个帧，读取时忽略即可。
+
+用于排查问题、断线重建与反作弊审计，命令行查看见 scripts/replay_game.py。
+
+环境变量：
+    MAHJONG_REPLAY_DIR             日志目录（默认为空，不记录；设置后开启）
+    MAHJONG_REPLAY_SNAPSHOT_EVERY  每隔多少个动作写一个局面快照（默认 32）
+    MAHJONG_REPLAY_FLUSH_INTERVAL  缓冲写盘间隔，秒（默认 1）
+    MAHJONG_REPLAY_KEEP_DAYS       日志保留天数，超过即删除（默认 7；0 表示不删除）
+"""
+import asyncio
+import bisect
+import os
+import struct
+import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from mahjong_duo.rules_core import (
+    GameState, Meld, PlayerState, TILE_TYPES, can_hu_four_plus_one, counts_from_tiles, init_game,
+)
+
+LOG_VERSION = 2
+
+# 操作码；座位/牌不适用时记 0
+OP_DRAW = 1
+OP_DISCARD = 2
+OP_PENG = 3             # 座位为碰牌方，牌来自对家刚打出的弃牌
+OP_KONG_EXPOSED = 4
+OP_KONG_CONCEALED = 5
+OP_KONG_ADDED = 6       # prepare_added_kong：对家可抢杠时挂起，否则直接加杠
+OP_ROB_KONG_HU = 7      # 座位为抢杠方
+OP_ROB_KONG_PASS = 8
+OP_PASS = 9
+OP_HU = 10              # 自摸/荣和，座位为胡牌方
+OP_END = 11             # 流局或中止
+
+OP_NAMES: Dict[int, str] = {
+    OP_DRAW: "draw",
+    OP_DISCARD: "discard",
+    OP_PENG: "peng",
+    OP_KONG_EXPOSED: "kong_exposed",
+    OP_KONG_CONCEALED: "kong_concealed",
+    OP_KONG_ADDED: "kong_added",
+    OP_ROB_KONG_HU: "rob_kong_hu",
+    OP_ROB_KONG_PASS: "rob_kong_pass",
+    OP_PASS: "pass",
+    OP_HU: "hu",
+    OP_END: "end",
+}
+
+FRAME_HEADER = 0xF0
+FRAME_SNAPSHOT = 0xF1
+
+_LEN = struct.Struct("<H")
+# 版本, seed, 先手, 开局时间, AI 座位（0xFF 表示两名真人）；其后为 room_id（UTF-8）
+_HEADER = struct.Struct("<BqBdB")
+_HEADER_V1 = struct.Struct("<BqBd")  # 版本 1 没有 AI 座位
+_SNAP_INDEX = struct.Struct("<I")  # 快照对应的动作数；其后为 GameState.to_bytes()
+
+Action = Tuple[int, int, int]
+
+
+def _frame(kind: int, payload: bytes) -> bytes:
+    return bytes((kind,)) + _LEN.pack(len(payload)) + payload
+
+
+# ---------- 可变回放引擎 ----------
+
+class ReplayEngine:
+    """可变局面：动作原地修改，语义与 rules_core 中对应的状态转移一致。"""
+
+    __slots__ = ("seed", "wall", "ptr", "counts", "melds", "discards", "turn", "last_discard",
+                 "step_no", "started", "ended", "pending_kong_draw", "last_draw_info", "pending_rob_kong")
+
+    def __init__(self, state: GameState):
+        self.seed = state.seed
+        self.wall = state.wall
+        self.ptr = 0
+        self.counts = [list(counts_from_tiles(p.hand)) for p in state.players]
+        self.melds = [list(p.melds) for p in state.players]
+        self.discards = [list(p.discards) for p in state.players]
+        self.turn = state.turn
+        self.last_discard = state.last_discard
+        self.step_no = state.step_no
+        self.started = state.started
+        self.ended = state.ended
+        self.pending_kong_draw = state.pending_kong_draw
+        self.last_draw_info = state.last_draw_info
+        self.pending_rob_kong = state.pending_rob_kong
+
+    def _hand(self, seat: int) -> Tuple[int, ...]:
+        hand: List[int] = []
+        for t, c in enumerate(self.counts[seat]):
+            if c:
+                hand += [t] * c
+        return tuple(hand)
+
+    def state(self) -> GameState:
+        return GameState(
+            seed=self.seed,
+            wall=self.wall[self.ptr:],
+            players=tuple(
+                PlayerState(self._hand(s), tuple(self.melds[s]), tuple(self.discards[s])) for s in (0, 1)
+            ),
+            turn=self.turn,
+            last_discard=self.last_discard,
+            step_no=self.step_no,
+            started=self.started,
+            ended=self.ended,
+            pending_kong_draw=self.pending_kong_draw,
+            last_draw_info=self.last_draw_info,
+            pending_rob_kong=self.pending_rob_kong,
+        )
+
+    def _take(self, seat: int, tile: int, n: int, error: str) -> None:
+        if not 0 <= tile < TILE_TYPES or self.counts[seat][tile] < n:
+            raise ValueError(error)
+        self.counts[seat][tile] -= n
+
+    def _claim(self, seat: int, tile: int) -> None:
+        # 从对家弃牌末尾移除被碰/杠的牌（仅展示用）
+        opp = self.discards[1 - seat]
+        if opp and opp[-1] == tile:
+            opp.pop()
+        self.last_discard = None
+        self.turn = seat
+
+    def _upgrade_pong(self, seat: int, tile: int) -> bool:
+        if self.counts[seat][tile] < 1:
+            return False
+        melds = self.melds[seat]
+        for i, m in enumerate(melds):
+            if m.kind == "pong" and m.tiles[0] == tile:
+                melds[i] = Meld("kong_added", (tile, tile, tile, tile))
+                self.counts[seat][tile] -= 1
+                self.step_no += 1
+                self.pending_kong_draw = seat
+                self.last_draw_info = None
+                return True
+        return False
+
+    def apply(self, op: int, seat: int, tile: int) -> None:
+        if op == OP_DRAW:
+            if self.ptr >= len(self.wall):
+                return
+            tile = self.wall[self.ptr]
+            self.ptr += 1
+            kong_draw = self.pending_kong_draw == seat
+            if kong_draw:
+                self.pending_kong_draw = None
+            self.counts[seat][tile] += 1
+            self.last_discard = None
+            self.step_no += 1
+            self.last_draw_info = (seat, "kong" if kong_draw else "normal")
+        elif op == OP_DISCARD:
+            self._take(seat, tile, 1, "ILLEGAL_DISCARD")
+            self.discards[seat].append(tile)
+            self.last_discard = (seat, tile)
+            self.step_no += 1
+            self.turn = 1 - seat
+            self.last_draw_info = None
+        elif op == OP_PENG:
+            self._take(seat, tile, 2, "ILLEGAL_PENG")
+            self.melds[seat].append(Meld("pong", (tile, tile, tile)))
+            self._claim(seat, tile)
+            self.step_no += 1
+            self.last_draw_info = None
+        elif op == OP_KONG_EXPOSED:
+            self._take(seat, tile, 3, "ILLEGAL_KONG_EXPOSED")
+            self.melds[seat].append(Meld("kong_exposed", (tile, tile, tile, tile)))
+            self._claim(seat, tile)
+            self.step_no += 1
+            self.pending_kong_draw = seat
+            self.last_draw_info = None
+        elif op == OP_KONG_CONCEALED:
+            if not 0 <= tile < TILE_TYPES or self.counts[seat][tile] != 4:
+                raise ValueError("ILLEGAL_KONG_CONCEALED")
+            self.counts[seat][tile] = 0
+            self.melds[seat].append(Meld("kong_concealed", (tile, tile, tile, tile)))
+            self.step_no += 1
+            self.pending_kong_draw = seat
+            self.last_draw_info = None
+        elif op == OP_KONG_ADDED:
+            if not any(m.kind == "pong" and m.tiles[0] == tile for m in self.melds[seat]):
+                raise ValueError("NO_PONG_TO_UPGRADE")
+            robber = 1 - seat
+            self.counts[robber][tile] += 1
+            robbable = can_hu_four_plus_one(self._hand(robber), tuple(self.melds[robber]))
+            self.counts[robber][tile] -= 1
+            if robbable:
+                if self.counts[seat][tile] < 1:
+                    raise ValueError("ILLEGAL_KONG_ADDED")
+                self.pending_rob_kong = (seat, tile)
+                self.turn = robber
+            elif not self._upgrade_pong(seat, tile):
+                raise ValueError("ILLEGAL_KONG_ADDED")
+        elif op == OP_ROB_KONG_HU:
+            if self.pending_rob_kong is None or seat != 1 - self.pending_rob_kong[0]:
+                raise ValueError("NO_PENDING_ROB_KONG")
+            owner = self.pending_rob_kong[0]
+            if self.counts[owner][tile] > 0:
+                self.counts[owner][tile] -= 1
+            self.counts[seat][tile] += 1
+            self.pending_rob_kong = None
+            self.ended = True
+            self.turn = seat
+            self.last_discard = None
+            self.pending_kong_draw = None
+            self.last_draw_info = None
+        elif op == OP_ROB_KONG_PASS:
+            if self.pending_rob_kong is None or seat != 1 - self.pending_rob_kong[0]:
+                raise ValueError("NO_PENDING_ROB_KONG")
+            owner, kong_tile = self.pending_rob_kong
+            self.pending_rob_kong = None
+            self.turn = owner
+            self._upgrade_pong(owner, kong_tile)
+        elif op == OP_PASS:
+            self.last_discard = None
+        elif op in (OP_HU, OP_END):
+            self.ended = True
+        else:
+            raise ValueError(f"unknown replay opcode: {op}")
+
+
+# ---------- 日志 ----------
+
+class GameLog:
+    """一局的动作序列与局面快照；snapshots 按动作数升序。"""
+
+    def __init__(self, room_id: str, seed: int, first_turn: int, started_at: float = 0.0,
+                 ai_seat: Optional[int] = None):
+        self.room_id = room_id
+        self.seed = seed
+        self.first_turn = first_turn
+        self.started_at = started_at
+        self.ai_seat = ai_seat
+        self.actions: List[Action] = []
+        self.snapshots: List[Tuple[int, bytes]] = []  # (动作数, GameState.to_bytes())
+        self.size = 0  # from_bytes 解析到的完整帧字节数，末尾半个帧不计入
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def header_bytes(self) -> bytes:
+        ai_seat = 0xFF if self.ai_seat is None else self.ai_seat
+        payload = _HEADER.pack(LOG_VERSION, self.seed, self.first_turn, self.started_at, ai_seat)
+        return _frame(FRAME_HEADER, payload + self.room_id.encode("utf-8"))
+
+    def to_bytes(self) -> bytes:
+        out = [self.header_bytes()]
+        snaps = iter(self.snapshots)
+        snap = next(snaps, None)
+        for i, action in enumerate(self.actions):
+            while snap is not None and snap[0] <= i:
+                out.append(_frame(FRAME_SNAPSHOT, _SNAP_INDEX.pack(snap[0]) + snap[1]))
+                snap = next(snaps, None)
+            out.append(bytes(action))
+        while snap is not None:
+            out.append(_frame(FRAME_SNAPSHOT, _SNAP_INDEX.pack(snap[0]) + snap[1]))
+            snap = next(snaps, None)
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "GameLog":
+        if len(blob) < 3 or blob[0] != FRAME_HEADER:
+            raise ValueError("missing game log header")
+        (n,) = _LEN.unpack_from(blob, 1)
+        header = blob[3:3 + n]
+        version = header[0] if header else None
+        if version == 1:
+            _, seed, first_turn, started_at = _HEADER_V1.unpack_from(header)
+            ai_seat, room_id = None, header[_HEADER_V1.size:]
+        elif version == LOG_VERSION:
+            _, seed, first_turn, started_at, ai_seat = _HEADER.unpack_from(header)
+            ai_seat, room_id = (None if ai_seat == 0xFF else ai_seat), header[_HEADER.size:]
+        else:
+            raise ValueError(f"unsupported game log version: {version}")
+        log = cls(room_id.decode("utf-8"), seed, first_turn, started_at, ai_seat)
+        actions = log.actions
+        pos, end = 3 + n, len(blob)
+        while pos < end:
+            kind = blob[pos]
+            if kind == FRAME_SNAPSHOT:
+                if pos + 3 > end:
+                    break
+                (n,) = _LEN.unpack_from(blob, pos + 1)
+                if pos + 3 + n > end:
+                    break
+                (index,) = _SNAP_INDEX.unpack_from(blob, pos + 3)
+                log.snapshots.append((index, bytes(blob[pos + 3 + _SNAP_INDEX.size:pos + 3 + n])))
+                pos += 3 + n
+            elif kind in OP_NAMES:
+                if pos + 3 > end:
+                    break
+                actions.append((kind, blob[pos + 1], blob[pos + 2]))
+                pos += 3
+            else:
+                raise ValueError(f"bad game log frame 0x{kind:02x} at offset {pos}")
+        log.size = pos
+        return log
+
+    def initial_state(self) -> GameState:
+        return init_game(self.seed, first_turn=self.first_turn)
+
+    def state_at(self, n: Optional[int] = None) -> GameState:
+        """执行前 n 个动作后的局面（默认全部）；从最近的快照开始重放。"""
+        n = len(self.actions) if n is None else n
+        if not 0 <= n <= len(self.actions):
+            raise IndexError(f"action index {n} out of range 0..{len(self.actions)}")
+        i = bisect.bisect_right(self.snapshots, n, key=lambda snap: snap[0]) - 1
+        if i >= 0:
+            start, blob = self.snapshots[i]
+            state = GameState.from_bytes(blob)
+        else:
+            start, state = 0, self.initial_state()
+        if start == n:
+            return state
+        engine = ReplayEngine(state)
+        apply = engine.apply
+        for op, seat, tile in self.actions[start:n]:
+            apply(op, seat, tile)
+        return engine.state()
+
+
+# ---------- 写入 ----------
+
+FLUSH_BYTES = 64 * 1024   # 缓冲超过这么多字节时提前写盘
+PRUNE_EVERY = 3600.0      # 清理过期日志的间隔，秒
+
+
+class GameRecorder:
+    """单局日志的写入缓冲；record 只追加到内存，由 ReplayLogs 的后台任务批量写入文件。"""
+
+    def __init__(self, logs: "ReplayLogs", path: str, actions: int = 0, snapshot_every: int = 32,
+                 header: bytes = b""):
+        self.logs = logs
+        self.path = path
+        self.actions = actions
+        self.snapshot_every = snapshot_every
+        self.buffer = bytearray(header)
+        self.create = bool(header)  # 首次写入时新建（覆盖）文件，否则追加
+        self.closed = False
+
+    def record(self, op: int, seat: int, tile: int, state: Optional[GameState]) -> None:
+        n = len(self.buffer)
+        self.buffer += bytes((op, seat, tile))
+        self.actions += 1
+        if state is not None and self.snapshot_every > 0 and self.actions % self.snapshot_every == 0:
+            self.buffer += _frame(FRAME_SNAPSHOT, _SNAP_INDEX.pack(self.actions) + state.to_bytes())
+        self.logs.buffered(len(self.buffer) - n)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _write_jobs(directory: str, jobs: List[Tuple[str, str, bytes]]) -> None:
+    """在线程池中执行：把各局缓冲的字节写入文件。"""
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        print(f"无法创建对局日志目录 {directory}: {e!r}")
+        return
+    for path, mode, data in jobs:
+        try:
+            with open(path, mode) as fh:
+                fh.write(data)
+        except OSError as e:
+            print(f"对局日志写入失败 {path}: {e!r}")
+
+
+def _truncate_log(path: str) -> int:
+    """在线程池中执行：截掉崩溃时写了一半的帧，返回日志中的动作数。"""
+    with open(path, "r+b") as fh:
+        log = GameLog.from_bytes(fh.read())
+        fh.truncate(log.size)
+    return len(log)
+
+
+class ReplayLogs:
+    """日志目录：每局一个文件 <room_id>-<seed>.mjlog。
+
+    文件读写都在默认线程池中进行：record 只写内存缓冲，后台任务每 flush_interval 秒
+    （或缓冲超过 FLUSH_BYTES 时）把各局的新内容追加到文件；每小时删除超过 keep_days 天未修改的日志。
+    未调用 start() 时（脚本、测试）缓冲一直保留到 flush()。
+    """
+
+    def __init__(self, directory: Optional[str], snapshot_every: int = 32,
+                 flush_interval: float = 1.0, keep_days: float = 7.0):
+        self.directory = directory or None
+        self.snapshot_every = snapshot_every
+        self.flush_interval = flush_interval
+        self.keep_days = keep_days
+        self._recorders: Dict[str, GameRecorder] = {}  # path -> 有未写入内容或仍在记录的写入器
+        self._buffered = 0
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls) -> "ReplayLogs":
+        return cls(
+            os.environ.get("MAHJONG_REPLAY_DIR", ""),
+            snapshot_every=int(os.environ.get("MAHJONG_REPLAY_SNAPSHOT_EVERY", 32)),
+            flush_interval=float(os.environ.get("MAHJONG_REPLAY_FLUSH_INTERVAL", 1.0)),
+            keep_days=float(os.environ.get("MAHJONG_REPLAY_KEEP_DAYS", 7)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def path(self, room_id: str, seed: int) -> str:
+        return os.path.join(self.directory or ".", f"{room_id}-{seed}.mjlog")
+
+    def create(self, room_id: str, seed: int, first_turn: int,
+               ai_seat: Optional[int] = None) -> Optional[GameRecorder]:
+        """新开一局：返回写入器，头部随第一次写盘写入。"""
+        if self.directory is None:
+            return None
+        header = GameLog(room_id, seed, first_turn, time.time(), ai_seat).header_bytes()
+        return self._track(GameRecorder(self, self.path(room_id, seed), 0, self.snapshot_every, header))
+
+    async def resume(self, room_id: str, seed: int) -> Optional[GameRecorder]:
+        """房间从存储恢复后继续追加到原日志；日志不存在或无法解析时不再记录本局。"""
+        if self.directory is None:
+            return None
+        path = self.path(room_id, seed)
+        await self._flush()  # 同一局之前的写入器可能还有未写盘的内容
+        try:
+            actions = await asyncio.get_running_loop().run_in_executor(None, _truncate_log, path)
+        except (OSError, ValueError):
+            return None
+        return self._track(GameRecorder(self, path, actions, self.snapshot_every))
+
+    def load(self, room_id: str, seed: int) -> GameLog:
+        with open(self.path(room_id, seed), "rb") as fh:
+            return GameLog.from_bytes(fh.read())
+
+    def _track(self, recorder: GameRecorder) -> GameRecorder:
+        # 同名日志若还有旧写入器（同一房间同一 seed 重开），新日志会覆盖文件，旧内容直接丢弃
+        self._recorders[recorder.path] = recorder
+        return recorder
+
+    def buffered(self, n: int) -> None:
+        self._buffered += n
+        if self._buffered >= FLUSH_BYTES and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take(self) -> List[Tuple[str, str, bytes]]:
+        """取出所有待写内容，已关闭且写完的写入器随之移除。"""
+        jobs = []
+        for path, rec in list(self._recorders.items()):
+            if rec.buffer or rec.create:
+                jobs.append((path, "wb" if rec.create else "ab", bytes(rec.buffer)))
+                rec.buffer.clear()
+                rec.create = False
+            if rec.closed:
+                del self._recorders[path]
+        self._buffered = 0
+        return jobs
+
+    def flush(self) -> None:
+        """同步写盘（脚本与测试用；服务内由后台任务在线程池中写）。"""
+        jobs = self._take()
+        if jobs:
+            _write_jobs(self.directory, jobs)
+
+    async def _flush(self) -> None:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            jobs = self._take()
+            if jobs:
+                await asyncio.get_running_loop().run_in_executor(None, _write_jobs, self.directory, jobs)
+
+    def prune(self, active: FrozenSet[str] = frozenset()) -> int:
+        """删除超过 keep_days 天未修改且不在 active 中的日志，返回删除的文件数。"""
+        if self.directory is None or self.keep_days <= 0:
+            return 0
+        cutoff = time.time() - self.keep_days * 86400
+        removed = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if (entry.name.endswith(".mjlog") and entry.path not in active
+                            and entry.stat().st_mtime < cutoff):
+                        os.remove(entry.path)
+                        removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"清理对局日志失败: {e!r}")
+        return removed
+
+    def start(self) -> None:
+        if self.directory is not None and self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+        if self.directory is not None:
+            await self._flush()
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_prune = time.monotonic()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush()
+            if self.keep_days > 0 and time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + PRUNE_EVERY
+                removed = await loop.run_in_executor(None, self.prune, frozenset(self._recorders))
+                if removed:
+                    print(f"清理过期对局日志: {removed}")
+
+
+replay_logs = ReplayLogs.from_env()
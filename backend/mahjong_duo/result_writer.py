@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+对局结算的后写队列：game_end 之后只把结算入队，不在消息处理路径上等待数据库。
+
+- 后台任务攒批提交：队列满 batch_size 局，或最早一局入队已超过 interval 秒，即整批一个事务写入；
+- 提交失败按指数退避重试；重试用尽后逐局单独提交，隔离出有问题的那一局：
+  只有数据本身写不进去（约束冲突、未知用户）的结算才丢弃并打印，
+  数据库暂时不可用（锁、断开等）时结算放回队首，后台任务按封顶的退避间隔一直重试，不会丢；
+- 关闭服务时把队列全部写完再退出（此时数据库仍不可用的话，打印未写入的局数）；
+- 尚未写入的结算留在内存里，读接口叠加上去，玩家在对局结束后立即看到结果：
+  积分（登录、用户信息、排行榜）与胜负统计（用户信息）都会叠加；排行榜多取若干行并并入
+  积分上涨的待写用户，再按叠加后的积分重排。
+  对局记录列表不叠加（记录的 id 与结算后积分要到写入时才确定），未写入的对局最多晚
+  interval 秒（提交失败重试时更久）才出现在记录里；其他进程（分片）里未写入的结算同样看不到。
+
+环境变量：
+    MAHJONG_RESULT_BATCH     每批最多写入的局数（默认 64）
+    MAHJONG_RESULT_INTERVAL  最长攒批时间，秒（默认 0.2）
+    MAHJONG_RESULT_RETRIES   整批提交失败后的重试次数（默认 5）
+    MAHJONG_RESULT_MAX_DELAY 数据库持续不可用时，后台重试的最长间隔，秒（默认 30）
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from mahjong_duo import metrics
+from mahjong_duo.database import Database, GameResult, db
+
+results_written = metrics.LabeledCounter(
+    "mahjong_game_results_total", "Game results leaving the write-behind queue, by outcome.", label="outcome")
+
+
+def _permanent(e: Exception) -> bool:
+    """重试也写不进去的错误：约束冲突，或 write_game_results 校验出的未知用户。"""
+    return isinstance(e, (sqlite3.IntegrityError, ValueError))
+
+
+class GameResultWriter:
+    def __init__(self, database: Database, batch_size: int = 64, interval: float = 0.2, retries: int = 5,
+                 max_delay: float = 30.0):
+        self.database = database
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.retries = max(0, retries)
+        self.max_delay = max_delay
+        self._delay = 0.0  # 数据库不可用时后台重试的当前间隔
+        self._queue: List[GameResult] = []
+        self._first_queued = 0.0  # 队首入队时间（monotonic）
+        self._pending: Dict[int, int] = defaultdict(int)  # user_id -> 尚未写入的积分变化
+        self._unsettled: List[GameResult] = []  # 已入队、尚未写入（含正在提交）的结算，按入队顺序
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls, database: Database) -> "GameResultWriter":
+        return cls(
+            database,
+            batch_size=int(os.environ.get("MAHJONG_RESULT_BATCH", 64)),
+            interval=float(os.environ.get("MAHJONG_RESULT_INTERVAL", 0.2)),
+            retries=int(os.environ.get("MAHJONG_RESULT_RETRIES", 5)),
+            max_delay=float(os.environ.get("MAHJONG_RESULT_MAX_DELAY", 30)),
+        )
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def submit(self, result: GameResult) -> None:
+        if not self._queue:
+            self._first_queued = time.monotonic()
+        self._queue.append(result)
+        self._unsettled.append(result)
+        self._pending[result.winner_id] += result.score_change
+        self._pending[result.loser_id] -= result.score_change
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---- 读取时叠加 ----
+
+    def pending_score(self, user_id: Optional[int]) -> int:
+        return self._pending.get(user_id, 0) if user_id is not None else 0
+
+    def overlay(self, user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """返回叠加了未写入积分变化的用户信息（不修改传入的 dict）。"""
+        if not user or "score" not in user:
+            return user
+        delta = self.pending_score(user.get("id"))
+        return {**user, "score": user["score"] + delta} if delta else user
+
+    def overlay_stats(self, user_id: int, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """get_user_stats 的结果叠加未写入的对局（与 user_stats 的累计规则一致）。"""
+        mine = [r for r in self._unsettled if user_id in (r.winner_id, r.loser_id)]
+        if not mine or not stats:
+            return stats
+        total = stats["total_games"] + len(mine)
+        wins = stats["wins"] + sum(1 for r in mine if r.winner_id == user_id)
+        return {
+            **stats,
+            "total_games": total,
+            "wins": wins,
+            "losses": stats["losses"] + sum(1 for r in mine if r.loser_id == user_id),
+            "win_rate": wins / total * 100,
+            "max_score_change": max(stats["max_score_change"] or 0, *(abs(r.score_change) for r in mine)),
+        }
+
+    async def leaderboard(self, limit: int) -> List[Dict[str, Any]]:
+        """叠加未写入积分后的排行榜前 limit 名。
+
+        每个有待写积分的用户最多让一名库内排名靠前的用户跌出前 limit，所以多取这么多行；
+        积分上涨、但库内排名在这个窗口之外的待写用户单独查出来并入候选。
+        """
+        movers = {user_id: delta for user_id, delta in self._pending.items() if delta}
+        if not movers:
+            return await self.database.get_leaderboard(limit)
+        rows = await self.database.get_leaderboard(limit + len(movers))
+        seen = {row["id"] for row in rows}
+        risers = [user_id for user_id, delta in movers.items() if delta > 0 and user_id not in seen]
+        if risers:
+            rows += await self.database.get_leaderboard_users(risers)
+        rows = sorted((self.overlay(row) for row in rows), key=lambda row: row["score"], reverse=True)
+        return rows[:limit]
+
+    # ---- 写入 ----
+
+    def _settled(self, batch: List[GameResult]) -> None:
+        done = {id(r) for r in batch}
+        self._unsettled = [r for r in self._unsettled if id(r) not in done]
+        for r in batch:
+            for user_id, delta in ((r.winner_id, r.score_change), (r.loser_id, -r.score_change)):
+                left = self._pending[user_id] - delta
+                if left:
+                    self._pending[user_id] = left
+                else:
+                    del self._pending[user_id]
+
+    async def _commit(self, batch: List[GameResult]) -> List[GameResult]:
+        """写入一批；返回因数据库暂时不可用而没写进去、需要稍后重试的结算。"""
+        delay = 0.05
+        for attempt in range(self.retries + 1):
+            try:
+                await self.database.write_game_results(batch)
+            except Exception as e:
+                print(f"对局结算写入失败（第 {attempt + 1} 次，{len(batch)} 局）: {e!r}")
+                if _permanent(e):
+                    break
+                if attempt < self.retries:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 2.0)
+                continue
+            results_written.inc("written", len(batch))
+            self._settled(batch)
+            return []
+        # 整批一直失败：逐局提交，找出写不进去的那一局；遇到暂时性错误就停下，剩余的留待重试
+        for i, r in enumerate(batch):
+            try:
+                await self.database.write_game_results([r])
+            except Exception as e:
+                if not _permanent(e):
+                    results_written.inc("retried", len(batch) - i)
+                    return batch[i:]
+                results_written.inc("dropped")
+                print(f"丢弃无法写入的对局结算 room={r.room_id} seed={r.seed}: {e!r}")
+            else:
+                results_written.inc("written")
+            self._settled([r])
+        return []
+
+    def _requeue(self, failed: List[GameResult]) -> None:
+        # 放回队首，保持结算顺序；_pending / _unsettled 中仍保留它们，读接口照常叠加
+        self._queue = failed + self._queue
+        self._first_queued = time.monotonic() - self.interval
+
+    async def flush(self) -> None:
+        while self._queue:
+            batch, self._queue = self._queue[:self.batch_size], self._queue[self.batch_size:]
+            if self._queue:
+                self._first_queued = time.monotonic()
+            failed = await self._commit(batch)
+            if failed:
+                self._requeue(failed)
+                print(f"数据库不可用，仍有 {len(self._queue)} 局结算未写入")
+                return
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            if self._queue:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    async def stop(self) -> None:
+        # 不取消后台任务：正在提交的一批若被取消，无法确定是否已写入；等它提交完再写剩余的
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    async def _writer(self) -> None:
+        while not self._stopping:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # 攒批：等到满一批或队首等满 interval
+            while self._queue and len(self._queue) < self.batch_size and not self._stopping:
+                wait = self._first_queued + self.interval - time.monotonic()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if not self._queue:
+                continue
+            batch, self._queue = self._queue[:self.batch_size], self._queue[self.batch_size:]
+            if self._queue:
+                self._first_queued = time.monotonic()
+                self._wakeup.set()
+            failed = await self._commit(batch)
+            if failed:
+                self._requeue(failed)
+                self._delay = min(max(self._delay * 2, self.interval, 0.05), self.max_delay)
+                await self._backoff(self._delay)
+                self._wakeup.set()
+            else:
+                self._delay = 0.0
+
+    async def _backoff(self, delay: float) -> None:
+        """等待 delay 秒再重试；新的结算入队不打断等待，stop 会打断。"""
+        deadline = time.monotonic() + delay
+        while not self._stopping:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), left)
+            except asyncio.TimeoutError:
+                return
+
+
+result_writer = GameResultWriter.from_env(db)
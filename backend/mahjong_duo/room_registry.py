@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+房间生命周期：创建、活跃时间跟踪、空闲回收与总数上限。
+
+- 房间无人在线（room.sess 为空）且超过 idle_timeout 没有活动即视为空闲，由后台清扫任务回收；
+  有人在线的房间不会被回收；
+- 房间总数达到 max_rooms 时，先回收最久未活动的空房间腾出位置，仍然不足才拒绝创建；
+- 清扫时顺带估算房间占用的内存（局面、同步视图等），供 /metrics 导出：每次只随机抽取
+  memory_sample 个房间遍历对象图，总量按已估算房间的均值乘以房间数外推；
+- room_id 最长 64 个字符，不能含控制字符和路径分隔符（/ 或 \\）。原先任意字符串都能用作房间号；
+  现在房间号会拼进回放文件名（<room_id>-<seed>.mjlog），所以加了限制，空格、标点、汉字等仍可使用。
+
+环境变量：
+    MAHJONG_MAX_ROOMS            房间数上限（默认 1000）
+    MAHJONG_ROOM_IDLE_TIMEOUT    空房间保留时长，秒（默认 600）
+    MAHJONG_ROOM_SWEEP_INTERVAL  清扫间隔，秒（默认 60）
+    MAHJONG_ROOM_MEMORY_SAMPLE   每次清扫估算内存的房间数（默认 32）
+"""
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Dict, Generic, Iterator, Optional, TypeVar
+
+from mahjong_duo import metrics
+
+ROOM_ID_RE = re.compile(r"^[^\x00-\x1f\x7f/\\]{1,64}$")
+
+rooms_evicted = metrics.LabeledCounter(
+    "mahjong_rooms_evicted_total", "Rooms reclaimed by the registry, by reason.", label="reason")
+rooms_rejected = metrics.LabeledCounter(
+    "mahjong_rooms_rejected_total", "Room creations refused, by reason.", label="reason")
+
+
+class RoomError(Exception):
+    """无法进入房间；str(e) 可直接回给客户端。"""
+
+
+class InvalidRoomId(RoomError):
+    pass
+
+
+class RoomLimitReached(RoomError):
+    pass
+
+
+def deep_sizeof(obj: Any) -> int:
+    """粗略估算对象图占用的字节数（同一对象只计一次；小整数等共享对象也会计入，结果偏大）。"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if o is None or id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif is_dataclass(o) and not isinstance(o, type):
+            stack.extend(getattr(o, f.name) for f in fields(o))
+    return total
+
+
+R = TypeVar("R")
+
+
+class RoomRegistry(Generic[R]):
+    def __init__(self, factory: Callable[[str], R], max_rooms: int = 1000,
+                 idle_timeout: float = 600.0, sweep_interval: float = 60.0,
+                 memory_sample: int = 32, on_evict: Optional[Callable[[str], None]] = None):
+        self.factory = factory
+        self.on_evict = on_evict
+        self.max_rooms = max(1, max_rooms)
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.memory_sample = max(1, memory_sample)
+        self._rooms: Dict[str, R] = {}
+        self._last_active: Dict[str, float] = {}
+        self._memory: Dict[str, int] = {}  # 抽样到的房间最近一次估算的字节数
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, factory: Callable[[str], R], **kwargs) -> "RoomRegistry[R]":
+        return cls(
+            factory,
+            max_rooms=int(os.environ.get("MAHJONG_MAX_ROOMS", 1000)),
+            idle_timeout=float(os.environ.get("MAHJONG_ROOM_IDLE_TIMEOUT", 600)),
+            sweep_interval=float(os.environ.get("MAHJONG_ROOM_SWEEP_INTERVAL", 60)),
+            memory_sample=int(os.environ.get("MAHJONG_ROOM_MEMORY_SAMPLE", 32)),
+            **kwargs,
+        )
+
+    # ---- 字典式只读访问 ----
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rooms)
+
+    def get(self, room_id: str) -> Optional[R]:
+        return self._rooms.get(room_id)
+
+    def values(self):
+        return self._rooms.values()
+
+    # ---- 生命周期 ----
+
+    def get_or_create(self, room_id: str) -> R:
+        room = self._rooms.get(room_id)
+        if room is not None:
+            self.touch(room_id)
+            return room
+        if not isinstance(room_id, str) or not ROOM_ID_RE.match(room_id):
+            rooms_rejected.inc("bad_id")
+            raise InvalidRoomId("房间号不能为空、不能包含 / 或 \\ 等特殊字符，且不超过64个字符")
+        if len(self._rooms) >= self.max_rooms and not self._evict_oldest_idle():
+            rooms_rejected.inc("limit")
+            raise RoomLimitReached("服务器房间数已达上限，请稍后再试")
+        room = self.factory(room_id)
+        self._rooms[room_id] = room
+        self.touch(room_id)
+        return room
+
+    def touch(self, room_id: str) -> None:
+        if room_id in self._rooms:
+            self._last_active[room_id] = time.monotonic()
+
+    def _occupied(self, room: Any) -> bool:
+        return bool(room.sess)
+
+    def _evict(self, room_id: str, reason: str) -> None:
+        room = self._rooms.pop(room_id)
+        self._last_active.pop(room_id, None)
+        self._memory.pop(room_id, None)
+        # 置空局面：取消仍在等待的提示计算，释放对局数据
+        room.state = None
+        rooms_evicted.inc(reason)
+        if self.on_evict is not None:
+            self.on_evict(room_id)
+
+    def _evict_oldest_idle(self) -> bool:
+        candidates = [rid for rid, room in self._rooms.items() if not self._occupied(room)]
+        if not candidates:
+            return False
+        self._evict(min(candidates, key=lambda rid: self._last_active.get(rid, 0.0)), "capacity")
+        return True
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """回收空闲房间并抽样刷新内存估算；返回回收数量。"""
+        now = time.monotonic() if now is None else now
+        expired = [
+            rid for rid, room in self._rooms.items()
+            if not self._occupied(room) and now - self._last_active.get(rid, 0.0) >= self.idle_timeout
+        ]
+        for rid in expired:
+            self._evict(rid, "idle")
+        # 遍历对象图开销不小，房间多时只抽样一部分
+        sample = list(self._rooms)
+        if len(sample) > self.memory_sample:
+            sample = random.sample(sample, self.memory_sample)
+        for rid in sample:
+            self._memory[rid] = self._rooms[rid].memory_usage()
+        return len(expired)
+
+    def memory_bytes(self) -> int:
+        """房间总内存的估算值：已抽样房间的均值乘以房间数。"""
+        if not self._memory:
+            return 0
+        return sum(self._memory.values()) * len(self._rooms) // len(self._memory)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self._rooms),
+            "occupied": sum(1 for room in self._rooms.values() if self._occupied(room)),
+            "max_rooms": self.max_rooms,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+    # ---- 后台清扫 ----
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._sweeper())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"房间清扫失败: {e!r}")
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+房间状态持久化：进程重启或房间被回收后，进行中的对局可以从存储中恢复。
+
+- 每次消息处理完成后比较房间的局面版本、准备状态、座位名与 AI 陪练设置，有变化才序列化；
+- 写入由后台任务合并批量提交：同一房间只保留最新快照，AI 连续行动不会产生多次写入；
+- 对局结束或房间重置后删除存储中的快照；
+- 房间不在内存中时，join_room 先尝试从存储恢复，再按原流程入座。
+
+RoomStore 是存储接口（save_many / load / delete_many / purge / close），只与字节串打交道，
+网络存储（如 Redis）实现这几个方法即可接入。内置：
+    MemoryRoomStore  进程内字典，测试用
+    SqliteRoomStore  本机 SQLite 表，同一台机器上的进程共享（分片之间迁移房间也依赖它）
+
+环境变量：
+    MAHJONG_ROOM_STORE      none | memory | sqlite（默认 sqlite）
+    MAHJONG_ROOM_DB         sqlite 后端的数据库文件（默认 database.db）
+    MAHJONG_ROOM_STORE_TTL  快照超过多久未更新即在启动时清理，秒（默认 86400）
+"""
+import abc
+import asyncio
+import marshal
+import os
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiosqlite
+
+from mahjong_duo.rules_core import GameState
+
+FORMAT_VERSION = 2
+
+
+class RoomSnapshot(NamedTuple):
+    room_id: str
+    state: Optional[GameState]
+    ready: Dict[int, bool]
+    player_names: Dict[int, str]
+    ai_seat: Optional[int]
+    practice_mode: bool
+
+
+# ---------- 序列化 ----------
+
+def encode_snapshot(snap: RoomSnapshot) -> bytes:
+    state = snap.state.to_bytes() if snap.state is not None else None
+    return marshal.dumps((FORMAT_VERSION, snap.room_id, state, snap.ready, snap.player_names,
+                          snap.ai_seat, snap.practice_mode))
+
+
+def decode_snapshot(blob: bytes) -> RoomSnapshot:
+    data = marshal.loads(blob)
+    if data[0] != FORMAT_VERSION:
+        raise ValueError(f"unsupported room snapshot version: {data[0]}")
+    _, room_id, state, ready, names, ai_seat, practice_mode = data
+    return RoomSnapshot(room_id, GameState.from_bytes(state) if state is not None else None,
+                        ready, names, ai_seat, practice_mode)
+
+
+# ---------- 存储后端 ----------
+
+class RoomStore(abc.ABC):
+    @abc.abstractmethod
+    async def save_many(self, items: List[Tuple[str, bytes]]) -> None:
+        """写入（覆盖）若干房间的快照。"""
+
+    @abc.abstractmethod
+    async def load(self, room_id: str) -> Optional[bytes]:
+        """读取房间快照，不存在时返回 None。"""
+
+    @abc.abstractmethod
+    async def delete_many(self, room_ids: List[str]) -> None:
+        """删除若干房间的快照；不存在的忽略。"""
+
+    async def purge(self, max_age: float) -> int:
+        """删除超过 max_age 秒未更新的快照，返回删除数量。"""
+        return 0
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRoomStore(RoomStore):
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, float]] = {}
+
+    async def save_many(self, items: List[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        for room_id, blob in items:
+            self._data[room_id] = (blob, now)
+
+    async def load(self, room_id: str) -> Optional[bytes]:
+        entry = self._data.get(room_id)
+        return entry[0] if entry else None
+
+    async def delete_many(self, room_ids: List[str]) -> None:
+        for room_id in room_ids:
+            self._data.pop(room_id, None)
+
+    async def purge(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        stale = [rid for rid, (_, ts) in self._data.items() if ts < cutoff]
+        await self.delete_many(stale)
+        return len(stale)
+
+
+class SqliteRoomStore(RoomStore):
+    def __init__(self, db_path: str = "database.db"):
+        self.db_path = db_path
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self) -> aiosqlite.Connection:
+        if self._connection is not None:
+            return self._connection
+        # 后台写入与 join_room 的恢复可能同时首次连接，只建一个连接
+        async with self._connect_lock:
+            if self._connection is not None:
+                return self._connection
+            conn = await aiosqlite.connect(self.db_path)
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute("PRAGMA synchronous = NORMAL")
+            await conn.execute("PRAGMA busy_timeout = 5000")
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS room_snapshots (
+                    room_id TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            await conn.commit()
+            self._connection = conn
+        return self._connection
+
+    async def save_many(self, items: List[Tuple[str, bytes]]) -> None:
+        conn = await self.connect()
+        now = time.time()
+        await conn.executemany(
+            "INSERT OR REPLACE INTO room_snapshots (room_id, data, updated_at) VALUES (?, ?, ?)",
+            [(room_id, blob, now) for room_id, blob in items],
+        )
+        await conn.commit()
+
+    async def load(self, room_id: str) -> Optional[bytes]:
+        conn = await self.connect()
+        cursor = await conn.execute("SELECT data FROM room_snapshots WHERE room_id = ?", (room_id,))
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def delete_many(self, room_ids: List[str]) -> None:
+        conn = await self.connect()
+        await conn.executemany("DELETE FROM room_snapshots WHERE room_id = ?", [(rid,) for rid in room_ids])
+        await conn.commit()
+
+    async def purge(self, max_age: float) -> int:
+        conn = await self.connect()
+        cursor = await conn.execute("DELETE FROM room_snapshots WHERE updated_at < ?", (time.time() - max_age,))
+        await conn.commit()
+        return cursor.rowcount
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+def store_from_env() -> Optional[RoomStore]:
+    kind = os.environ.get("MAHJONG_ROOM_STORE", "sqlite")
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return MemoryRoomStore()
+    if kind == "sqlite":
+        return SqliteRoomStore(os.environ.get("MAHJONG_ROOM_DB", "database.db"))
+    raise ValueError(f"unknown room store: {kind}")
+
+
+# ---------- 写入合并 ----------
+
+class RoomPersister:
+    """收集各房间的最新快照，由后台任务批量写入。"""
+
+    def __init__(self, store: Optional[RoomStore], ttl: float = 86400.0):
+        self.store = store
+        self.ttl = ttl
+        self._pending: Dict[str, Optional[bytes]] = {}  # room_id -> 快照；None 表示删除
+        self._keys: Dict[str, Any] = {}  # room_id -> 上次写入时的房间指纹
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def track(self, room_id: str, key: Any, snapshot: Callable[[], RoomSnapshot]) -> None:
+        """房间指纹 key 变化时登记写入；snapshot() 返回 RoomSnapshot。"""
+        if self.store is None or self._keys.get(room_id) == key:
+            return
+        self._keys[room_id] = key
+        snap = snapshot()
+        if snap.state is None or snap.state.ended:
+            self._pending[room_id] = None
+        else:
+            self._pending[room_id] = encode_snapshot(snap)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def forget(self, room_id: str) -> None:
+        """房间从内存中回收时调用；已写入的快照保留，以便之后恢复。"""
+        self._keys.pop(room_id, None)
+
+    async def load(self, room_id: str) -> Optional[RoomSnapshot]:
+        if self.store is None:
+            return None
+        blob = self._pending.get(room_id)
+        if blob is None:
+            if room_id in self._pending:
+                return None
+            blob = await self.store.load(room_id)
+        if blob is None:
+            return None
+        try:
+            return decode_snapshot(blob)
+        except Exception as e:  # 格式不兼容的旧快照直接丢弃
+            print(f"房间快照无法解析 room={room_id}: {e!r}")
+            return None
+
+    async def flush(self) -> None:
+        if self.store is None or not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        saves = [(rid, blob) for rid, blob in pending.items() if blob is not None]
+        deletes = [rid for rid, blob in pending.items() if blob is None]
+        try:
+            if saves:
+                await self.store.save_many(saves)
+            if deletes:
+                await self.store.delete_many(deletes)
+        except Exception as e:
+            print(f"房间快照写入失败: {e!r}")
+            # 未被更新的快照放回，下次重试
+            for rid, blob in pending.items():
+                self._pending.setdefault(rid, blob)
+
+    def start(self) -> None:
+        if self.store is not None and self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+        if self.store is not None:
+            await self.store.close()
+
+    async def _writer(self) -> None:
+        if self.store is not None:
+            try:
+                purged = await self.store.purge(self.ttl)
+                if purged:
+                    print(f"清理过期房间快照: {purged}")
+            except Exception as e:
+                print(f"房间快照清理失败: {e!r}")
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+
+
+room_persister = RoomPersister(store_from_env(), ttl=float(os.environ.get("MAHJONG_ROOM_STORE_TTL", 86400)))
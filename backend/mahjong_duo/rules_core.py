@@ -2,9 +2,10 @@
 # 最小规则核心：仅 3 门(万/条/筒) 1-9，共 27 种牌，每种 4 张 => 108 张
 # 胡牌：经典四面子一将（允许暗顺子）。实现 碰/杠/胡 的基本合法性检查。
 from __future__ import annotations
-from dataclasses import dataclass, replace
+from dataclasses import InitVar, dataclass, field, replace
 from typing import List, Tuple, Optional, Dict, Any, NamedTuple
 import random
+import struct
 from functools import lru_cache
 
 # 牌编码：0..26，0-8=万1..9，9-17=条1..9，18-26=筒1..9
@@ -25,6 +26,35 @@ def build_wall(seed: int) -> List[int]:
     rng.shuffle(wall)
     return wall
 
+# Zobrist 哈希分量：(座位, 牌, 张数) / (座位, 副露类型, 牌) / 牌墙剩余张数 / 轮到谁。
+# 牌墙由 build_wall(seed) 唯一确定，故以 (seed, 剩余张数) 代表牌墙位置。
+# 状态哈希为全部分量异或，摸/打等转移只需异或进出的分量即可 O(1) 更新。
+MELD_KINDS = ("pong", "kong_exposed", "kong_concealed", "kong_added")
+_MELD_KIND_INDEX = {k: i for i, k in enumerate(MELD_KINDS)}
+
+_zobrist_rng = random.Random(0x6D6A5A0B)
+# 张数为 0 的分量取 0，这样全量计算只需遍历手中出现的牌
+ZOBRIST_HAND = tuple(
+    tuple((0,) + tuple(_zobrist_rng.getrandbits(64) for _ in range(COPIES_PER_TILE)) for _ in range(TILE_TYPES))
+    for _ in range(2)
+)
+ZOBRIST_MELD = tuple(
+    tuple(tuple(_zobrist_rng.getrandbits(64) for _ in range(TILE_TYPES)) for _ in MELD_KINDS)
+    for _ in range(2)
+)
+ZOBRIST_WALL = tuple(_zobrist_rng.getrandbits(64) for _ in range(TOTAL_TILES + 1))
+ZOBRIST_TURN = (_zobrist_rng.getrandbits(64), _zobrist_rng.getrandbits(64))
+del _zobrist_rng
+
+_MASK64 = (1 << 64) - 1
+
+def _zobrist_seed(seed: int) -> int:
+    # splitmix64：把任意 seed 打散成 64 位
+    z = (seed + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
 @dataclass(frozen=True)
 class Meld:
     kind: str            # "pong" | "kong_exposed" | "kong_concealed" | "kong_added"
@@ -49,6 +79,173 @@ class GameState:
     pending_kong_draw: Optional[int] = None          # 谁需要补杠牌
     last_draw_info: Optional[Tuple[int, str]] = None # (seat, draw_type)
     pending_rob_kong: Optional[Tuple[int, int]] = None  # (kong_owner, tile)
+    # Zobrist 哈希，不能直接传入。构造时全量计算；状态转移已增量算好新值时经 known_zobrist 传入。
+    # known_zobrist 是 InitVar，dataclasses.replace 不会沿用旧值，未传时总是重算，不会留下过期哈希。
+    zobrist: int = field(init=False, compare=False, repr=False)
+    known_zobrist: InitVar[Optional[int]] = None
+
+    def __post_init__(self, known_zobrist: Optional[int]):
+        object.__setattr__(self, "zobrist", zobrist_hash(self) if known_zobrist is None else known_zobrist)
+
+    def to_bytes(self) -> bytes:
+        """紧凑二进制快照，格式见 _SNAPSHOT_HEADER。"""
+        return state_to_bytes(self)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "GameState":
+        return state_from_bytes(blob)
+
+# 二进制快照（小端）：
+#   头部  版本 | 标志 | seed(i64) | zobrist(u64) | step_no(u32) | turn |
+#         last_discard(座位, 牌) | pending_kong_draw | last_draw_info(座位, 类型) |
+#         pending_rob_kong(座位, 牌) | 牌墙剩余张数
+#   牌墙  仅当与 build_wall(seed) 的尾部不一致时才逐张写出（标志位 _SNAP_WALL）
+#   玩家  ×2：手牌/副露/弃牌张数，手牌，弃牌，每个副露为 (类型, 张数, 牌...)
+# 牌、座位、张数都不超过 255，各占一字节；可选字段以 0xFF 表示 None。
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<BBqQIBBBBBBBBB")
+_SNAPSHOT_PLAYER = struct.Struct("<BBB")
+_SNAP_STARTED, _SNAP_ENDED, _SNAP_WALL = 1, 2, 4
+_NONE = 0xFF
+DRAW_TYPES = ("normal", "kong")
+_DRAW_TYPE_INDEX = {k: i for i, k in enumerate(DRAW_TYPES)}
+
+@lru_cache(maxsize=256)
+def _seed_wall(seed: int) -> Tuple[int, ...]:
+    return tuple(build_wall(seed))
+
+def state_to_bytes(state: GameState) -> bytes:
+    wall = state.wall
+    n = len(wall)
+    flags = (_SNAP_STARTED if state.started else 0) | (_SNAP_ENDED if state.ended else 0)
+    if wall != _seed_wall(state.seed)[TOTAL_TILES - n:]:
+        flags |= _SNAP_WALL
+    ld = state.last_discard or (_NONE, _NONE)
+    di = state.last_draw_info
+    di = (di[0], _DRAW_TYPE_INDEX[di[1]]) if di is not None else (_NONE, _NONE)
+    rk = state.pending_rob_kong or (_NONE, _NONE)
+    pkd = state.pending_kong_draw
+    out = [_SNAPSHOT_HEADER.pack(
+        SNAPSHOT_VERSION, flags, state.seed, state.zobrist, state.step_no, state.turn,
+        ld[0], ld[1], _NONE if pkd is None else pkd, di[0], di[1], rk[0], rk[1], n,
+    )]
+    if flags & _SNAP_WALL:
+        out.append(bytes(wall))
+    for p in state.players:
+        out.append(_SNAPSHOT_PLAYER.pack(len(p.hand), len(p.melds), len(p.discards)))
+        out.append(bytes(p.hand))
+        out.append(bytes(p.discards))
+        for m in p.melds:
+            out.append(bytes((_MELD_KIND_INDEX[m.kind], len(m.tiles))))
+            out.append(bytes(m.tiles))
+    return b"".join(out)
+
+def _tiles(blob: bytes, pos: int, n: int, what: str) -> Tuple[int, ...]:
+    if pos + n > len(blob):
+        raise ValueError(f"truncated GameState snapshot: {what}")
+    tiles = tuple(blob[pos:pos + n])
+    if any(t >= TILE_TYPES for t in tiles):
+        raise ValueError(f"invalid tile in GameState snapshot: {what}")
+    return tiles
+
+def _opt_seat_tile(seat: int, tile: int, what: str) -> Optional[Tuple[int, int]]:
+    if seat == _NONE:
+        return None
+    if seat > 1 or tile >= TILE_TYPES:
+        raise ValueError(f"invalid {what} in GameState snapshot")
+    return seat, tile
+
+def state_from_bytes(blob: bytes) -> GameState:
+    """解析 state_to_bytes 的输出；截断、取值越界或哈希不符的数据抛出 ValueError。"""
+    if not blob or blob[0] != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported GameState snapshot version: {blob[0] if blob else None}")
+    if len(blob) < _SNAPSHOT_HEADER.size:
+        raise ValueError("truncated GameState snapshot: header")
+    (_, flags, seed, zobrist, step_no, turn, ld_seat, ld_tile, pkd,
+     di_seat, di_type, rk_seat, rk_tile, n) = _SNAPSHOT_HEADER.unpack_from(blob)
+    if flags & ~(_SNAP_STARTED | _SNAP_ENDED | _SNAP_WALL) or turn > 1 or n > TOTAL_TILES:
+        raise ValueError("invalid GameState snapshot header")
+    if pkd != _NONE and pkd > 1:
+        raise ValueError("invalid pending_kong_draw in GameState snapshot")
+    if di_seat != _NONE and (di_seat > 1 or di_type >= len(DRAW_TYPES)):
+        raise ValueError("invalid last_draw_info in GameState snapshot")
+    last_discard = _opt_seat_tile(ld_seat, ld_tile, "last_discard")
+    pending_rob_kong = _opt_seat_tile(rk_seat, rk_tile, "pending_rob_kong")
+    pos = _SNAPSHOT_HEADER.size
+    if flags & _SNAP_WALL:
+        wall = _tiles(blob, pos, n, "wall")
+        pos += n
+    else:
+        wall = _seed_wall(seed)[TOTAL_TILES - n:]
+    players = []
+    for seat in range(2):
+        if pos + _SNAPSHOT_PLAYER.size > len(blob):
+            raise ValueError(f"truncated GameState snapshot: player {seat}")
+        nh, nm, nd = _SNAPSHOT_PLAYER.unpack_from(blob, pos)
+        pos += _SNAPSHOT_PLAYER.size
+        hand = _tiles(blob, pos, nh, "hand")
+        pos += nh
+        discards = _tiles(blob, pos, nd, "discards")
+        pos += nd
+        melds = []
+        for _ in range(nm):
+            if pos + 2 > len(blob):
+                raise ValueError("truncated GameState snapshot: meld")
+            kind, k = blob[pos], blob[pos + 1]
+            if kind >= len(MELD_KINDS) or k not in (3, 4):
+                raise ValueError("invalid meld in GameState snapshot")
+            melds.append(Meld(MELD_KINDS[kind], _tiles(blob, pos + 2, k, "meld")))
+            pos += 2 + k
+        players.append(PlayerState(hand, tuple(melds), discards))
+    if pos != len(blob):
+        raise ValueError("trailing bytes in GameState snapshot")
+    # 不沿用快照里的哈希：按解析出的局面重算，并与记录值核对以发现损坏
+    state = GameState(
+        seed=seed,
+        wall=wall,
+        players=tuple(players),
+        turn=turn,
+        last_discard=last_discard,
+        step_no=step_no,
+        started=bool(flags & _SNAP_STARTED),
+        ended=bool(flags & _SNAP_ENDED),
+        pending_kong_draw=None if pkd == _NONE else pkd,
+        last_draw_info=None if di_seat == _NONE else (di_seat, DRAW_TYPES[di_type]),
+        pending_rob_kong=pending_rob_kong,
+    )
+    if state.zobrist != zobrist:
+        raise ValueError("GameState snapshot hash mismatch")
+    return state
+
+def zobrist_wall(seed: int, remaining: int) -> int:
+    return _zobrist_seed(seed) ^ ZOBRIST_WALL[remaining]
+
+def zobrist_player(seat: int, hand: Tuple[int, ...], melds: Tuple[Meld, ...]) -> int:
+    h = 0
+    table = ZOBRIST_HAND[seat]
+    for t, c in enumerate(counts_from_tiles(hand)):
+        if c:
+            h ^= table[t][c]
+    mtable = ZOBRIST_MELD[seat]
+    for m in melds:
+        h ^= mtable[_MELD_KIND_INDEX[m.kind]][m.tiles[0]]
+    return h
+
+def zobrist_hash(state: GameState) -> int:
+    """全量计算状态哈希（手牌张数、副露、牌墙位置、轮次）。"""
+    h = zobrist_wall(state.seed, len(state.wall)) ^ ZOBRIST_TURN[state.turn]
+    for seat, p in enumerate(state.players):
+        h ^= zobrist_player(seat, p.hand, p.melds)
+    return h
+
+def _zh_count(seat: int, tile: int, old: int, new: int) -> int:
+    return ZOBRIST_HAND[seat][tile][old] ^ ZOBRIST_HAND[seat][tile][new]
+
+def _zh_meld(seat: int, kind: str, tile: int) -> int:
+    return ZOBRIST_MELD[seat][_MELD_KIND_INDEX[kind]][tile]
+
+def _zh_turn(old: int, new: int) -> int:
+    return ZOBRIST_TURN[old] ^ ZOBRIST_TURN[new]
 
 def sort_hand(arr: List[int]) -> List[int]:
     return sorted(arr)
@@ -71,6 +268,25 @@ def counts_from_tiles(tiles: Tuple[int, ...]) -> Tuple[int, ...]:
     for t in tiles: c[t]+=1
     return tuple(c)
 
+# 对称规范化：三门花色可任意置换，单门内 1↔9 翻转后顺子仍是顺子，
+# 因此面子/将的构成在这 48 种变换下不变。手牌缓存先映射到规范形再查表，
+# 涉及具体牌的结果再用 transform 映射回原编号。
+def canonicalize_counts(counts: Tuple[int, ...]) -> Tuple[Tuple[int, ...], Tuple[Tuple[int, bool], ...]]:
+    """返回 (规范形张数, transform)；transform[i] = (原花色, 是否翻转)，即规范形第 i 门的来源。"""
+    blocks = []
+    for s in range(3):
+        b = counts[s*9:(s+1)*9]
+        r = b[::-1]
+        blocks.append((r, s, True) if r < b else (b, s, False))
+    blocks.sort()
+    canon = blocks[0][0] + blocks[1][0] + blocks[2][0]
+    return canon, ((blocks[0][1], blocks[0][2]), (blocks[1][1], blocks[1][2]), (blocks[2][1], blocks[2][2]))
+
+def canonical_tile_to_original(tile: int, transform: Tuple[Tuple[int, bool], ...]) -> int:
+    suit, flipped = transform[tile // 9]
+    r = tile % 9
+    return suit * 9 + (8 - r if flipped else r)
+
 def can_peng(hand: Tuple[int,...], tile: int) -> bool:
     return hand.count(tile) >= 2
 
@@ -109,7 +325,7 @@ def _try_meld_sequence(counts: List[int], i: int) -> bool:
             return True
     return False
 
-@lru_cache(maxsize=128)
+@lru_cache(maxsize=1 << 14)
 def _can_form_melds(counts: Tuple[int,...], need: int) -> bool:
     if need==0:
         return sum(counts)==0
@@ -138,7 +354,12 @@ def can_hu_four_plus_one(tiles: Tuple[int,...], melds: Tuple[Meld, ...] = ()) ->
     need = remaining // 3
     if len(melds) + need != 4:
         return False
-    c0 = counts_from_tiles(tiles)
+    canon, _ = canonicalize_counts(counts_from_tiles(tiles))
+    return _can_hu_counts(canon, need)
+
+@lru_cache(maxsize=1 << 14)
+def _can_hu_counts(c0: Tuple[int, ...], need: int) -> bool:
+    # c0 为规范形：同一对称类的手牌共享此缓存及其下 _can_form_melds 的缓存
     for i in range(TILE_TYPES):
         if c0[i] >= 2:
             arr = list(c0); arr[i]-=2
@@ -146,6 +367,11 @@ def can_hu_four_plus_one(tiles: Tuple[int,...], melds: Tuple[Meld, ...] = ()) ->
                 return True
     return False
 
+def _with_player(players: Tuple[PlayerState, PlayerState], seat: int, player: PlayerState) -> Tuple[PlayerState, PlayerState]:
+    return (player, players[1]) if seat == 0 else (players[0], player)
+
+# draw / discard 是最热的两个状态转移：直接构造 GameState，省掉 dataclasses.replace 的逐字段反射。
+# GameState 新增字段时这里要同步补上（test_game_actions 会检查）。
 def draw(state: GameState, seat: int) -> Tuple[GameState, Optional[int]]:
     if not state.wall:
         return state, None
@@ -155,41 +381,56 @@ def draw(state: GameState, seat: int) -> Tuple[GameState, Optional[int]]:
     pending_kong_draw = state.pending_kong_draw
     if pending_kong_draw == seat:
         pending_kong_draw = None
-    ps = list(state.players)
-    phand = list(ps[seat].hand); phand.append(tile); phand = sort_hand(phand)
-    ps[seat] = replace(ps[seat], hand=tuple(phand))
-    st = replace(
-        state,
+    me = state.players[seat]
+    c = me.hand.count(tile)
+    players = _with_player(state.players, seat, PlayerState(tuple(sort_hand([*me.hand, tile])), me.melds, me.discards))
+    zh = (state.zobrist ^ ZOBRIST_WALL[len(state.wall)] ^ ZOBRIST_WALL[len(new_wall)]
+          ^ _zh_count(seat, tile, c, c+1))
+    st = GameState(
+        seed=state.seed,
         wall=new_wall,
-        players=tuple(ps),
+        players=players,
+        turn=state.turn,
         last_discard=None,
         step_no=state.step_no+1,
+        started=state.started,
+        ended=state.ended,
         pending_kong_draw=pending_kong_draw,
         last_draw_info=(seat, draw_type),
+        pending_rob_kong=state.pending_rob_kong,
+        known_zobrist=zh,
     )
     return st, tile
 
 def discard(state: GameState, seat: int, tile: int) -> GameState:
-    ps = list(state.players)
-    hand = list(ps[seat].hand)
+    me = state.players[seat]
+    hand = list(me.hand)
     if tile not in hand:
         raise ValueError("ILLEGAL_DISCARD")
+    c = hand.count(tile)
     hand.remove(tile)
-    disc = list(ps[seat].discards); disc.append(tile)
-    ps[seat] = replace(ps[seat], hand=tuple(hand), discards=tuple(disc))
-    st = replace(
-        state,
-        players=tuple(ps),
+    players = _with_player(state.players, seat, PlayerState(tuple(hand), me.melds, me.discards + (tile,)))
+    zh = state.zobrist ^ _zh_count(seat, tile, c, c-1) ^ _zh_turn(state.turn, 1-seat)
+    st = GameState(
+        seed=state.seed,
+        wall=state.wall,
+        players=players,
+        turn=1-seat,
         last_discard=(seat, tile),
         step_no=state.step_no+1,
-        turn=1-seat,
+        started=state.started,
+        ended=state.ended,
+        pending_kong_draw=state.pending_kong_draw,
         last_draw_info=None,
+        pending_rob_kong=state.pending_rob_kong,
+        known_zobrist=zh,
     )
     return st
 
 def claim_peng(state: GameState, claimer: int, from_seat: int, tile: int) -> GameState:
     hand = list(state.players[claimer].hand)
-    if hand.count(tile) < 2: raise ValueError("ILLEGAL_PENG")
+    c = hand.count(tile)
+    if c < 2: raise ValueError("ILLEGAL_PENG")
     # 移除两张
     hand.remove(tile); hand.remove(tile)
     melds = list(state.players[claimer].melds)
@@ -201,6 +442,8 @@ def claim_peng(state: GameState, claimer: int, from_seat: int, tile: int) -> Gam
     if opp_disc and opp_disc[-1] == tile:
         opp_disc.pop()
         ps[from_seat] = replace(ps[from_seat], discards=tuple(opp_disc))
+    zh = (state.zobrist ^ _zh_count(claimer, tile, c, c-2) ^ _zh_meld(claimer, "pong", tile)
+          ^ _zh_turn(state.turn, claimer))
     st = replace(
         state,
         players=tuple(ps),
@@ -208,12 +451,14 @@ def claim_peng(state: GameState, claimer: int, from_seat: int, tile: int) -> Gam
         turn=claimer,
         step_no=state.step_no+1,
         last_draw_info=None,
+        known_zobrist=zh,
     )
     return st
 
 def claim_kong_exposed(state: GameState, claimer: int, from_seat: int, tile: int) -> GameState:
     hand = list(state.players[claimer].hand)
-    if hand.count(tile) < 3: raise ValueError("ILLEGAL_KONG_EXPOSED")
+    c = hand.count(tile)
+    if c < 3: raise ValueError("ILLEGAL_KONG_EXPOSED")
     hand.remove(tile); hand.remove(tile); hand.remove(tile)
     melds = list(state.players[claimer].melds)
     melds.append(Meld("kong_exposed", (tile, tile, tile, tile)))
@@ -223,6 +468,8 @@ def claim_kong_exposed(state: GameState, claimer: int, from_seat: int, tile: int
     if opp_disc and opp_disc[-1] == tile:
         opp_disc.pop()
         ps[from_seat] = replace(ps[from_seat], discards=tuple(opp_disc))
+    zh = (state.zobrist ^ _zh_count(claimer, tile, c, c-3) ^ _zh_meld(claimer, "kong_exposed", tile)
+          ^ _zh_turn(state.turn, claimer))
     st = replace(
         state,
         players=tuple(ps),
@@ -231,6 +478,7 @@ def claim_kong_exposed(state: GameState, claimer: int, from_seat: int, tile: int
         step_no=state.step_no+1,
         pending_kong_draw=claimer,
         last_draw_info=None,
+        known_zobrist=zh,
     )
     return st
 
@@ -242,12 +490,14 @@ def kong_concealed(state: GameState, seat: int, tile: int) -> GameState:
     melds.append(Meld("kong_concealed", (tile, tile, tile, tile)))
     ps = list(state.players)
     ps[seat] = replace(ps[seat], hand=tuple(sort_hand(hand)), melds=tuple(melds))
+    zh = state.zobrist ^ _zh_count(seat, tile, 4, 0) ^ _zh_meld(seat, "kong_concealed", tile)
     st = replace(
         state,
         players=tuple(ps),
         step_no=state.step_no+1,
         pending_kong_draw=seat,
         last_draw_info=None,
+        known_zobrist=zh,
     )
     return st
 
@@ -265,14 +515,18 @@ def kong_added(state: GameState, seat: int, tile: int) -> GameState:
         else:
             new_melds.append(m)
     if not upgraded: raise ValueError("NO_PONG_TO_UPGRADE")
+    c = hand.count(tile)
     hand.remove(tile)
     ps[seat] = replace(ps[seat], hand=tuple(sort_hand(hand)), melds=tuple(new_melds))
+    zh = (state.zobrist ^ _zh_count(seat, tile, c, c-1)
+          ^ _zh_meld(seat, "pong", tile) ^ _zh_meld(seat, "kong_added", tile))
     return replace(
         state,
         players=tuple(ps),
         step_no=state.step_no+1,
         pending_kong_draw=seat,
         last_draw_info=None,
+        known_zobrist=zh,
     )
 
 
@@ -311,6 +565,7 @@ def prepare_added_kong(state: GameState, seat: int, tile: int) -> AddedKongResul
             state,
             pending_rob_kong=(seat, tile),
             turn=robber,
+            known_zobrist=state.zobrist ^ _zh_turn(state.turn, robber),
         )
         return AddedKongResult(st, True)
 
@@ -328,15 +583,20 @@ def resolve_rob_kong_hu(state: GameState, robber: int, tile: Optional[int] = Non
 
     st = state
     players = list(st.players)
+    zh = st.zobrist ^ _zh_turn(st.turn, robber)
 
     owner_player = players[kong_owner]
     owner_hand = list(owner_player.hand)
     if win_tile in owner_hand:
+        c = owner_hand.count(win_tile)
         owner_hand.remove(win_tile)
         players[kong_owner] = replace(owner_player, hand=tuple(owner_hand))
+        zh ^= _zh_count(kong_owner, win_tile, c, c-1)
 
     winner_player = players[robber]
     winner_hand = list(winner_player.hand)
+    c = winner_hand.count(win_tile)
+    zh ^= _zh_count(robber, win_tile, c, c+1)
     winner_hand.append(win_tile)
     winner_hand = sort_hand(winner_hand)
     players[robber] = replace(winner_player, hand=tuple(winner_hand))
@@ -350,6 +610,7 @@ def resolve_rob_kong_hu(state: GameState, robber: int, tile: Optional[int] = Non
         last_discard=None,
         pending_kong_draw=None,
         last_draw_info=None,
+        known_zobrist=zh,
     )
 
     return RobKongHuResult(new_state, kong_owner, win_tile)
@@ -363,7 +624,12 @@ def resolve_rob_kong_pass(state: GameState, robber: int) -> RobKongPassResult:
     if robber != 1 - kong_owner:
         raise ValueError("NOT_ROBBER")
 
-    base_state = replace(state, pending_rob_kong=None, turn=kong_owner)
+    base_state = replace(
+        state,
+        pending_rob_kong=None,
+        turn=kong_owner,
+        known_zobrist=state.zobrist ^ _zh_turn(state.turn, kong_owner),
+    )
     try:
         new_state = kong_added(base_state, kong_owner, tile)
     except Exception:
@@ -419,6 +685,34 @@ def legal_choices(state: GameState, seat: int) -> List[Dict]:
     return choices
 
 
+def apply_action(state: GameState, seat: int, action: Dict) -> GameState:
+    """执行 legal_choices 给出的一项，返回新局面（模拟、测试与基准共用）。
+    胡牌只标记结束（抢杠胡除外，它还要把杠牌移入胡牌方手中），不结算。"""
+    kind = action["type"]
+    if kind == "draw":
+        return draw(state, seat)[0]
+    if kind == "discard":
+        return discard(state, seat, action["tile"])
+    if kind == "peng":
+        return claim_peng(state, seat, 1 - seat, action["tile"])
+    if kind == "kong":
+        style = action.get("style")
+        if style == "exposed":
+            return claim_kong_exposed(state, seat, 1 - seat, action["tile"])
+        if style == "concealed":
+            return kong_concealed(state, seat, action["tile"])
+        return prepare_added_kong(state, seat, action["tile"]).state
+    if kind == "pass":
+        if state.pending_rob_kong is not None:
+            return resolve_rob_kong_pass(state, seat).state
+        return replace(state, last_discard=None)
+    if kind == "hu":
+        if action.get("style") == "rob":
+            return resolve_rob_kong_hu(state, seat, action["tile"]).state
+        return replace(state, ended=True)
+    raise ValueError(f"unknown action: {kind}")
+
+
 # 番数计算相关函数
 
 def check_yakuman(hand: Tuple[int, ...], melds: Tuple[Meld, ...], reason: str) -> int:
@@ -468,7 +762,7 @@ def _melds_from_exposed(melds: Tuple[Meld, ...]) -> List[DecompMeld]:
     return out
 
 
-@lru_cache(maxsize=None)
+@lru_cache(maxsize=1 << 14)
 def _decompose_tiles_all(counts: Tuple[int, ...], melds_left: int, pair_used: bool
     ) -> Tuple[Tuple[Tuple[str, int], ...], ...]:
 
@@ -525,6 +819,24 @@ def _decompose_tiles_all(counts: Tuple[int, ...], melds_left: int, pair_used: bo
     return tuple(res_set)
 
 
+def decompose_tiles_canonical(counts: Tuple[int, ...], melds_left: int, pair_used: bool
+    ) -> Tuple[Tuple[Tuple[str, int], ...], ...]:
+    """_decompose_tiles_all 的规范化入口：在规范形上查缓存，再把方案中的牌映射回原编号。"""
+    canon, transform = canonicalize_counts(counts)
+    plans = _decompose_tiles_all(canon, melds_left, pair_used)
+    if all(s == i and not flipped for i, (s, flipped) in enumerate(transform)):
+        return plans
+    out = []
+    for plan in plans:
+        mapped = []
+        for kind, i in plan:
+            # 翻转的花色里顺子 (i, i+1, i+2) 的起点变为原编号中的 i+2
+            start = canonical_tile_to_original(i + 2 if kind == 's' and transform[i // 9][1] else i, transform)
+            mapped.append((kind, start))
+        out.append(tuple(sorted(mapped)))
+    return tuple(out)
+
+
 # 把 ('t'/'s', idx) 方案转成 DecompMeld 列表（concealed=True）
 def _expand_plan_to_melds(plan: Tuple[Tuple[str, int], ...]) -> List[DecompMeld]:
     out: List[DecompMeld] = []
@@ -554,7 +866,7 @@ def decompose_final_all(hand: Tuple[int, ...], melds: Tuple[Meld, ...]) -> List[
     counts = counts_from_tiles(hand)
 
     # 生成所有“手内面子”方案（每个方案是若干 ('t'/'s', idx) 组成的元组，已去重）
-    plans = _decompose_tiles_all(tuple(counts), need_from_hand, False)
+    plans = decompose_tiles_canonical(tuple(counts), need_from_hand, False)
     if not plans:
         # 特例：若副露已达4个，手牌只需是“将”（多种将的选择都对应相同的面子解）
         return [exposed] if len(exposed) == 4 else []
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+多进程房间分片：每个房间固定由一个进程（分片）负责。
+
+房间、连接都保存在进程内存里，同一房间的两名玩家必须连到同一个进程。
+分片模式下每个分片是一个单 worker 的 gunicorn 实例、监听各自的端口（见 scripts/serve.sh），
+room_id 经稳定哈希（CRC32，与进程、Python 版本无关）映射到分片：
+
+- GET /api/route?room_id=xxx 返回该房间所在分片，客户端可直接连过去；
+- 连错分片时 join_room 回复 {"type": "redirect", "room_id", "shard", "port", "url"}，
+  客户端改连到目标分片后重新认证并加入；
+- 登录 token 需跨进程验证，分片模式默认使用 sqlite token 存储（见 token_store.py）。
+
+环境变量：
+    MAHJONG_SHARD_COUNT      分片数（默认 1，即不分片）
+    MAHJONG_SHARD_INDEX      本进程的分片编号，0 起
+    MAHJONG_SHARD_BASE_PORT  分片 i 监听 BASE_PORT + i
+    MAHJONG_SHARD_URLS       可选，逗号分隔的各分片 websocket 地址（经反向代理对外时使用），优先于端口
+"""
+import os
+import zlib
+from typing import Any, Dict, List, Optional
+
+from mahjong_duo import metrics
+
+redirects = metrics.LabeledCounter(
+    "mahjong_shard_redirects_total", "join_room requests redirected to another shard, by target shard.", label="shard")
+
+
+def shard_for(room_id: str, count: int) -> int:
+    return zlib.crc32(room_id.encode("utf-8")) % count if count > 1 else 0
+
+
+class ShardMap:
+    def __init__(self, index: int = 0, count: int = 1, base_port: Optional[int] = None,
+                 urls: Optional[List[str]] = None):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"bad shard index {index} for {count} shards")
+        if urls and len(urls) != count:
+            raise ValueError(f"MAHJONG_SHARD_URLS has {len(urls)} entries for {count} shards")
+        self.index = index
+        self.count = count
+        self.base_port = base_port
+        self.urls = urls or []
+
+    @classmethod
+    def from_env(cls) -> "ShardMap":
+        base_port = os.environ.get("MAHJONG_SHARD_BASE_PORT")
+        urls = [u.strip() for u in os.environ.get("MAHJONG_SHARD_URLS", "").split(",") if u.strip()]
+        return cls(
+            index=int(os.environ.get("MAHJONG_SHARD_INDEX", 0)),
+            count=int(os.environ.get("MAHJONG_SHARD_COUNT", 1)),
+            base_port=int(base_port) if base_port else None,
+            urls=urls,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 1
+
+    def shard_for(self, room_id: str) -> int:
+        return shard_for(room_id, self.count)
+
+    def owns(self, room_id: str) -> bool:
+        return self.shard_for(room_id) == self.index
+
+    def locate(self, room_id: str) -> Dict[str, Any]:
+        shard = self.shard_for(room_id)
+        return {
+            "room_id": room_id,
+            "shard": shard,
+            "port": self.base_port + shard if self.base_port is not None else None,
+            "url": self.urls[shard] if self.urls else None,
+        }
+
+    def redirect(self, room_id: str) -> Dict[str, Any]:
+        target = self.locate(room_id)
+        redirects.inc(str(target["shard"]))
+        return {"type": "redirect", **target}
+
+
+shards = ShardMap.from_env()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+增量局面同步（sync_delta）。
+
+客户端发送 {"type": "sync_mode", "mode": "delta"} 后启用；之后服务器不再每步重发完整的
+sync_hand / sync_view，而是相对客户端最后确认（sync_ack）的视图发送变化：
+
+    {"type": "sync_delta", "seq": 42, "base": 40, "changes": [
+        {"op": "append", "field": "discards_opp", "at": 7, "items": [13]},
+        {"op": "set", "field": "hand", "value": [...]},
+    ]}
+
+- append：把列表截断到 at 后追加 items（对局中牌河、副露绝大多数时候只增不减）；
+- set   ：整体替换字段；
+两种操作都是幂等的，客户端按收到顺序套用即可，不要求 base 与自己当前视图一致。
+客户端处理后回 {"type": "sync_ack", "seq": 42}，服务器把该视图作为后续增量的基准。
+完整快照（sync_view，带 seq）只在启用时、新开局和断线重连时发送；客户端长期不 ack、
+未确认视图超过 MAX_PENDING_VIEWS 份时也改发完整快照，重新建立基准。
+"""
+from typing import Any, Dict, List, Optional
+
+# 顺序即二进制线协议中的字段编号（见 wire.py），只能在末尾追加
+VIEW_FIELDS = ("hand", "melds_self", "melds_opp", "discards_self", "discards_opp", "opponent")
+SYNC_OPS = ("append", "set")
+# 只会在末尾增减的列表字段
+APPEND_FIELDS = ("melds_self", "melds_opp", "discards_self", "discards_opp")
+
+# 未确认的视图最多保留几份；再多就改发完整快照
+MAX_PENDING_VIEWS = 16
+
+
+def diff_view(base: Dict[str, Any], view: Dict[str, Any]) -> List[Dict[str, Any]]:
+    changes = []
+    for field in VIEW_FIELDS:
+        old, new = base.get(field), view.get(field)
+        if old == new:
+            continue
+        if field in APPEND_FIELDS and isinstance(old, list) and isinstance(new, list):
+            at = 0
+            limit = min(len(old), len(new))
+            while at < limit and old[at] == new[at]:
+                at += 1
+            changes.append({"op": "append", "field": field, "at": at, "items": new[at:]})
+        else:
+            changes.append({"op": "set", "field": field, "value": new})
+    return changes
+
+
+def apply_delta(view: Dict[str, Any], changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """客户端侧的参考实现。"""
+    out = dict(view)
+    for ch in changes:
+        field = ch["field"]
+        if ch["op"] == "append":
+            out[field] = list(out.get(field) or [])[:ch["at"]] + list(ch["items"])
+        else:
+            out[field] = ch["value"]
+    return out
+
+
+class SyncTracker:
+    """单个连接的同步状态：已确认的基准视图与尚未确认的视图。"""
+
+    def __init__(self):
+        self.enabled = False
+        self.base: Optional[Dict[str, Any]] = None
+        self.base_seq: Optional[int] = None
+        self.pending: Dict[int, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        """下一次同步改发完整快照。"""
+        self.base = None
+        self.base_seq = None
+        self.pending.clear()
+
+    def snapshot(self, seq: int, view: Dict[str, Any]) -> None:
+        # 完整快照直接作为基准：客户端若没收到，必然已断线，重连时会再发快照
+        self.base = view
+        self.base_seq = seq
+        self.pending.clear()
+
+    def delta(self, seq: int, view: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """相对基准的 sync_delta；无变化时返回 None，未确认视图过多时返回完整的 sync_view。"""
+        changes = diff_view(self.base, view)
+        # 未确认的增量可能已改动过某字段，而该字段现在又回到基准值（如摸一张又打出同一张）：
+        # 仅相对基准做差会漏掉它，客户端会停留在中间状态，需显式整体替换
+        changed = {ch["field"] for ch in changes}
+        for field in VIEW_FIELDS:
+            if field not in changed and any(v.get(field) != self.base.get(field) for v in self.pending.values()):
+                changes.append({"op": "set", "field": field, "value": view.get(field)})
+        if not changes:
+            return None
+        if len(self.pending) >= MAX_PENDING_VIEWS:
+            # 丢掉未确认的视图会漏掉其中改过又改回的字段（见上），不能只裁掉最旧的几份：
+            # 直接发完整快照作为新基准
+            self.snapshot(seq, view)
+            return {"type": "sync_view", "seq": seq, **view}
+        self.pending[seq] = view
+        return {"type": "sync_delta", "seq": seq, "base": self.base_seq, "changes": changes}
+
+    def ack(self, seq: int) -> None:
+        view = self.pending.get(seq)
+        if view is None:
+            return
+        self.base = view
+        self.base_seq = seq
+        for s in [s for s in self.pending if s <= seq]:
+            del self.pending[s]
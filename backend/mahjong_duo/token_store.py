@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+登录 token 存储：带过期时间（TTL）与容量上限（LRU 淘汰）。
+
+- MemoryTokenStore：进程内 OrderedDict，只在签发它的 worker 内有效；
+- SqliteTokenStore：本机 SQLite 表，同一台机器上的所有 gunicorn worker 共享，多 worker 部署时使用。
+  表里只存 token 的 SHA-256，数据库文件泄露不会直接泄露可用的 token。
+
+过期为滑动窗口：每次验证成功都会续期；超过容量时淘汰最久未使用的 token。
+
+环境变量：
+    MAHJONG_TOKEN_STORE  memory | sqlite（默认 memory；MAHJONG_SHARD_COUNT > 1 时默认 sqlite）
+    MAHJONG_TOKEN_TTL    未使用多久后过期，秒（默认 7 天）
+    MAHJONG_TOKEN_MAX    最多保留的 token 数（默认 10000）
+    MAHJONG_TOKEN_DB     sqlite 后端的数据库文件（默认 database.db）
+"""
+import abc
+import asyncio
+import hashlib
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import aiosqlite
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_TOKENS = 10000
+
+
+class TokenStore(abc.ABC):
+    """接口：issue 签发、get 验证并续期、revoke 作废。"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.ttl = ttl
+        self.max_tokens = max(1, max_tokens)
+
+    @abc.abstractmethod
+    async def issue(self, info: Dict[str, Any]) -> str:
+        """签发新 token，返回明文 token。"""
+
+    @abc.abstractmethod
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """验证 token 并续期，返回签发时的 info；无效或已过期返回 None。"""
+
+    @abc.abstractmethod
+    async def revoke(self, token: str) -> None:
+        """作废 token；不存在的忽略。"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryTokenStore(TokenStore):
+    def __init__(self, ttl: float = DEFAULT_TTL, max_tokens: int = DEFAULT_MAX_TOKENS):
+        super().__init__(ttl, max_tokens)
+        # 按最近使用排序，队首最久未用；值为 (info, 过期时间)
+        self._tokens: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    async def issue(self, info: Dict[str, Any]) -> str:
+        token = secrets.token_urlsafe(32)
+        self._tokens[token] = (dict(info), time.monotonic() + self.ttl)
+        while len(self._tokens) > self.max_tokens:
+            self._tokens.popitem(last=False)
+        return token
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[1] <= now:
+            del self._tokens[token]
+            return None
+        self._tokens[token] = (entry[0], now + self.ttl)
+        self._tokens.move_to_end(token)
+        return dict(entry[0])
+
+    async def revoke(self, token: str) -> None:
+        self._tokens.pop(token, None)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SqliteTokenStore(TokenStore):
+    # 每签发这么多个 token 清理一次过期项并按容量淘汰
+    PURGE_EVERY = 64
+
+    def __init__(self, db_path: str = "database.db", ttl: float = DEFAULT_TTL,
+                 max_tokens: int = DEFAULT_MAX_TOKENS):
+        super().__init__(ttl, max_tokens)
+        self.db_path = db_path
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._issued = 0
+
+    async def connect(self) -> aiosqlite.Connection:
+        if self._connection is not None:
+            return self._connection
+        # 并发的首次请求只建一个连接，其余等它建好
+        async with self._connect_lock:
+            if self._connection is not None:
+                return self._connection
+            conn = await aiosqlite.connect(self.db_path)
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute("PRAGMA busy_timeout = 5000")  # 多个 worker 同时写时等待而不是报错
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS auth_tokens (
+                    token_hash TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    username TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires ON auth_tokens(expires_at)")
+            await conn.commit()
+            self._connection = conn
+        return self._connection
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def issue(self, info: Dict[str, Any]) -> str:
+        conn = await self.connect()
+        token = secrets.token_urlsafe(32)
+        # 跨进程共享，用墙上时钟
+        await conn.execute(
+            "INSERT INTO auth_tokens (token_hash, user_id, username, expires_at) VALUES (?, ?, ?, ?)",
+            (_digest(token), info.get("user_id"), info["username"], time.time() + self.ttl),
+        )
+        self._issued += 1
+        if self._issued % self.PURGE_EVERY == 0:
+            await self._purge(conn)
+        await conn.commit()
+        return token
+
+    async def _purge(self, conn: aiosqlite.Connection) -> None:
+        await conn.execute("DELETE FROM auth_tokens WHERE expires_at <= ?", (time.time(),))
+        # 滑动过期下 expires_at 越早即越久未用，按它淘汰就是 LRU
+        await conn.execute('''
+            DELETE FROM auth_tokens WHERE token_hash IN (
+                SELECT token_hash FROM auth_tokens ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_tokens,))
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        conn = await self.connect()
+        key = _digest(token)
+        now = time.time()
+        cursor = await conn.execute(
+            "SELECT user_id, username, expires_at FROM auth_tokens WHERE token_hash = ? AND expires_at > ?",
+            (key, now),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return None
+        # 剩余时间不足一半才续期，避免每次验证都写库
+        if row[2] - now < self.ttl / 2:
+            await conn.execute("UPDATE auth_tokens SET expires_at = ? WHERE token_hash = ?", (now + self.ttl, key))
+            await conn.commit()
+        return {"user_id": row[0], "username": row[1]}
+
+    async def revoke(self, token: str) -> None:
+        conn = await self.connect()
+        await conn.execute("DELETE FROM auth_tokens WHERE token_hash = ?", (_digest(token),))
+        await conn.commit()
+
+
+def from_env() -> TokenStore:
+    # 多分片时 token 必须能被其他进程验证
+    sharded = int(os.environ.get("MAHJONG_SHARD_COUNT", 1)) > 1
+    kind = os.environ.get("MAHJONG_TOKEN_STORE", "sqlite" if sharded else "memory")
+    ttl = float(os.environ.get("MAHJONG_TOKEN_TTL", DEFAULT_TTL))
+    max_tokens = int(os.environ.get("MAHJONG_TOKEN_MAX", DEFAULT_MAX_TOKENS))
+    if kind == "memory":
+        return MemoryTokenStore(ttl, max_tokens)
+    if kind == "sqlite":
+        return SqliteTokenStore(os.environ.get("MAHJONG_TOKEN_DB", "database.db"), ttl, max_tokens)
+    raise ValueError(f"unknown token store: {kind}")
+
+
+token_store = from_env()
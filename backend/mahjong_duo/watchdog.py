@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+事件循环卡顿监控。
+
+- 心跳协程每隔 interval 秒醒来一次，实际间隔与预期之差即事件循环延迟，写入直方图；
+- 采样线程发现心跳超过 threshold 未更新时，用 sys._current_frames() 抓取事件循环线程的调用栈，
+  从中找出正在处理的房间（栈上的 Room 实例 / room 变量）以及耗时所在的模块类别
+  （advisor / scoring / db / rules / app）；消息类型取自事件循环当前任务上下文中的
+  metrics.current_message_type（由 dispatch 的计时钩子设置）；
+- 卡顿结束后，心跳协程把总延迟与采样结果合并，写一条 JSON 结构化日志并计数。
+
+环境变量：
+    MAHJONG_WATCHDOG              设为 0 关闭（默认开启）
+    MAHJONG_LOOP_LAG_THRESHOLD_MS 卡顿阈值，毫秒（默认 200）
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from mahjong_duo import metrics
+
+logger = logging.getLogger("mahjong_duo.watchdog")
+
+loop_lag = metrics.LabeledHistogram(
+    "mahjong_event_loop_lag_seconds", "Event loop scheduling lag measured by the heartbeat.", label="pid")
+stalls = metrics.LabeledCounter(
+    "mahjong_event_loop_stalls_total", "Event loop stalls above the threshold, by category of the code running.", label="category")
+
+_PKG_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_STACK = 12
+
+
+def _category(filename: str, func: str) -> Optional[str]:
+    if "aiosqlite" in filename or filename.endswith("database.py"):
+        return "db"
+    if os.sep + "advisors" + os.sep in filename or filename.endswith("advisor_pool.py"):
+        return "advisor"
+    if filename.endswith("rules_core.py"):
+        if func in ("compute_score_summary", "decompose_final_all", "check_yakuman") or func.startswith(("is_", "count_")):
+            return "scoring"
+        return "rules"
+    if filename.startswith(_PKG_DIR):
+        return "app"
+    return None
+
+
+def describe_stack(frame, message_type: Optional[str] = None) -> Dict[str, Any]:
+    """从最内层帧往外走，提取类别、房间与精简调用栈（只保留本包及 aiosqlite 的帧）。"""
+    stack: List[str] = []
+    category = room = None
+    while frame is not None:
+        code = frame.f_code
+        cat = _category(code.co_filename, code.co_name)
+        if cat is not None:
+            # 取最外层的非 app 类别：advisor 内部调用的规则函数仍算 advisor
+            if cat != "app":
+                category = cat
+            if len(stack) < MAX_STACK:
+                stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno}:{code.co_name}")
+            if cat == "app" and room is None:
+                f_locals = frame.f_locals
+                obj = f_locals.get("self") if type(f_locals.get("self")).__name__ == "Room" else f_locals.get("room")
+                room = getattr(obj, "id", None)
+        frame = frame.f_back
+    if category is None and stack:
+        category = "app"
+    return {"category": category or "other", "room": room, "message_type": message_type, "stack": stack}
+
+
+def running_message_type(loop: asyncio.AbstractEventLoop) -> Optional[str]:
+    """事件循环正在执行的任务所处理的消息类型；可在其他线程调用。"""
+    task = asyncio.current_task(loop)
+    if task is None:
+        return None
+    return task.get_context().get(metrics.current_message_type)
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.05, threshold: float = 0.2):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop_thread_id: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_beat = time.monotonic()
+        self._sample: Optional[Dict[str, Any]] = None
+        self._sample_beat = 0.0  # 采样时看到的最后一次心跳，用来把采样对应到具体哪次卡顿
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._pid = str(os.getpid())
+
+    @classmethod
+    def from_env(cls) -> "LoopWatchdog":
+        return cls(threshold=int(os.environ.get("MAHJONG_LOOP_LAG_THRESHOLD_MS", 200)) / 1000)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._loop = asyncio.get_running_loop()
+        self._last_beat = time.monotonic()
+        self._pid = str(os.getpid())
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._sampler, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - t0 - self.interval)
+            prev_beat, self._last_beat = self._last_beat, now
+            loop_lag.observe(self._pid, lag)
+            if lag >= self.threshold:
+                self._report(lag, prev_beat)
+            elif self._sample is not None:
+                self._sample = None  # 未达阈值的短暂卡顿，丢弃采样
+
+    def _sampler(self) -> None:
+        # 每次卡顿只采样一次：心跳恢复后 _sample 被取走、重新允许采样
+        while not self._stop.wait(self.interval):
+            if self._sample is not None:
+                continue
+            if time.monotonic() - self._last_beat < self.threshold:
+                continue
+            beat = self._last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            try:
+                sample = describe_stack(frame, running_message_type(self._loop))
+            except Exception as e:  # 读取其他线程的帧属于尽力而为
+                sample = {"category": "other", "error": repr(e)}
+            self._sample_beat = beat
+            self._sample = sample
+
+    def _report(self, lag: float, prev_beat: float) -> None:
+        sample, self._sample = self._sample, None
+        if sample is None or self._sample_beat != prev_beat:
+            sample = {"category": "unknown"}
+        stalls.inc(sample.get("category", "unknown"))
+        logger.warning(json.dumps({"event": "loop_stall", "lag_ms": round(lag * 1000, 1), **sample}, ensure_ascii=False))
+
+
+watchdog = LoopWatchdog.from_env()
+
+
+def enabled() -> bool:
+    return os.environ.get("MAHJONG_WATCHDOG", "1") != "0"
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑二进制线协议（可选）。
+
+客户端发送 {"type": "wire", "format": "binary"} 协商后，下列高频消息改用 send_bytes 发送二进制帧，
+其余消息以及未协商的旧客户端仍使用 JSON 文本帧。
+
+所有整数为无符号小端；牌编号 0..26 占 1 字节，0xFF 表示“无 / 不可见”。
+
+    帧首字节   消息
+    0x01      event       ev_type, seat, tile, style, from
+    0x02      choices     n, n × (action, style, tile, from)
+    0x03      sync_hand   tiles
+    0x04      sync_view   u32 seq, hand, melds_self, melds_opp, discards_self, discards_opp, opponent
+    0x05      sync_delta  u32 seq, u32 base, n, n × change
+
+    tiles  : u8 个数 + 每张 1 字节
+    melds  : u8 个数 + 每个 (kind, tiles)
+    string : u8 字节数 + UTF-8
+    change : op(1=append, 2=set), field, append 时再跟 u8 at；随后是该字段类型的值
+    seq 缺省为 0xFFFFFFFF
+
+无法用上述结构表示的消息（出现未知字段或取值）pack 返回 None，调用方回退到 JSON。
+unpack 为客户端参考实现。
+"""
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+from mahjong_duo.rules_core import MELD_KINDS
+from mahjong_duo.sync import SYNC_OPS, VIEW_FIELDS
+
+WIRE_VERSION = 1
+NONE = 0xFF
+_NO_SEQ = 0xFFFFFFFF
+_U32 = struct.Struct("<I")
+
+MSG_EVENT, MSG_CHOICES, MSG_SYNC_HAND, MSG_SYNC_VIEW, MSG_SYNC_DELTA = 1, 2, 3, 4, 5
+
+EVENT_TYPES = ("draw", "discard", "pass", "peng", "kong", "rob_kong")
+ACTION_TYPES = ("draw", "discard", "peng", "kong", "hu", "pass")
+STYLES = (None, "concealed", "added", "exposed", "self", "ron", "rob")
+_MELD_FIELDS = ("melds_self", "melds_opp")
+
+_EVENT_CODE = {t: i + 1 for i, t in enumerate(EVENT_TYPES)}
+_ACTION_CODE = {t: i + 1 for i, t in enumerate(ACTION_TYPES)}
+_STYLE_CODE = {s: i for i, s in enumerate(STYLES)}
+_MELD_CODE = {k: i + 1 for i, k in enumerate(MELD_KINDS)}
+_FIELD_CODE = {f: i + 1 for i, f in enumerate(VIEW_FIELDS)}
+_OP_CODE = {op: i + 1 for i, op in enumerate(SYNC_OPS)}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _byte(v: Any) -> int:
+    if v is None:
+        return NONE
+    if not isinstance(v, int) or not 0 <= v < NONE:
+        raise _Unsupported(v)
+    return v
+
+
+def _code(table: Dict[Any, int], v: Any) -> int:
+    try:
+        return table[v]
+    except (KeyError, TypeError):
+        raise _Unsupported(v)
+
+
+def _check_keys(d: Dict[str, Any], allowed: Tuple[str, ...]) -> None:
+    if not isinstance(d, dict) or any(k not in allowed for k in d):
+        raise _Unsupported(d)
+
+
+def _tiles(out: bytearray, tiles: List[Optional[int]]) -> None:
+    out.append(_byte(len(tiles)))
+    out.extend(_byte(t) for t in tiles)
+
+
+def _melds(out: bytearray, melds: List[Dict[str, Any]]) -> None:
+    out.append(_byte(len(melds)))
+    for m in melds:
+        _check_keys(m, ("kind", "tiles"))
+        out.append(_code(_MELD_CODE, m["kind"]))
+        _tiles(out, m["tiles"])
+
+
+def _string(out: bytearray, s: Any) -> None:
+    if not isinstance(s, str):
+        raise _Unsupported(s)
+    raw = s.encode("utf-8")
+    out.append(_byte(len(raw)))
+    out.extend(raw)
+
+
+def _field_value(out: bytearray, field: str, value: Any) -> None:
+    if field in _MELD_FIELDS:
+        _melds(out, value)
+    elif field == "opponent":
+        _string(out, value)
+    else:
+        _tiles(out, value)
+
+
+def _seq(v: Any) -> bytes:
+    if v is None:
+        return _U32.pack(_NO_SEQ)
+    if not isinstance(v, int) or not 0 <= v < _NO_SEQ:
+        raise _Unsupported(v)
+    return _U32.pack(v)
+
+
+def _pack(data: Dict[str, Any]) -> bytes:
+    t = data.get("type")
+    out = bytearray()
+    if t == "event":
+        _check_keys(data, ("type", "ev"))
+        ev = data["ev"]
+        _check_keys(ev, ("type", "seat", "tile", "style", "from"))
+        out += bytes((MSG_EVENT, _code(_EVENT_CODE, ev.get("type")), _byte(ev.get("seat")),
+                      _byte(ev.get("tile")), _code(_STYLE_CODE, ev.get("style")), _byte(ev.get("from"))))
+    elif t == "choices":
+        _check_keys(data, ("type", "actions"))
+        actions = data["actions"]
+        out += bytes((MSG_CHOICES, _byte(len(actions))))
+        for a in actions:
+            _check_keys(a, ("type", "style", "tile", "from"))
+            out += bytes((_code(_ACTION_CODE, a.get("type")), _code(_STYLE_CODE, a.get("style")),
+                          _byte(a.get("tile")), _byte(a.get("from"))))
+    elif t == "sync_hand":
+        _check_keys(data, ("type", "hand"))
+        out.append(MSG_SYNC_HAND)
+        _tiles(out, data["hand"])
+    elif t == "sync_view":
+        _check_keys(data, ("type", "seq") + VIEW_FIELDS)
+        out.append(MSG_SYNC_VIEW)
+        out += _seq(data.get("seq"))
+        for field in VIEW_FIELDS:
+            _field_value(out, field, data.get(field, "" if field == "opponent" else []))
+    elif t == "sync_delta":
+        _check_keys(data, ("type", "seq", "base", "changes"))
+        out.append(MSG_SYNC_DELTA)
+        out += _seq(data["seq"]) + _seq(data.get("base"))
+        changes = data["changes"]
+        out.append(_byte(len(changes)))
+        for ch in changes:
+            op, field = ch.get("op"), ch.get("field")
+            out += bytes((_code(_OP_CODE, op), _code(_FIELD_CODE, field)))
+            if op == "append":
+                _check_keys(ch, ("op", "field", "at", "items"))
+                out.append(_byte(ch["at"]))
+                _field_value(out, field, ch["items"])
+            else:
+                _check_keys(ch, ("op", "field", "value"))
+                _field_value(out, field, ch["value"])
+    else:
+        raise _Unsupported(t)
+    return bytes(out)
+
+
+def pack(data: Dict[str, Any]) -> Optional[bytes]:
+    """编码为二进制帧；不支持的消息返回 None。"""
+    try:
+        return _pack(data)
+    except _Unsupported:
+        return None
+
+
+# ---------- 解码（客户端参考实现） ----------
+
+class _Reader:
+    def __init__(self, buf: bytes):
+        self.buf = buf
+        self.pos = 0
+
+    def u8(self) -> int:
+        v = self.buf[self.pos]
+        self.pos += 1
+        return v
+
+    def opt(self) -> Optional[int]:
+        v = self.u8()
+        return None if v == NONE else v
+
+    def u32(self) -> Optional[int]:
+        v = _U32.unpack_from(self.buf, self.pos)[0]
+        self.pos += 4
+        return None if v == _NO_SEQ else v
+
+    def tiles(self) -> List[Optional[int]]:
+        return [self.opt() for _ in range(self.u8())]
+
+    def melds(self) -> List[Dict[str, Any]]:
+        return [{"kind": MELD_KINDS[self.u8() - 1], "tiles": self.tiles()} for _ in range(self.u8())]
+
+    def string(self) -> str:
+        n = self.u8()
+        s = self.buf[self.pos:self.pos + n].decode("utf-8")
+        self.pos += n
+        return s
+
+    def field_value(self, field: str) -> Any:
+        if field in _MELD_FIELDS:
+            return self.melds()
+        if field == "opponent":
+            return self.string()
+        return self.tiles()
+
+
+def _drop_none(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in d.items() if v is not None}
+
+
+def unpack(buf: bytes) -> Dict[str, Any]:
+    r = _Reader(buf)
+    code = r.u8()
+    if code == MSG_EVENT:
+        ev = {"type": EVENT_TYPES[r.u8() - 1], "seat": r.opt(), "tile": r.opt(),
+              "style": STYLES[r.u8()], "from": r.opt()}
+        return {"type": "event", "ev": _drop_none(ev)}
+    if code == MSG_CHOICES:
+        actions = []
+        for _ in range(r.u8()):
+            a = {"type": ACTION_TYPES[r.u8() - 1], "style": STYLES[r.u8()], "tile": r.opt(), "from": r.opt()}
+            actions.append(_drop_none(a))
+        return {"type": "choices", "actions": actions}
+    if code == MSG_SYNC_HAND:
+        return {"type": "sync_hand", "hand": r.tiles()}
+    if code == MSG_SYNC_VIEW:
+        msg: Dict[str, Any] = {"type": "sync_view", "seq": r.u32()}
+        for field in VIEW_FIELDS:
+            msg[field] = r.field_value(field)
+        return _drop_none(msg)
+    if code == MSG_SYNC_DELTA:
+        msg = {"type": "sync_delta", "seq": r.u32(), "base": r.u32(), "changes": []}
+        for _ in range(r.u8()):
+            op, field = SYNC_OPS[r.u8() - 1], VIEW_FIELDS[r.u8() - 1]
+            if op == "append":
+                at = r.u8()
+                msg["changes"].append({"op": op, "field": field, "at": at, "items": r.field_value(field)})
+            else:
+                msg["changes"].append({"op": op, "field": field, "value": r.field_value(field)})
+        return msg
+    raise ValueError(f"unknown wire message code: {code}")
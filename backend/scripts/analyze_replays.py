@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+对局日志批量统计（日志格式见 mahjong_duo/replay.py）
+
+流式遍历目录下的全部 .mjlog，按块分发到进程池，每局用回放引擎重放后汇总：
+- 胜负方式（自摸 / 杠上开花 / 荣和 / 抢杠 / 流局 / 中止）与平均对局长度；
+- 胡牌番种出现频率与平均番数；
+- 可选：真人玩家每次决策与 advisor 建议的一致率（按摸牌后 / 对手出牌后分别统计）。
+
+内存占用与日志总量无关：文件路径边遍历边分块，同时在途的块数有上限，
+每个工作进程只回传该块的汇总计数。
+
+如何运行:
+python analyze_replays.py replays --workers 8
+python analyze_replays.py replays --advisor_sample 0.05 --output summary.json
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from mahjong_duo import replay
+from mahjong_duo.replay import GameLog, ReplayEngine
+from mahjong_duo.rules_core import compute_score_summary, legal_choices
+
+# 真人动作 -> 与 advisor 建议对比用的 (action, tile)
+_DECISION_OPS = {
+    replay.OP_DISCARD: "discard",
+    replay.OP_KONG_CONCEALED: "kong",
+    replay.OP_KONG_ADDED: "kong",
+    replay.OP_HU: "hu",
+    replay.OP_PENG: "peng",
+    replay.OP_KONG_EXPOSED: "kong",
+    replay.OP_PASS: "pass",
+}
+
+LENGTH_BUCKET = 20  # 对局长度直方图的桶宽（动作数）
+
+
+class Summary:
+    """可合并的汇总计数；工作进程各自累计一块，主进程逐块合并。"""
+
+    def __init__(self):
+        self.games = 0
+        self.actions = 0
+        self.steps = 0
+        self.reasons: Counter = Counter()
+        self.winners: Counter = Counter()
+        self.lengths: Counter = Counter()
+        self.fans: Counter = Counter()
+        self.fan_total = 0
+        self.wins = 0
+        self.decisions: Counter = Counter()
+        self.agreed: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def merge(self, other: "Summary") -> None:
+        self.games += other.games
+        self.actions += other.actions
+        self.steps += other.steps
+        self.fan_total += other.fan_total
+        self.wins += other.wins
+        for name in ("reasons", "winners", "lengths", "fans", "decisions", "agreed", "errors"):
+            getattr(self, name).update(getattr(other, name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        games = max(self.games, 1)
+        return {
+            "games": self.games,
+            "avg_actions": self.actions / games,
+            "avg_steps": self.steps / games,
+            "reasons": dict(self.reasons.most_common()),
+            "winners": {str(k): v for k, v in sorted(self.winners.items())},
+            "length_histogram": {f"{k}-{k + LENGTH_BUCKET - 1}": v for k, v in sorted(self.lengths.items())},
+            "fans": {name: {"count": n, "per_win": n / max(self.wins, 1)} for name, n in self.fans.most_common()},
+            "avg_fan_total": self.fan_total / max(self.wins, 1),
+            "advisor_agreement": {
+                phase: {"decisions": n, "agreed": self.agreed[phase], "rate": self.agreed[phase] / n}
+                for phase, n in sorted(self.decisions.items())
+            },
+            "errors": dict(self.errors),
+        }
+
+
+def _end_reason(engine: ReplayEngine, op: int, seat: int) -> Tuple[Optional[int], str]:
+    """在终局动作执行前判断胜负方式，返回 (胡牌方, reason)。"""
+    if op == replay.OP_ROB_KONG_HU:
+        return seat, "rob_kong"
+    if op == replay.OP_HU:
+        if engine.last_discard is not None and engine.last_discard[0] != seat:
+            return seat, "ron"
+        draw_info = engine.last_draw_info
+        if draw_info is not None and draw_info[0] == seat and draw_info[1] == "kong":
+            return seat, "zimo_kong"
+        return seat, "zimo"
+    return None, "wall" if engine.ptr >= len(engine.wall) else "abort"
+
+
+def _advisor_decision(engine: ReplayEngine, seat: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """若当前是该座位的有效决策点，返回 (phase, advisor 建议)。"""
+    from mahjong_duo.advisors.advisor import advise_on_draw, advise_on_opponent_discard
+
+    if engine.pending_rob_kong is not None or engine.turn != seat:
+        return None
+    state = engine.state()
+    if len(legal_choices(state, seat)) <= 1:
+        return None
+    if state.last_discard is not None:
+        if state.last_discard[0] == seat:
+            return None
+        return "opponent_discard", advise_on_opponent_discard(state, seat) or {}
+    if len(state.players[seat].hand) % 3 == 2:
+        return "draw", advise_on_draw(state, seat) or {}
+    return None
+
+
+def _agrees(advice: Dict[str, Any], action: str, tile: Optional[int]) -> bool:
+    if (advice.get("action") or "pass") != action:
+        return False
+    if action in ("hu", "pass"):
+        return True
+    return advice.get("tile") is None or advice.get("tile") == tile
+
+
+def analyze_log(log: GameLog, summary: Summary, with_advisor: bool) -> None:
+    engine = ReplayEngine(log.initial_state())
+    humans = {s for s in (0, 1) if s != log.ai_seat}
+    winner: Optional[int] = None
+    reason = "unfinished"
+    for op, seat, tile in log.actions:
+        if with_advisor and seat in humans and op in _DECISION_OPS:
+            decision = _advisor_decision(engine, seat)
+            if decision is not None:
+                phase, advice = decision
+                summary.decisions[phase] += 1
+                if _agrees(advice, _DECISION_OPS[op], None if op in (replay.OP_HU, replay.OP_PASS) else tile):
+                    summary.agreed[phase] += 1
+        if op in (replay.OP_HU, replay.OP_ROB_KONG_HU, replay.OP_END):
+            winner, reason = _end_reason(engine, op, seat)
+        engine.apply(op, seat, tile)
+
+    summary.games += 1
+    summary.actions += len(log.actions)
+    summary.steps += engine.step_no
+    summary.reasons[reason] += 1
+    summary.lengths[len(log.actions) // LENGTH_BUCKET * LENGTH_BUCKET] += 1
+    if winner is not None:
+        summary.winners[winner] += 1
+        score = compute_score_summary(engine.state(), winner, reason)["players"][str(winner)]
+        summary.wins += 1
+        summary.fan_total += score["fan_total"]
+        summary.fans.update(item["name"] for item in score["fan_breakdown"])
+
+
+def analyze_chunk(paths: List[str], advisor_sample: float) -> Summary:
+    """工作进程入口：分析一块日志文件，只返回汇总。"""
+    summary = Summary()
+    for path in paths:
+        try:
+            with open(path, "rb") as fh:
+                log = GameLog.from_bytes(fh.read())
+            with_advisor = advisor_sample > 0 and random.Random(log.seed).random() < advisor_sample
+            analyze_log(log, summary, with_advisor)
+        except Exception as exc:
+            summary.errors[type(exc).__name__] += 1
+    return summary
+
+
+def iter_log_paths(root: str) -> Iterator[str]:
+    """递归遍历目录，边遍历边产出，不一次性列出全部文件。"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".mjlog"):
+                    yield entry.path
+
+
+def chunked(it: Iterator[str], size: int) -> Iterator[List[str]]:
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def print_tables(result: Dict[str, Any]) -> None:
+    print(f"\n对局数: {result['games']}  平均动作数: {result['avg_actions']:.1f}  平均步数: {result['avg_steps']:.1f}")
+    print("\n胜负方式:")
+    for reason, n in result["reasons"].items():
+        print(f"  {reason:<12s}{n:>10d}  {n / max(result['games'], 1):7.2%}")
+    print("\n胡牌番种（每次胡牌出现次数）:")
+    for name, row in result["fans"].items():
+        print(f"  {name:<10s}{row['count']:>10d}  {row['per_win']:7.2%}")
+    print(f"  平均番数: {result['avg_fan_total']:.2f}")
+    print("\n对局长度（动作数）:")
+    for bucket, n in result["length_histogram"].items():
+        print(f"  {bucket:<10s}{n:>10d}")
+    if result["advisor_agreement"]:
+        print("\n真人决策与 advisor 一致率:")
+        for phase, row in result["advisor_agreement"].items():
+            print(f"  {phase:<18s}{row['agreed']:>8d}/{row['decisions']:<8d}{row['rate']:7.2%}")
+    if result["errors"]:
+        print(f"\n无法解析或重放的日志: {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate statistics over recorded game logs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("root", help="Directory containing .mjlog files (searched recursively).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Defaults to all CPU cores.")
+    parser.add_argument("--chunk_size", type=int, default=256, help="Log files per task.")
+    parser.add_argument("--advisor_sample", type=float, default=0.0,
+                        help="Fraction of games whose human decisions are compared with the advisor.")
+    parser.add_argument("--output", type=str, default=None, help="Write the summary as JSON to this path.")
+    args = parser.parse_args()
+
+    num_workers = args.workers or os.cpu_count() or 1
+    max_inflight = num_workers * 2  # 在途块数上限，保证内存占用恒定
+    chunks = chunked(iter_log_paths(args.root), args.chunk_size)
+    total = Summary()
+    start_time = time.time()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor, \
+            tqdm(desc="Analyzing games", unit="game") as pbar:
+        inflight = set()
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                inflight.add(executor.submit(analyze_chunk, chunk, args.advisor_sample))
+                if len(inflight) < max_inflight:
+                    continue
+            # 块已提交满（或已无新块）：等待完成的块并合并
+            while inflight and (chunk is None or len(inflight) >= max_inflight):
+                done, inflight = concurrent.futures.wait(inflight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    part = future.result()
+                    total.merge(part)
+                    pbar.update(part.games + sum(part.errors.values()))
+
+    result = total.to_dict()
+    print_tables(result)
+    print(f"\n耗时 {time.time() - start_time:.1f} 秒")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
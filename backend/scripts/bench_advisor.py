@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Advisor 评估基准
+
+在固定语料（见 bench_corpus.py，由种子确定性生成）上运行各 advisor 的入口函数，统计：
+- 每秒局面数、单次延迟分布（p50/p90/p99/max）
+- 与参考决策的一致率（参考为 --reference 指定的历史结果文件，或 --reference_advisor 模块；
+  后者本身不报告一致率，和自己比较恒为 1）
+- 峰值内存（tracemalloc，对每类前 --memory_sample 个局面单独跑一遍，避免干扰计时）
+
+结果以 JSON 输出，可在不同提交之间对比。
+
+如何运行:
+python bench_advisor.py --per_kind 1000 --output bench_advisor.json
+python bench_advisor.py --per_kind 1000 --reference bench_advisor.json   # 与上次结果对比一致率
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from tqdm import tqdm
+
+# 无论从哪个目录、以脚本还是 -m 方式运行，都能导入同目录的 bench_corpus 与上一级的 mahjong_duo
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _path in (_HERE, os.path.dirname(_HERE)):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from mahjong_duo import rules_core  # noqa: E402
+from bench_corpus import Position, build_advisor_corpus  # noqa: E402
+
+ENTRY_POINTS = {
+    "discard": "advise_on_discard",
+    "response": "advise_on_opponent_discard",
+    "kong": "advise_on_draw",
+}
+
+
+def decision_key(advice: Optional[Dict[str, Any]]) -> str:
+    """把建议压成可比较的短字符串，如 "discard:5" / "kong/concealed:3"。"""
+    if not advice:
+        return "none"
+    action = advice.get("action")
+    style = advice.get("style")
+    tile = advice.get("tile")
+    head = f"{action}/{style}" if style else str(action)
+    return f"{head}:{tile}" if tile is not None else head
+
+
+def _percentile(sorted_ns: List[int], q: float) -> float:
+    if not sorted_ns:
+        return 0.0
+    idx = min(len(sorted_ns) - 1, int(round(q * (len(sorted_ns) - 1))))
+    return sorted_ns[idx] / 1e6
+
+
+def reset_caches(module) -> None:
+    """保证每一遍都从冷缓存开始：advisor 自己的缓存（置换表、决策缓存等，见其 clear_caches），
+    以及 advisor 模块与规则层中所有 lru_cache。"""
+    clear = getattr(module, "clear_caches", None)
+    if clear is not None:
+        clear()
+    for mod in (module, rules_core):
+        for obj in vars(mod).values():
+            cache_clear = getattr(obj, "cache_clear", None)
+            if callable(cache_clear):
+                cache_clear()
+
+
+def run_timing(module, corpus: List[Position], desc: str) -> Dict[str, Any]:
+    reset_caches(module)
+    latencies: Dict[str, List[int]] = {k: [] for k in ENTRY_POINTS}
+    decisions: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    for pos in tqdm(corpus, desc=desc):
+        fn = getattr(module, ENTRY_POINTS[pos.kind])
+        t0 = time.perf_counter_ns()
+        try:
+            advice = fn(pos.state, pos.seat)
+        except Exception as e:
+            advice = None
+            errors[pos.pid] = repr(e)
+        latencies[pos.kind].append(time.perf_counter_ns() - t0)
+        decisions[pos.pid] = decision_key(advice)
+    stats = getattr(module, "transposition_stats", None)
+    return {
+        "latencies": latencies, "decisions": decisions, "errors": errors,
+        "tt": stats() if stats is not None else None,
+    }
+
+
+def run_memory(module, corpus: List[Position], sample: int) -> Dict[str, int]:
+    peaks: Dict[str, int] = {}
+    for kind, entry in ENTRY_POINTS.items():
+        fn = getattr(module, entry)
+        items = [p for p in corpus if p.kind == kind][:sample]
+        reset_caches(module)
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        for pos in items:
+            try:
+                fn(pos.state, pos.seat)
+            except Exception:
+                pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks[kind] = peak
+    return peaks
+
+
+def summarize(timing: Dict[str, Any], reference: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    out = {}
+    for kind, lat in timing["latencies"].items():
+        if not lat:
+            continue
+        total_s = sum(lat) / 1e9
+        s = sorted(lat)
+        entry = {
+            "entry_point": ENTRY_POINTS[kind],
+            "positions": len(lat),
+            "total_s": round(total_s, 4),
+            "positions_per_sec": round(len(lat) / total_s, 2) if total_s > 0 else None,
+            "latency_ms": {
+                "mean": round(total_s * 1e3 / len(lat), 4),
+                "p50": round(_percentile(s, 0.50), 4),
+                "p90": round(_percentile(s, 0.90), 4),
+                "p99": round(_percentile(s, 0.99), 4),
+                "max": round(s[-1] / 1e6, 4),
+            },
+            "errors": sum(1 for pid in timing["errors"] if pid.startswith(kind + "/")),
+        }
+        if reference:
+            pids = [pid for pid in timing["decisions"] if pid.startswith(kind + "/") and pid in reference]
+            agree = sum(1 for pid in pids if timing["decisions"][pid] == reference[pid])
+            entry["agreement"] = round(agree / len(pids), 4) if pids else None
+        out[kind] = entry
+    return out
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Advisor speed/quality benchmark over a fixed position corpus",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--advisors", nargs="+", default=["advisor", "advisor_random"], help="Advisor module names to benchmark.")
+    parser.add_argument("--per_kind", type=int, default=1000, help="Positions per decision kind (discard/response/kong).")
+    parser.add_argument("--base_seed", type=int, default=0, help="First game seed used to build the corpus.")
+    parser.add_argument("--reference", type=str, default=None, help="Previous result JSON; agreement is measured against its decisions.")
+    parser.add_argument("--reference_advisor", type=str, default="advisor", help="Advisor whose decisions are the reference when --reference is not given.")
+    parser.add_argument("--memory_sample", type=int, default=100, help="Positions per kind in the tracemalloc pass (0 disables).")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON result here (default: stdout).")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    corpus = build_advisor_corpus(args.per_kind, base_seed=args.base_seed)
+    corpus_s = time.time() - t0
+    counts = {k: sum(1 for p in corpus if p.kind == k) for k in ENTRY_POINTS}
+    print(f"Corpus: {counts} built in {corpus_s:.2f}s", file=sys.stderr)
+
+    prior: Dict[str, Any] = {}
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            prior = json.load(f)
+
+    advisors = list(args.advisors)
+    if not args.reference and args.reference_advisor not in advisors:
+        advisors.insert(0, args.reference_advisor)
+
+    timings = {}
+    for name in advisors:
+        module = importlib.import_module("mahjong_duo.advisors." + name)
+        timings[name] = run_timing(module, corpus, name)
+
+    results = {}
+    for name in args.advisors:
+        if args.reference:
+            reference = prior.get("decisions", {}).get(name)
+        elif name == args.reference_advisor:
+            reference = None  # 参考 advisor 与自己比较没有意义
+        else:
+            reference = timings[args.reference_advisor]["decisions"]
+        results[name] = summarize(timings[name], reference)
+        if timings[name]["tt"] is not None:
+            results[name]["transposition_table"] = timings[name]["tt"]
+        if args.memory_sample > 0:
+            module = importlib.import_module("mahjong_duo.advisors." + name)
+            for kind, peak in run_memory(module, corpus, args.memory_sample).items():
+                if kind in results[name]:
+                    results[name][kind]["peak_traced_bytes"] = peak
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "per_kind": args.per_kind,
+            "base_seed": args.base_seed,
+            "corpus": counts,
+            "reference": args.reference or args.reference_advisor,
+        },
+        "results": results,
+        "decisions": {name: timings[name]["decisions"] for name in args.advisors},
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
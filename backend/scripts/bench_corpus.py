@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的固定局面语料
+
+由种子确定性地生成：用带种子的随机策略（在 legal_choices 中挑选，偏好鸣牌、不主动和牌）
+把对局走完，沿途记录局面。同样的参数在任何提交上都会生成完全相同的语料，
+因此各次基准结果可以直接对比。
+"""
+import random
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from mahjong_duo.rules_core import GameState, apply_action, init_game, legal_choices
+
+CORPUS_SEED = 20240601
+
+
+class Step(NamedTuple):
+    state: GameState   # 行动前的局面
+    seat: int
+    action: Dict       # legal_choices 中被选中的一项
+    choices: List[Dict]
+
+
+class Position(NamedTuple):
+    pid: str           # 形如 "discard/123"，跨提交稳定
+    kind: str          # "discard" | "response" | "kong"
+    state: GameState
+    seat: int
+
+
+def _pick(rng: random.Random, choices: List[Dict], allow_hu: bool) -> Optional[Dict]:
+    if allow_hu:
+        hu = next((c for c in choices if c["type"] == "hu"), None)
+        if hu is not None:
+            return hu
+    options = [c for c in choices if c["type"] != "hu"]
+    if not options:
+        return None
+    claims = [c for c in options if c["type"] in ("peng", "kong")]
+    if claims and rng.random() < 0.6:
+        return rng.choice(claims)
+    return rng.choice(options)
+
+
+def iter_game_steps(seed: int, *, allow_hu: bool = False) -> Iterator[Step]:
+    """确定性地走完一局，逐步产出 (局面, 座位, 动作)。allow_hu=False 时尽量把牌墙打完。"""
+    rng = random.Random(seed ^ CORPUS_SEED)
+    state = init_game(seed, first_turn=seed % 2)
+    while not state.ended:
+        seat = state.turn
+        choices = legal_choices(state, seat)
+        action = _pick(rng, choices, allow_hu)
+        if action is None:
+            return
+        if action["type"] == "draw" and not state.wall:
+            return
+        yield Step(state, seat, action, choices)
+        state = apply_action(state, seat, action)
+
+
+def build_advisor_corpus(per_kind: int, *, base_seed: int = 0, max_games: int = 100000) -> List[Position]:
+    """为 advisor 基准生成语料：每类最多 per_kind 个局面。
+    - discard ：14 张、无杠可选时的打牌决策（advise_on_discard）
+    - response：对手打出后的荣/碰/杠/过（advise_on_opponent_discard）
+    - kong    ：摸牌后可暗杠/加杠的决策（advise_on_draw）
+    """
+    buckets: Dict[str, List[Tuple[GameState, int]]] = {"discard": [], "response": [], "kong": []}
+    for seed in range(base_seed, base_seed + max_games):
+        if all(len(b) >= per_kind for b in buckets.values()):
+            break
+        for step in iter_game_steps(seed):
+            st, seat = step.state, step.seat
+            if st.pending_rob_kong is not None:
+                continue
+            if st.last_discard is not None:
+                kind = "response"
+            elif len(st.players[seat].hand) % 3 == 2:
+                has_kong = any(c["type"] == "kong" for c in step.choices)
+                kind = "kong" if has_kong else "discard"
+            else:
+                continue
+            if len(buckets[kind]) < per_kind:
+                buckets[kind].append((st, seat))
+    corpus = []
+    for kind, items in buckets.items():
+        for i, (st, seat) in enumerate(items):
+            corpus.append(Position(f"{kind}/{i}", kind, st, seat))
+    return corpus
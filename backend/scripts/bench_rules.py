@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+rules_core 热点微基准
+
+输入取自确定性模拟对局（见 bench_corpus.py），覆盖：
+- build_wall / init_game
+- draw / discard 状态转移
+- legal_choices
+- can_hu_four_plus_one（可胡 / 不可胡两组手牌）
+- decompose_final_all
+- compute_score_summary
+
+每项报告 ns/op 与每次调用新分配的内存块数（tracemalloc 快照统计的 count / 调用次数），结果可写成 JSON；
+指定 --baseline 时与之前的结果对比，任何一项变慢超过阈值即以非零状态退出。
+
+如何运行:
+python bench_rules.py --output bench_rules.json                 # 记录基线
+python bench_rules.py --baseline bench_rules.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# 无论从哪个目录、以脚本还是 -m 方式运行，都能导入同目录的 bench_corpus 与上一级的 mahjong_duo
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _path in (_HERE, os.path.dirname(_HERE)):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from mahjong_duo import rules_core  # noqa: E402
+from mahjong_duo.rules_core import (  # noqa: E402
+    build_wall,
+    init_game,
+    draw,
+    discard,
+    legal_choices,
+    can_hu_four_plus_one,
+    decompose_final_all,
+    compute_score_summary,
+)
+
+from bench_corpus import iter_game_steps  # noqa: E402
+
+
+class Bench(NamedTuple):
+    name: str
+    fn: Callable[[Any], Any]
+    inputs: List[Any]
+
+
+def capture_inputs(num_games: int, base_seed: int = 0) -> Dict[str, List[Any]]:
+    """从模拟对局中收集各热点函数的真实输入分布。"""
+    inputs: Dict[str, List[Any]] = {
+        "seeds": [], "draw": [], "discard": [], "legal_choices": [],
+        "hu_win": [], "hu_miss": [], "decompose": [], "score": [],
+    }
+    for seed in range(base_seed, base_seed + num_games):
+        inputs["seeds"].append(seed)
+        for step in iter_game_steps(seed, allow_hu=True):
+            st, seat, action = step.state, step.seat, step.action
+            inputs["legal_choices"].append((st, seat))
+            kind = action["type"]
+            if kind == "draw":
+                inputs["draw"].append((st, seat))
+            elif kind == "discard":
+                inputs["discard"].append((st, seat, action["tile"]))
+                me = st.players[seat]
+                if not can_hu_four_plus_one(me.hand, me.melds):
+                    inputs["hu_miss"].append((me.hand, me.melds))
+            elif kind == "hu" and action.get("style") in ("self", "ron"):
+                me = st.players[seat]
+                if action["style"] == "self":
+                    hand, reason = me.hand, "zimo"
+                else:
+                    hand, reason = tuple(sorted(me.hand + (action["tile"],))), "ron"
+                inputs["hu_win"].append((hand, me.melds))
+                inputs["decompose"].append((hand, me.melds))
+                inputs["score"].append((replace(st, ended=True), seat, reason))
+    return inputs
+
+
+def build_benches(inputs: Dict[str, List[Any]]) -> List[Bench]:
+    return [
+        Bench("build_wall", build_wall, inputs["seeds"]),
+        Bench("init_game", init_game, inputs["seeds"]),
+        Bench("draw", lambda a: draw(*a), inputs["draw"]),
+        Bench("discard", lambda a: discard(*a), inputs["discard"]),
+        Bench("legal_choices", lambda a: legal_choices(*a), inputs["legal_choices"]),
+        Bench("can_hu.win", lambda a: can_hu_four_plus_one(*a), inputs["hu_win"]),
+        Bench("can_hu.miss", lambda a: can_hu_four_plus_one(*a), inputs["hu_miss"]),
+        Bench("decompose_final_all", lambda a: decompose_final_all(*a), inputs["decompose"]),
+        Bench("compute_score_summary", lambda a: compute_score_summary(*a), inputs["score"]),
+    ]
+
+
+def clear_rules_caches() -> None:
+    for obj in vars(rules_core).values():
+        clear = getattr(obj, "cache_clear", None)
+        if clear is not None:
+            clear()
+
+
+def time_bench(bench: Bench, min_time: float, cold: bool) -> Dict[str, Any]:
+    fn, items = bench.fn, bench.inputs
+    # 预热一轮（冷缓存模式下每轮前都会清空 lru_cache）
+    for a in items:
+        fn(a)
+    total_ns, ops, rounds = 0, 0, 0
+    while total_ns < min_time * 1e9 or rounds < 3:
+        if cold:
+            clear_rules_caches()
+        t0 = time.perf_counter_ns()
+        for a in items:
+            fn(a)
+        total_ns += time.perf_counter_ns() - t0
+        ops += len(items)
+        rounds += 1
+    return {"ops": ops, "rounds": rounds, "ns_per_op": round(total_ns / ops, 1)}
+
+
+def measure_allocations(bench: Bench, sample: int, cold: bool) -> Dict[str, float]:
+    """逐次调用并保留结果，比较前后两次 tracemalloc 快照。
+
+    allocs_per_op 为每次调用新分配、调用结束时仍存活的内存块数（新局面、元组、列表等），
+    调用中途分配又释放的临时对象不计；alloc_bytes_per_op 为这些块的字节数。
+    """
+    items = bench.inputs[:sample]
+    if cold:
+        clear_rules_caches()
+    keep: List[Any] = [None] * len(items)  # 预先分配，避免列表扩容计入统计
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for i, a in enumerate(items):
+            keep[i] = bench.fn(a)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(own).compare_to(before.filter_traces(own), "filename")
+    n = max(len(items), 1)
+    return {
+        "allocs_per_op": round(sum(s.count_diff for s in stats) / n, 2),
+        "alloc_bytes_per_op": round(sum(s.size_diff for s in stats) / n, 1),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, mem_threshold: float) -> List[str]:
+    regressions = []
+    for name, cur in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        for metric, limit in (("ns_per_op", threshold), ("allocs_per_op", mem_threshold)):
+            a, b = old.get(metric), cur.get(metric)
+            if not a or b is None:
+                continue
+            ratio = b / a - 1
+            cur.setdefault("vs_baseline", {})[metric] = round(ratio, 4)
+            if limit is not None and ratio > limit:
+                regressions.append(f"{name}.{metric}: {a} -> {b} (+{ratio:.1%}, limit {limit:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks for rules_core hot paths",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--num_games", type=int, default=200, help="Simulated games used to capture inputs.")
+    parser.add_argument("--base_seed", type=int, default=0, help="First game seed.")
+    parser.add_argument("--min_time", type=float, default=0.5, help="Minimum timed seconds per benchmark.")
+    parser.add_argument("--cold", action="store_true", help="Clear rules_core lru caches before every round.")
+    parser.add_argument("--memory_sample", type=int, default=500, help="Calls per benchmark in the allocation-count pass (0 disables).")
+    parser.add_argument("--only", nargs="+", default=None, help="Run only these benchmarks.")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous result JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed ns/op slowdown vs baseline (fraction).")
+    parser.add_argument("--mem_threshold", type=float, default=0.25, help="Allowed allocations/op growth vs baseline (fraction).")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON result here.")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    inputs = capture_inputs(args.num_games, args.base_seed)
+    print(f"Captured inputs from {args.num_games} games in {time.time() - t0:.2f}s", file=sys.stderr)
+
+    results: Dict[str, Any] = {}
+    for bench in build_benches(inputs):
+        if args.only and bench.name not in args.only:
+            continue
+        if not bench.inputs:
+            print(f"{bench.name:<24} (no inputs captured, skipped)", file=sys.stderr)
+            continue
+        entry = {"inputs": len(bench.inputs)}
+        entry.update(time_bench(bench, args.min_time, args.cold))
+        if args.memory_sample > 0:
+            entry.update(measure_allocations(bench, args.memory_sample, args.cold))
+        results[bench.name] = entry
+        mem = f"{entry['allocs_per_op']:>8.2f} allocs/op" if "allocs_per_op" in entry else ""
+        print(f"{bench.name:<24}{entry['ns_per_op']:>12.1f} ns/op {mem}", file=sys.stderr)
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.mem_threshold)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "num_games": args.num_games,
+            "base_seed": args.base_seed,
+            "cold": args.cold,
+            "baseline": args.baseline,
+        },
+        "results": results,
+        "regressions": regressions,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+
+    if regressions:
+        print("\n" + "!"*20 + " PERFORMANCE REGRESSION " + "!"*20, file=sys.stderr)
+        for line in regressions:
+            print("  " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+开局定式库生成工具
+
+遍历一批种子的开局（双方各自的前几手），对每个 14 张手牌做花色/翻转对称规范化后，
+计算“向听数最小 → 有效张枚数最多 → 优先打边张”的推荐弃张，写入 advisor 使用的定式库文件。
+
+如何运行:
+python build_opening_book.py --num_seeds 20000 --plies 4
+
+参数:
+--num_seeds: 从种子 0 开始遍历的开局数 (默认: 5000)
+--sim_seed / --sim_games: 额外收录 simulation.py 在该基准种子下会用到的对局种子
+--plies: 每方收录的前几手 (默认: 4，与 advisor.OPENING_BOOK_PLIES 一致)
+--output: 输出文件 (默认: mahjong_duo/advisors/opening_book.bin)
+"""
+import argparse
+import concurrent.futures
+import os
+import random
+import time
+from dataclasses import replace
+from typing import List, Tuple
+
+from tqdm import tqdm
+
+from mahjong_duo.rules_core import (
+    COPIES_PER_TILE,
+    counts_from_tiles,
+    canonicalize_counts,
+    canonical_tile_to_original,
+    init_game,
+    draw,
+    discard,
+)
+from mahjong_duo.advisors.advisor import (
+    OPENING_BOOK_PLIES,
+    shanten_number,
+    effective_tiles_for_progress,
+)
+from mahjong_duo.advisors.opening_book import (
+    DEFAULT_BOOK_PATH,
+    write_book,
+)
+
+
+def _tiles_from_counts(counts) -> Tuple[int, ...]:
+    return tuple(t for t, c in enumerate(counts) for _ in range(c))
+
+
+def opening_discard_policy(hand: Tuple[int, ...]) -> int:
+    """与牌墙无关的开局弃张：向听数最小，其次有效张剩余枚数最多，再次优先打边张。"""
+    visible = counts_from_tiles(hand)
+    best = None
+    for t in sorted(set(hand)):
+        rest = list(hand); rest.remove(t); rest = tuple(rest)
+        stn = shanten_number(rest, ())
+        ukeire = sum(COPIES_PER_TILE - visible[e] for e in effective_tiles_for_progress(rest, ()))
+        edge = abs(t % 9 - 4)
+        key = (stn, -ukeire, -edge, t)
+        if best is None or key < best[0]:
+            best = (key, t)
+    return best[1]
+
+
+def book_entries_for_seed(seed: int, plies: int) -> List[Tuple[Tuple[int, ...], int]]:
+    """按定式自行对打（对手不鸣牌）走完前几手，收集每个 14 张局面的 (规范形, 规范形弃张)。"""
+    entries = []
+    for first_turn in (0, 1):
+        state = init_game(seed, first_turn=first_turn)
+        for _ in range(2 * plies):
+            seat = state.turn
+            state, tile = draw(state, seat)
+            if tile is None:
+                break
+            canon, transform = canonicalize_counts(counts_from_tiles(state.players[seat].hand))
+            canon_tile = opening_discard_policy(_tiles_from_counts(canon))
+            entries.append((canon, canon_tile))
+            state = discard(state, seat, canonical_tile_to_original(canon_tile, transform))
+            state = replace(state, last_discard=None)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the advisor opening book",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--num_seeds", type=int, default=5000, help="Number of seeds (from 0) whose openings are included.")
+    parser.add_argument("--sim_seed", type=int, default=None, help="Also include game seeds simulation.py derives from this base seed.")
+    parser.add_argument("--sim_games", type=int, default=100, help="Number of simulation game seeds to include with --sim_seed.")
+    parser.add_argument("--plies", type=int, default=OPENING_BOOK_PLIES, help="Discards per player to include.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes. Defaults to all available CPU cores.")
+    parser.add_argument("--output", type=str, default=str(DEFAULT_BOOK_PATH), help="Output book file.")
+    args = parser.parse_args()
+
+    seeds = list(range(args.num_seeds))
+    if args.sim_seed is not None:
+        rng = random.Random(args.sim_seed)
+        seeds += [rng.randint(0, 2**31 - 1) for _ in range(args.sim_games)]
+
+    num_workers = args.workers or os.cpu_count() or 1
+    print(f"Building opening book from {len(seeds)} seeds × {args.plies} plies using {num_workers} worker(s)...")
+    start_time = time.time()
+
+    entries = []
+    positions = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(book_entries_for_seed, seed, args.plies) for seed in seeds]
+        with tqdm(total=len(futures), desc="Analyzing openings") as pbar:
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                positions += len(result)
+                entries.extend(result)
+                pbar.update(1)
+
+    written = write_book(args.output, entries)
+    duration = time.time() - start_time
+    size = os.path.getsize(args.output)
+
+    print("\n" + "="*20 + " Opening Book " + "="*20)
+    print(f"Positions analyzed: {positions}")
+    print(f"Distinct canonical shapes written: {written}")
+    print(f"File: {args.output} ({size} bytes)")
+    print(f"Total time taken: {duration:.2f} seconds")
+    print("="*54)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+查看对局动作日志（replays/<room_id>-<seed>.mjlog，格式见 mahjong_duo/replay.py）
+
+默认列出全部动作并校验能否完整重放；指定 --step 时打印执行前 N 个动作后的局面。
+
+如何运行:
+python replay_game.py replays/room1-123456.mjlog
+python replay_game.py replays/room1-123456.mjlog --step 40
+"""
+import argparse
+import sys
+import time
+
+from mahjong_duo import replay
+from mahjong_duo.replay import OP_NAMES, GameLog
+from mahjong_duo.rules_core import tile_to_str
+
+# 这些操作码的牌字段无意义（摸到的牌由牌墙决定）
+_NO_TILE = {replay.OP_DRAW, replay.OP_ROB_KONG_PASS, replay.OP_PASS, replay.OP_HU, replay.OP_END}
+
+
+def _tiles(tiles) -> str:
+    return " ".join(tile_to_str(t) for t in tiles) or "-"
+
+
+def print_state(log: GameLog, step: int) -> None:
+    st = log.state_at(step)
+    print(f"step {step}/{len(log)}  turn={st.turn} wall={len(st.wall)} ended={st.ended}")
+    if st.last_discard is not None:
+        print(f"  last_discard: seat {st.last_discard[0]} {tile_to_str(st.last_discard[1])}")
+    if st.pending_rob_kong is not None:
+        print(f"  pending_rob_kong: seat {st.pending_rob_kong[0]} {tile_to_str(st.pending_rob_kong[1])}")
+    for seat, p in enumerate(st.players):
+        melds = ", ".join(f"{m.kind}:{tile_to_str(m.tiles[0])}" for m in p.melds) or "-"
+        print(f"  seat {seat}  hand: {_tiles(p.hand)}")
+        print(f"          melds: {melds}")
+        print(f"          discards: {_tiles(p.discards)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect and replay a game action log",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("path", help="Game log file (.mjlog).")
+    parser.add_argument("--step", type=int, default=None, help="Print the state after this many actions.")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as fh:
+        log = GameLog.from_bytes(fh.read())
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(log.started_at))
+    print(f"room={log.room_id} seed={log.seed} first_turn={log.first_turn} started={started}")
+    print(f"actions={len(log)} snapshots={len(log.snapshots)}")
+
+    if args.step is not None:
+        print_state(log, args.step)
+        return
+
+    for i, (op, seat, tile) in enumerate(log.actions, start=1):
+        print(f"{i:4d}  seat {seat}  {OP_NAMES[op]:<15s}{'' if op in _NO_TILE else tile_to_str(tile)}")
+    try:
+        t0 = time.perf_counter()
+        final = log.state_at()
+        elapsed = (time.perf_counter() - t0) * 1e3
+    except ValueError as e:
+        print(f"replay failed: {e}")
+        sys.exit(1)
+    print(f"replayed in {elapsed:.2f} ms, ended={final.ended}")
+
+
+if __name__ == "__main__":
+    main()
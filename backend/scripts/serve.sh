@@ -4,8 +4,11 @@
 APP_NAME="mahjong_duo.app:app"
 BIND_HOST="0.0.0.0"
 DEFAULT_PORT="8080"
+# 房间与连接保存在进程内存中，单个实例只能有一个 worker；多核部署请用分片模式（start-sharded）
 WORKERS=1
 WORKER_CLASS="uvicorn.workers.UvicornWorker"
+# 分片模式的分片数，默认等于 CPU 核数
+SHARDS=${SHARDS:-$(nproc 2>/dev/null || echo 1)}
 
 # --- 参数处理 ---
 ACTION=$1
@@ -15,10 +18,14 @@ PORT=${2:-$DEFAULT_PORT}
 
 # --- 动态配置（基于端口）---
 # 根据端口号生成唯一的 PID 和日志文件名，以支持多实例
-PID_FILE="gunicorn_${PORT}.pid"
-LOG_FILE="server_${PORT}.log" # 每个实例使用独立的日志文件
-# 组合成 Gunicorn 需要的绑定地址
-BIND_ADDR="${BIND_HOST}:${PORT}"
+use_port() {
+    PORT=$1
+    PID_FILE="gunicorn_${PORT}.pid"
+    LOG_FILE="server_${PORT}.log" # 每个实例使用独立的日志文件
+    # 组合成 Gunicorn 需要的绑定地址
+    BIND_ADDR="${BIND_HOST}:${PORT}"
+}
+use_port "$PORT"
 
 # --- 函数 ---
 
@@ -101,6 +108,28 @@ stop() {
     echo "Gunicorn on port ${PORT} stopped."
 }
 
+# 分片模式：启动 SHARDS 个实例，分片 i 监听 BASE_PORT + i，房间按 room_id 哈希固定到某个分片
+start_sharded() {
+    local base_port=$PORT
+    export MAHJONG_SHARD_COUNT=${SHARDS}
+    export MAHJONG_SHARD_BASE_PORT=${base_port}
+    # 登录 token 需要在各分片间共享
+    export MAHJONG_TOKEN_STORE=${MAHJONG_TOKEN_STORE:-sqlite}
+    for ((i = 0; i < SHARDS; i++)); do
+        use_port $((base_port + i))
+        export MAHJONG_SHARD_INDEX=$i
+        start
+    done
+}
+
+stop_sharded() {
+    local base_port=$PORT
+    for ((i = 0; i < SHARDS; i++)); do
+        use_port $((base_port + i))
+        stop
+    done
+}
+
 # 显示特定端口的服务状态
 status_port() {
     local target_port=$1
@@ -174,6 +203,12 @@ case "$ACTION" in
         sleep 1
         start
         ;;
+    start-sharded)
+        start_sharded
+        ;;
+    stop-sharded)
+        stop_sharded
+        ;;
     status)
         # 如果提供了第二个参数 (端口号)，则显示特定端口的状态
         if [ -n "$2" ]; then
@@ -186,8 +221,9 @@ case "$ACTION" in
     *)
         echo "A management script for Gunicorn."
         echo ""
-        echo "Usage: $0 {start|stop|restart|status} [port]"
+        echo "Usage: $0 {start|stop|restart|status|start-sharded|stop-sharded} [port]"
         echo "  port (optional): The port to use. Defaults to ${DEFAULT_PORT}."
+        echo "  start-sharded / stop-sharded: run SHARDS instances (default: CPU count) on port .. port+SHARDS-1."
         echo ""
         echo "Examples:"
         echo "  ./serve.sh start          # Start on default port ${DEFAULT_PORT}"
@@ -195,6 +231,7 @@ case "$ACTION" in
         echo "  ./serve.sh stop 9000      # Stop the instance on port 9000"
         echo "  ./serve.sh status         # Scan and list all running instances"
         echo "  ./serve.sh status 9000    # Show detailed status for port 9000"
+        echo "  SHARDS=4 ./serve.sh start-sharded 9000  # Start 4 shards on ports 9000-9003"
         exit 1
         ;;
 esac
@@ -0,0 +1,50 @@
+from mahjong_duo.advisors import advisor
+from mahjong_duo.advisors.advisor import OPENING_BOOK_PLIES, _decision_key, advise_on_draw
+from mahjong_duo.rules_core import draw, init_game, replace
+
+
+def _after_draw(seed=12345):
+    state = init_game(seed)
+    return draw(state, state.turn)[0]
+
+
+def test_decision_key_covers_opening_phase():
+    state = _after_draw()
+    seat = state.turn
+    p = state.players[seat]
+    late = replace(state, players=tuple(
+        replace(q, discards=(0,) * OPENING_BOOK_PLIES) if i == seat else q for i, q in enumerate(state.players)
+    ))
+    # 弃牌不计入哈希，但决定是否走定式
+    assert late.zobrist == state.zobrist
+    assert _decision_key(late, seat, "draw") != _decision_key(state, seat, "draw")
+    # 定式阶段内弃牌张数不同，决策相同，可以共享缓存
+    early = replace(state, players=tuple(
+        replace(q, discards=(0,)) if i == seat else q for i, q in enumerate(state.players)
+    ))
+    assert p.discards == () and _decision_key(early, seat, "draw") == _decision_key(state, seat, "draw")
+
+
+def test_cached_decision_is_not_shared():
+    advisor._tt.clear()
+    state = _after_draw(777)
+    first = advise_on_draw(state, state.turn)
+    first["detail"]["tampered"] = True
+    first["action"] = "tampered"
+    second = advise_on_draw(state, state.turn)
+    assert advisor._tt.hits > 0
+    assert second["action"] != "tampered"
+    assert "tampered" not in second["detail"]
+
+
+def test_clear_caches_empties_every_advisor_cache():
+    state = _after_draw(4242)
+    first = advise_on_draw(state, state.turn)
+    assert advisor.transposition_stats()["used"] > 0
+    assert advisor._min_adds_to_complete.cache_info().currsize > 0
+    advisor.clear_caches()
+    assert advisor.transposition_stats()["used"] == 0
+    assert advisor._counts.cache_info().currsize == 0
+    assert advisor._min_adds_to_complete.cache_info().currsize == 0
+    # 冷缓存重算的决策与缓存前一致
+    assert advise_on_draw(state, state.turn) == first
@@ -0,0 +1,67 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mahjong_duo.advisors import opening_book
+from mahjong_duo.advisors.opening_book import OpeningBook, get_default_book, write_book
+from mahjong_duo.rules_core import canonicalize_counts, counts_from_tiles
+
+HAND = (0, 1, 2, 3, 3, 10, 11, 12, 19, 20, 21, 25, 25, 26)
+
+
+@pytest.fixture
+def fresh_default(monkeypatch):
+    """清空懒加载状态，并把默认路径指向 path。"""
+    def use(path):
+        monkeypatch.setenv("MAHJONG_OPENING_BOOK", str(path))
+        monkeypatch.setattr(opening_book, "_book", None)
+        monkeypatch.setattr(opening_book, "_book_loaded", False)
+    return use
+
+
+def _write(path):
+    canon, _ = canonicalize_counts(counts_from_tiles(HAND))
+    discard = next(t for t, c in enumerate(canon) if c)
+    write_book(path, [(canon, discard)])
+
+
+def test_lookup_maps_back_to_original_suits(tmp_path):
+    _write(tmp_path / "book.bin")
+    book = OpeningBook(tmp_path / "book.bin")
+    try:
+        assert len(book) == 1
+        assert book.lookup(HAND) in HAND
+        assert book.lookup(tuple(t for t in HAND if t != 26) + (24,)) is None
+    finally:
+        book.close()
+
+
+def test_bad_file_logs_warning_and_returns_none(tmp_path, fresh_default, caplog, capsys):
+    path = tmp_path / "book.bin"
+    path.write_bytes(b"not a book at all")
+    fresh_default(path)
+    with caplog.at_level(logging.WARNING, logger="mahjong_duo.opening_book"):
+        assert get_default_book() is None
+        assert get_default_book() is None
+    assert len(caplog.records) == 1
+    assert capsys.readouterr().out == ""
+
+
+def test_concurrent_first_load_opens_once(tmp_path, fresh_default, monkeypatch):
+    path = tmp_path / "book.bin"
+    _write(path)
+    fresh_default(path)
+    opened = []
+
+    class CountingBook(OpeningBook):
+        def __init__(self, p):
+            opened.append(p)
+            super().__init__(p)
+
+    monkeypatch.setattr(opening_book, "OpeningBook", CountingBook)
+    with ThreadPoolExecutor(8) as pool:
+        books = list(pool.map(lambda _: get_default_book(), range(32)))
+    assert len(opened) == 1
+    assert all(b is books[0] for b in books)
+    books[0].close()
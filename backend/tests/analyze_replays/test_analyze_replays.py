@@ -0,0 +1,81 @@
+import pytest
+
+from mahjong_duo import replay
+
+pytest.importorskip("tqdm")
+from scripts.analyze_replays import Summary, analyze_chunk, chunked, iter_log_paths  # noqa: E402
+
+SEEDS = range(12)
+
+
+def _final_log(record_playout, seed):
+    """record_playout 的日志补上终局动作；返回 (日志, 胡牌方或 None)。"""
+    log, states = record_playout(seed)
+    op, seat, _ = log.actions[-1]
+    if op in (replay.OP_HU, replay.OP_ROB_KONG_HU):
+        return log, seat
+    log.actions.append((replay.OP_END, 0, 0))
+    return log, None
+
+
+@pytest.fixture
+def log_dir(tmp_path, record_playout):
+    """按种子写出日志（部分放在子目录里），外加一个损坏文件与一个无关文件。"""
+    winners = {}
+    for seed in SEEDS:
+        log, winner = _final_log(record_playout, seed)
+        winners[seed] = winner
+        directory = tmp_path / "sub" if seed % 3 == 0 else tmp_path
+        directory.mkdir(exist_ok=True)
+        (directory / f"room-{seed}.mjlog").write_bytes(log.to_bytes())
+    (tmp_path / "broken.mjlog").write_bytes(b"\x00\x01garbage")
+    (tmp_path / "notes.txt").write_bytes(b"")
+    return tmp_path, winners
+
+
+def test_iter_and_chunk_paths(log_dir):
+    root, _ = log_dir
+    paths = list(iter_log_paths(str(root)))
+    assert len(paths) == len(SEEDS) + 1
+    assert all(p.endswith(".mjlog") for p in paths)
+    chunks = list(chunked(iter(paths), 5))
+    assert [len(c) for c in chunks] == [5, 5, 3]
+    assert sum(chunks, []) == paths
+
+
+def test_summary_counts_match_the_games(log_dir):
+    root, winners = log_dir
+    summary = analyze_chunk(list(iter_log_paths(str(root))), advisor_sample=0.0)
+    assert summary.games == len(SEEDS)
+    assert dict(summary.errors) == {"ValueError": 1}
+    expected_wins = [w for w in winners.values() if w is not None]
+    assert 0 < len(expected_wins) < len(SEEDS)
+    assert summary.wins == len(expected_wins)
+    assert dict(summary.winners) == {s: expected_wins.count(s) for s in set(expected_wins)}
+    assert summary.reasons["wall"] + summary.reasons["abort"] == len(SEEDS) - len(expected_wins)
+    assert sum(summary.reasons.values()) == len(SEEDS)
+    assert sum(summary.lengths.values()) == len(SEEDS)
+    assert summary.fan_total > 0 and summary.fans
+    assert not summary.decisions
+
+
+def test_chunked_results_merge_to_the_whole(log_dir):
+    root, _ = log_dir
+    paths = list(iter_log_paths(str(root)))
+    whole = analyze_chunk(paths, 0.0)
+    merged = Summary()
+    for chunk in chunked(iter(paths), 4):
+        merged.merge(analyze_chunk(chunk, 0.0))
+    assert merged.to_dict() == whole.to_dict()
+
+
+def test_advisor_agreement_is_sampled(tmp_path, record_playout):
+    log, _ = record_playout(5)
+    log.actions = log.actions[:12]  # advisor 较慢，只看开局几手
+    log.ai_seat = 1
+    path = tmp_path / "room-5.mjlog"
+    path.write_bytes(log.to_bytes())
+    summary = analyze_chunk([str(path)], advisor_sample=1.0)
+    assert summary.games == 1 and not summary.errors and summary.reasons == {"unfinished": 1}
+    agreement = summary.to_dict()["advisor_agreement"]
+    assert agreement and all(0 <= row["agreed"] <= row["decisions"] for row in agreement.values())
@@ -0,0 +1,80 @@
+import random
+from typing import List, NamedTuple, Tuple
+
+import pytest
+
+from mahjong_duo import replay
+from mahjong_duo.replay import GameLog
+from mahjong_duo.rules_core import GameState, apply_action, init_game, legal_choices
+
+
+class Playout(NamedTuple):
+    states: List[GameState]            # states[i + 1] = apply_action(states[i], *steps[i])
+    steps: List[Tuple[int, dict]]      # (座位, legal_choices 中被选中的一项)
+
+
+def random_playout(seed: int, hu_rate: float = 0.0) -> Playout:
+    """按种子随机走完一局；有胡时以 hu_rate 的概率胡，否则在其余合法动作中随机选。"""
+    rng = random.Random(seed)
+    state = init_game(seed, first_turn=seed % 2)
+    states, steps = [state], []
+    while not state.ended and state.wall:
+        seat = state.turn
+        actions = legal_choices(state, seat)
+        hu = [a for a in actions if a["type"] == "hu"]
+        if hu and hu_rate and rng.random() < hu_rate:
+            action = hu[0]
+        else:
+            actions = [a for a in actions if a["type"] != "hu"]
+            if not actions:
+                break
+            action = rng.choice(actions)
+        state = apply_action(state, seat, action)
+        states.append(state)
+        steps.append((seat, action))
+    return Playout(states, steps)
+
+
+@pytest.fixture(name="random_playout")
+def random_playout_fixture():
+    return random_playout
+
+
+_KONG_OPS = {
+    "exposed": replay.OP_KONG_EXPOSED,
+    "concealed": replay.OP_KONG_CONCEALED,
+    "added": replay.OP_KONG_ADDED,
+}
+
+
+def log_entry(state, seat, action):
+    """legal_choices 中的一项对应的日志项。"""
+    kind = action["type"]
+    if kind == "draw":
+        return replay.OP_DRAW, seat, 0
+    if kind == "discard":
+        return replay.OP_DISCARD, seat, action["tile"]
+    if kind == "peng":
+        return replay.OP_PENG, seat, action["tile"]
+    if kind == "kong":
+        return _KONG_OPS[action.get("style", "added")], seat, action["tile"]
+    if kind == "pass":
+        if state.pending_rob_kong is not None:
+            return replay.OP_ROB_KONG_PASS, seat, 0
+        return replay.OP_PASS, seat, 0
+    if kind == "hu":
+        if action.get("style") == "rob":
+            return replay.OP_ROB_KONG_HU, seat, action["tile"]
+        return replay.OP_HU, seat, 0
+    raise AssertionError(kind)
+
+
+@pytest.fixture
+def record_playout(random_playout):
+    """随机对局，返回 (日志, 每一步的局面)；有胡则按一定概率胡。"""
+    def record(seed):
+        states, steps = random_playout(seed, hu_rate=0.3)
+        log = GameLog("room", seed, seed % 2)
+        log.actions = [log_entry(state, seat, action) for state, (seat, action) in zip(states, steps)]
+        return log, states
+    return record
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from mahjong_duo.database import Database, GameResult
+
+
+def _result(winner, loser, score_change):
+    now = time.time()
+    return GameResult(winner["id"], loser["id"], winner["username"], loser["username"], True,
+                      score_change, "zimo", 1, [{"name": "自摸", "fan": 1}], "room", 1, now - 60, now)
+
+
+async def _users(database, n):
+    for i in range(n):
+        await database.create_user(f"u{i}", "pw")
+    return [await database.get_user_by_username(f"u{i}") for i in range(n)]
+
+
+async def _game_rows(database):
+    async with database._read() as conn:
+        cursor = await conn.execute("SELECT id, winner_id, loser_id, score_change FROM games ORDER BY id")
+        games = await cursor.fetchall()
+        cursor = await conn.execute("SELECT game_id, player_id, score_change FROM game_records ORDER BY id")
+        records = await cursor.fetchall()
+    return games, records
+
+
+def test_batch_is_one_transaction(tmp_path):
+    async def main():
+        database = Database(str(tmp_path / "test.db"), readers=1)
+        await database.init_tables()
+        a, b = await _users(database, 2)
+        scores = await database.write_game_results([_result(a, b, 10), _result(b, a, 3)])
+        assert scores == {a["id"]: 1007, b["id"]: 993}
+        with pytest.raises(ValueError):
+            await database.write_game_results([_result(a, b, 5), _result(a, {"id": 999, "username": "x"}, 5)])
+        games, records = await _game_rows(database)
+        final = [(await database.get_user_by_username(u["username"]))["score"] for u in (a, b)]
+        await database.close()
+        return games, records, final
+
+    games, records, final = asyncio.run(main())
+    assert final == [1007, 993]  # 失败的一批整批回滚
+    assert len(games) == 2 and len(records) == 4
+    for game_id, winner_id, loser_id, change in games:
+        assert sorted(r[1:] for r in records if r[0] == game_id) == sorted([(winner_id, change), (loser_id, -change)])
+
+
+def test_concurrent_writers_get_distinct_game_ids(tmp_path):
+    # 两个进程各自一个 Database（各自的写连接），交替写入；对局 id 不能冲突
+    async def main():
+        path = str(tmp_path / "test.db")
+        first = Database(path, readers=0)
+        await first.init_tables()
+        users = await _users(first, 4)
+        second = Database(path, readers=0)
+        a, b, c, d = users
+        await asyncio.gather(*(
+            db.write_game_results([_result(w, l, 1), _result(w, l, 2)])
+            for _ in range(5)
+            for db, w, l in ((first, a, b), (second, c, d))
+        ))
+        games, records = await _game_rows(first)
+        await first.close()
+        await second.close()
+        return users, games, records
+
+    users, games, records = asyncio.run(main())
+    assert len(games) == 20 and len({g[0] for g in games}) == 20
+    by_game = {g[0]: g for g in games}
+    for game_id, player_id, change in records:
+        _, winner_id, loser_id, score_change = by_game[game_id]
+        assert (player_id, change) in ((winner_id, score_change), (loser_id, -score_change))
@@ -0,0 +1,119 @@
+import asyncio
+import sqlite3
+
+from mahjong_duo.database import SCHEMA_MIGRATIONS, Database
+
+# 迁移之前（user_version 0）的表结构：没有 vip_level、games、game_id、索引和 user_stats
+LEGACY_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    score INTEGER DEFAULT 1000,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE game_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_id INTEGER NOT NULL,
+    opponent_username TEXT NOT NULL,
+    game_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_first_hand BOOLEAN NOT NULL,
+    score_change INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    final_score INTEGER NOT NULL,
+    FOREIGN KEY (player_id) REFERENCES users(id)
+);
+"""
+
+# (player_id, 对手, 积分变化, 结果)
+LEGACY_RECORDS = [
+    (1, "bob", 8, "win"), (2, "alice", -8, "lose"),
+    (1, "bob", -16, "lose"), (2, "alice", 16, "win"),
+    (1, "bob", 0, "draw"), (2, "alice", 0, "draw"),
+    (1, "bob", 4, "win"), (2, "alice", -4, "lose"),
+]
+
+
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO users (username, password_hash, score) VALUES (?, 'x', ?)",
+                     [("alice", 996), ("bob", 1004), ("carol", 1000)])
+    conn.executemany(
+        "INSERT INTO game_records (player_id, opponent_username, is_first_hand, score_change, result, final_score)"
+        " VALUES (?, ?, 1, ?, ?, 0)",
+        LEGACY_RECORDS,
+    )
+    conn.commit()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    conn.close()
+
+
+def _schema(path):
+    conn = sqlite3.connect(path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        return version, indexes
+    finally:
+        conn.close()
+
+
+def test_migrates_legacy_database_and_backfills_stats(tmp_path, capsys):
+    path = str(tmp_path / "legacy.db")
+    _legacy_db(path)
+
+    async def run():
+        database = Database(path, readers=1)
+        await database.init_tables()
+        stats = [await database.get_user_stats(user_id) for user_id in (1, 2, 3)]
+        await database.close()
+        return stats
+
+    alice, bob, carol = asyncio.run(run())
+    assert alice == {"total_games": 4, "wins": 2, "losses": 1, "draws": 1, "win_rate": 50.0, "max_score_change": 16}
+    assert bob == {"total_games": 4, "wins": 1, "losses": 2, "draws": 1, "win_rate": 25.0, "max_score_change": 16}
+    assert carol["total_games"] == 0 and carol["win_rate"] == 0
+    version, indexes = _schema(path)
+    assert version == len(SCHEMA_MIGRATIONS)
+    assert {"idx_game_records_player_time", "idx_game_records_player_result"} <= indexes
+    out = capsys.readouterr().out
+    assert all(f"迁移到版本 {v}" in out for v in range(1, len(SCHEMA_MIGRATIONS) + 1))
+
+
+def test_concurrent_workers_migrate_once(tmp_path, capsys):
+    # 多个 worker 同时对旧库 init_tables：补列与迁移各只执行一次
+    path = str(tmp_path / "legacy.db")
+    _legacy_db(path)
+
+    async def run():
+        workers = [Database(path, readers=0) for _ in range(3)]
+        try:
+            await asyncio.gather(*(w.init_tables() for w in workers))
+            await workers[0].init_tables()  # 已是最新版本：不再执行
+            return await workers[1].get_user_stats(1)
+        finally:
+            for w in workers:
+                await w.close()
+
+    stats = asyncio.run(run())
+    assert stats["total_games"] == 4  # 回填没有重复执行
+    assert capsys.readouterr().out.count("迁移到版本 2") == 1
+
+
+def test_stats_update_incrementally_after_backfill(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    _legacy_db(path)
+
+    async def run():
+        database = Database(path, readers=1)
+        await database.init_tables()
+        await database.add_game_record(1, "carol", True, 30, "win", 1026)
+        await database.add_game_record(3, "alice", False, -30, "lose", 970)
+        stats = await database.get_user_stats(1), await database.get_user_stats(3)
+        await database.close()
+        return stats
+
+    alice, carol = asyncio.run(run())
+    assert (alice["total_games"], alice["wins"], alice["max_score_change"]) == (5, 3, 30)
+    assert (carol["total_games"], carol["losses"], carol["max_score_change"]) == (1, 1, 30)
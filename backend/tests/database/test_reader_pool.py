@@ -0,0 +1,88 @@
+import asyncio
+
+import aiosqlite
+import pytest
+
+from mahjong_duo.database import Database
+
+
+async def _open(path, readers):
+    database = Database(path, readers=readers)
+    await database.init_tables()
+    await database.create_user("alice", "pw", initial_score=1000)
+    return database
+
+
+def test_reads_spread_over_least_loaded_readers(tmp_path):
+    async def run():
+        database = await _open(str(tmp_path / "test.db"), readers=2)
+        try:
+            async with database._read() as first:
+                async with database._read() as second:
+                    assert first is not second
+                    assert database._reader_load == [1, 1]
+                    async with database._read() as third:
+                        assert third in (first, second)
+                assert database._reader_load == [1, 0]
+                async with database._read() as again:
+                    assert again is not first  # 空闲的读连接优先
+            assert database._reader_load == [0, 0]
+            assert database._connection not in database._readers
+        finally:
+            await database.close()
+    asyncio.run(run())
+
+
+def test_readers_are_query_only(tmp_path):
+    async def run():
+        database = await _open(str(tmp_path / "test.db"), readers=1)
+        try:
+            async with database._read() as conn:
+                with pytest.raises(aiosqlite.OperationalError):
+                    await conn.execute("UPDATE users SET score = 0")
+        finally:
+            await database.close()
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("path, readers", [("test.db", 0), (":memory:", 2)])
+def test_without_readers_reads_use_the_writer(tmp_path, path, readers):
+    async def run():
+        database = await _open(path if path == ":memory:" else str(tmp_path / path), readers)
+        try:
+            assert database._readers == []
+            async with database._read() as conn:
+                assert conn is database._connection
+            return (await database.get_user_by_username("alice"))["score"]
+        finally:
+            await database.close()
+    assert asyncio.run(run()) == 1000
+
+
+def test_reads_are_not_blocked_by_an_open_write_transaction(tmp_path):
+    async def run():
+        database = await _open(str(tmp_path / "test.db"), readers=2)
+        try:
+            async with database._write_lock:
+                await database._connection.execute("BEGIN IMMEDIATE")
+                await database._connection.execute("UPDATE users SET score = 5")
+                # WAL：读连接看到的是提交前的快照，不必等结算写完
+                user = await asyncio.wait_for(database.get_user_by_username("alice"), 2)
+                assert user["score"] == 1000
+                await database._connection.commit()
+            assert (await database.get_user_by_username("alice"))["score"] == 5
+            assert [row["score"] for row in await database.get_leaderboard(5)] == [5]
+        finally:
+            await database.close()
+    asyncio.run(run())
+
+
+def test_concurrent_first_use_connects_once(tmp_path):
+    async def run():
+        database = Database(str(tmp_path / "test.db"), readers=2)
+        try:
+            await asyncio.gather(*(database.connect() for _ in range(5)))
+            return len(database._readers)
+        finally:
+            await database.close()
+    assert asyncio.run(run()) == 2
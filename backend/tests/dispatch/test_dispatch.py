@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+
+from mahjong_duo.dispatch import (
+    Act,
+    Action,
+    BadMessage,
+    Dispatcher,
+    JoinRoom,
+    SyncAck,
+    match_choice,
+    parse_act,
+    parse_join_room,
+    parse_sync_ack,
+)
+
+
+class FakeSession:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, payload):
+        self.sent.append(payload)
+
+
+def _dispatcher(calls):
+    d = Dispatcher()
+
+    @d.route("join_room", parse_join_room)
+    async def join(sess, msg):
+        calls.append(("join", msg))
+
+    @d.route("act", parse_act)
+    async def act(sess, msg):
+        calls.append(("act", msg))
+
+    @d.route("ping")
+    async def ping(sess, msg):
+        calls.append(("ping", msg))
+
+    return d
+
+
+@pytest.mark.parametrize("text, detail", [
+    ("{", "bad json"),
+    ("[1, 2]", "bad message"),
+    ('{"type": "nope"}', "unknown message type"),
+    ('{"type": 3}', "unknown message type"),
+    ('{"room_id": "x"}', "unknown message type"),
+    ('{"type": "join_room", "room_id": 5}', "bad field: room_id"),
+    ('{"type": "act", "action": "peng"}', "bad action"),
+    ('{"type": "act", "action": {"type": "discard", "tile": "x"}}', "bad tile"),
+])
+def test_bad_messages_reply_error_without_calling_handler(text, detail):
+    calls = []
+    sess = FakeSession()
+    asyncio.run(_dispatcher(calls).dispatch(sess, text))
+    assert calls == []
+    assert sess.sent == [{"type": "error", "detail": detail}]
+
+
+def test_messages_are_parsed_once_into_typed_tuples():
+    calls = []
+    d = _dispatcher(calls)
+    sess = FakeSession()
+
+    async def main():
+        await d.dispatch(sess, json.dumps({"type": "join_room"}))
+        await d.dispatch(sess, json.dumps({"type": "act", "action": {"type": "discard", "tile": "7"}}))
+        await d.dispatch(sess, json.dumps({"type": "ping", "extra": 1}))
+
+    asyncio.run(main())
+    assert sess.sent == []
+    assert calls[0] == ("join", JoinRoom("join_room", "default"))
+    assert calls[1] == ("act", Act("act", Action("discard", None, 7)))
+    assert calls[2][0] == "ping" and calls[2][1].type == "ping"
+
+
+def test_parse_sync_ack_requires_int_seq():
+    assert parse_sync_ack({"type": "sync_ack", "seq": 4}) == SyncAck("sync_ack", 4)
+    with pytest.raises(BadMessage):
+        parse_sync_ack({"type": "sync_ack", "seq": "4"})
+
+
+def test_hooks_wrap_handler_in_order_and_can_short_circuit():
+    calls = []
+    d = _dispatcher(calls)
+
+    async def outer(sess, msg, call_next):
+        calls.append("outer-in")
+        await call_next()
+        calls.append("outer-out")
+
+    async def gate(sess, msg, call_next):
+        calls.append("gate")
+        if msg.type != "ping":
+            await call_next()
+
+    d.add_hook(outer)
+    d.add_hook(gate)
+    sess = FakeSession()
+
+    async def main():
+        await d.dispatch(sess, '{"type": "join_room", "room_id": "r"}')
+        await d.dispatch(sess, '{"type": "ping"}')
+
+    asyncio.run(main())
+    assert calls == ["outer-in", "gate", ("join", JoinRoom("join_room", "r")), "outer-out",
+                     "outer-in", "gate", "outer-out"]
+
+
+def test_subset_shares_handlers_and_hooks():
+    calls = []
+    d = _dispatcher(calls)
+    sub = d.subset(["act"])
+    assert set(sub.routes) == {"join_room", "ping"}
+    assert sub.routes["ping"] is d.routes["ping"]
+    hook_calls = []
+
+    async def hook(sess, msg, call_next):
+        hook_calls.append(msg.type)
+        await call_next()
+
+    d.add_hook(hook)  # 事后注册的钩子对子集同样生效
+    sess = FakeSession()
+
+    async def main():
+        await sub.dispatch(sess, '{"type": "act", "action": {"type": "pass"}}')
+        await sub.dispatch(sess, '{"type": "ping"}')
+
+    asyncio.run(main())
+    assert sess.sent == [{"type": "error", "detail": "unknown message type"}]
+    assert hook_calls == ["ping"]
+
+
+def test_match_choice():
+    choices = [
+        {"type": "discard", "tile": 3},
+        {"type": "discard", "tile": 5},
+        {"type": "kong", "style": "concealed", "tile": 1},
+        {"type": "pass"},
+    ]
+    assert match_choice(Action("discard", None, 5), choices) == {"type": "discard", "tile": 5}
+    # 出牌、碰、杠必须带牌，不能默认成第一个候选
+    assert match_choice(Action("discard", None, None), choices) is None
+    assert match_choice(Action("kong", "concealed", None), choices) is None
+    assert match_choice(Action("peng", None, None), [{"type": "peng", "tile": 4}]) is None
+    assert match_choice(Action("peng", None, 4), [{"type": "peng", "tile": 4}]) == {"type": "peng", "tile": 4}
+    ron = {"type": "hu", "style": "ron", "tile": 12}
+    assert match_choice(Action("hu", "ron", None), [ron]) == ron
+    assert match_choice(Action("draw", None, None), [{"type": "draw"}]) == {"type": "draw"}
+    assert match_choice(Action("discard", None, 9), choices) is None
+    # 暗杠只列出第一个候选，其他牌交给规则函数校验
+    assert match_choice(Action("kong", "concealed", 8), choices) == {"type": "kong", "style": "concealed", "tile": 8}
+    assert match_choice(Action("kong", "added", 8), choices) is None
+    assert match_choice(Action("pass", None, 4), choices) == {"type": "pass"}
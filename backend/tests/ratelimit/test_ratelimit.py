@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from mahjong_duo import ratelimit
+from mahjong_duo.ratelimit import DEFAULT_LIMITS, RateLimiter, TokenBucket, parse_limits, rate_limit_hook
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动拨动的 time.monotonic。"""
+    now = SimpleNamespace(t=1000.0)
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now.t)
+    return now
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(2.0, 3.0)
+    now = clock.t
+    assert [bucket.take(now) for _ in range(4)] == [True, True, True, False]
+    assert not bucket.take(now + 0.4)   # 0.8 个令牌
+    assert bucket.take(now + 0.5)       # 攒够 1 个
+    assert not bucket.take(now + 0.5)
+    bucket.refill(now + 100)
+    assert bucket.tokens == 3.0         # 不超过桶容量
+    bucket.take(now + 100)
+    bucket.refill(now + 100.25)
+    assert bucket.tokens == pytest.approx(2.5)
+
+
+def test_parse_limits():
+    assert parse_limits(None) == DEFAULT_LIMITS
+    assert parse_limits("  ") == DEFAULT_LIMITS
+    assert parse_limits("0") is None
+    limits = parse_limits("game=5/8, hint=0.5")
+    assert limits["game"] == (5.0, 8.0)
+    assert limits["hint"] == (0.5, 0.5)
+    assert limits["session"] == DEFAULT_LIMITS["session"]
+    with pytest.raises(ValueError):
+        parse_limits("chat=1/1")
+
+
+def test_class_bucket_rejection_does_not_spend_session_tokens(clock):
+    limiter = RateLimiter({"session": (0.0, 3.0), "game": (0.0, 10.0), "hint": (1.0, 1.0), "control": (0.0, 10.0)})
+    assert limiter.allow("request_hint")
+    assert not limiter.allow("request_hint")
+    assert not limiter.allow("request_hint")
+    # 被 hint 桶拒绝的两条没有扣总桶，还剩 2 个
+    assert limiter.allow("act") and limiter.allow("sync_ack")
+    assert not limiter.allow("act")
+    clock.t += 5
+    assert not limiter.allow("request_hint")  # hint 桶已补满，但总桶不补充
+
+
+def test_unknown_types_count_as_control(clock):
+    limiter = RateLimiter({**DEFAULT_LIMITS, "control": (0.0, 1.0)})
+    assert limiter.allow("something_new")
+    assert not limiter.allow("sync_mode")
+
+
+def test_disabled_by_env_allows_everything(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "LIMITS", parse_limits("0"))
+    limiter = RateLimiter()
+    assert not limiter.enabled
+    assert all(limiter.allow("request_hint") for _ in range(100))
+
+
+def test_hook_notifies_once_per_run_of_rejections(clock):
+    sent, handled = [], []
+
+    async def send(payload):
+        sent.append(payload)
+
+    sess = SimpleNamespace(limiter=RateLimiter({**DEFAULT_LIMITS, "game": (1.0, 1.0), "hint": (1.0, 1.0)}), send=send)
+
+    async def call(msg_type):
+        async def call_next():
+            handled.append(msg_type)
+        await rate_limit_hook(sess, SimpleNamespace(type=msg_type), call_next)
+
+    async def main():
+        for t in ("act", "act", "act", "ready"):
+            await call(t)
+        clock.t += 1
+        await call("act")
+        await call("request_hint")
+        await call("request_hint")
+
+    asyncio.run(main())
+    assert handled == ["act", "act", "request_hint"]
+    assert sent == [
+        {"type": "error", "detail": "请求过于频繁，请稍后重试"},
+        {"type": "ai_hint", "error": "请求过于频繁，请稍后重试"},
+    ]
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from mahjong_duo import replay
+from mahjong_duo.replay import GameLog, ReplayLogs
+from mahjong_duo.rules_core import (
+    Meld,
+    PlayerState,
+    init_game,
+    prepare_added_kong,
+    replace,
+    resolve_rob_kong_hu,
+)
+
+
+def _add_snapshots(log, states, every):
+    log.snapshots = [(i, states[i].to_bytes()) for i in range(every, len(states), every)]
+
+
+def test_replay_matches_rules_core(record_playout):
+    for seed in range(30):
+        log, states = record_playout(seed)
+        for i, expected in enumerate(states):
+            assert log.state_at(i) == expected
+
+
+def test_replay_from_snapshots(record_playout):
+    for seed in range(10):
+        log, states = record_playout(seed)
+        _add_snapshots(log, states, 7)
+        for i, expected in enumerate(states):
+            got = log.state_at(i)
+            assert got == expected
+            assert got.zobrist == expected.zobrist
+        assert log.state_at() == states[-1]
+
+
+def test_log_round_trip_and_truncated_tail(record_playout):
+    log, states = record_playout(3)
+    _add_snapshots(log, states, 5)
+    blob = log.to_bytes()
+
+    restored = GameLog.from_bytes(blob)
+    assert (restored.room_id, restored.seed, restored.first_turn) == ("room", 3, 1)
+    assert restored.actions == log.actions
+    assert restored.snapshots == log.snapshots
+    assert restored.size == len(blob)
+
+    # 写到一半的动作帧被忽略
+    partial = GameLog.from_bytes(blob + bytes((replay.OP_DISCARD, 0)))
+    assert partial.actions == log.actions
+    assert partial.size == len(blob)
+
+
+def test_rob_kong_hu_replay():
+    tile = 1
+    game = init_game(12345)
+    game = replace(
+        game,
+        players=(
+            PlayerState((tile, 2, 3, 4, 5), (Meld("pong", (tile, tile, tile)),), ()),
+            PlayerState((0, 0, 2, 3, 9, 9, 9, 10, 11, 12, 13, 13, 13), (), ()),
+        ),
+    )
+    log = GameLog("room", 12345, 0)
+    log.snapshots = [(0, game.to_bytes())]
+    prepared = prepare_added_kong(game, 0, tile)
+    assert prepared.rob_pending
+    log.actions.append((replay.OP_KONG_ADDED, 0, tile))
+    assert log.state_at(1) == prepared.state
+
+    result = resolve_rob_kong_hu(prepared.state, 1, tile)
+    log.actions.append((replay.OP_ROB_KONG_HU, 1, tile))
+    assert log.state_at(2) == result.state
+
+
+def test_illegal_action_rejected():
+    log = GameLog("room", 12345, 0)
+    state = init_game(12345)
+    missing = next(t for t in range(27) if t not in state.players[0].hand)
+    log.actions.append((replay.OP_DISCARD, 0, missing))
+    with pytest.raises(ValueError):
+        log.state_at()
+
+
+def test_recorder_writes_and_resumes(tmp_path, record_playout):
+    logs = ReplayLogs(str(tmp_path), snapshot_every=4)
+    log, states = record_playout(5)
+    half = len(log) // 2
+
+    recorder = logs.create("room", 5, 1)
+    for i, (op, seat, tile) in enumerate(log.actions[:half]):
+        recorder.record(op, seat, tile, states[i + 1])
+    assert not os.path.exists(logs.path("room", 5))  # 只写缓冲，不在调用方写盘
+    recorder.close()
+    logs.flush()
+    with open(logs.path("room", 5), "ab") as fh:
+        fh.write(bytes((replay.OP_DRAW,)))  # 模拟崩溃时写了一半
+
+    recorder = asyncio.run(logs.resume("room", 5))
+    assert recorder.actions == half
+    for i, (op, seat, tile) in enumerate(log.actions[half:], start=half):
+        recorder.record(op, seat, tile, states[i + 1])
+    recorder.close()
+    logs.flush()
+
+    loaded = logs.load("room", 5)
+    assert loaded.actions == log.actions
+    assert [i for i, _ in loaded.snapshots] == list(range(4, len(log) + 1, 4))
+    for i, expected in enumerate(states):
+        assert loaded.state_at(i) == expected
+
+
+def test_background_writer_flushes_on_interval_and_stop(tmp_path, record_playout):
+    log, states = record_playout(7)
+
+    async def run():
+        logs = ReplayLogs(str(tmp_path), flush_interval=0.05)
+        logs.start()
+        recorder = logs.create("room", 7, 1)
+        recorder.record(*log.actions[0], states[1])
+        await asyncio.sleep(0.2)
+        assert logs.load("room", 7).actions == log.actions[:1]
+        for i, action in enumerate(log.actions[1:], start=1):
+            recorder.record(*action, states[i + 1])
+        recorder.close()
+        await logs.stop()
+        return logs
+
+    logs = asyncio.run(run())
+    assert logs.load("room", 7).actions == log.actions
+
+
+def test_prune_removes_old_inactive_logs(tmp_path):
+    logs = ReplayLogs(str(tmp_path), keep_days=1)
+    for name in ("old-1", "active-2", "new-3"):
+        (tmp_path / f"{name}.mjlog").write_bytes(b"")
+    old = time.time() - 2 * 86400
+    for name in ("old-1", "active-2"):
+        os.utime(tmp_path / f"{name}.mjlog", (old, old))
+    (tmp_path / "notes.txt").write_bytes(b"")
+    os.utime(tmp_path / "notes.txt", (old, old))
+
+    assert logs.prune(frozenset({str(tmp_path / "active-2.mjlog")})) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["active-2.mjlog", "new-3.mjlog", "notes.txt"]
+    assert ReplayLogs(str(tmp_path), keep_days=0).prune() == 0
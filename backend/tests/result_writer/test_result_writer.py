@@ -0,0 +1,198 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from mahjong_duo.database import Database, GameResult
+from mahjong_duo.result_writer import GameResultWriter
+
+
+async def _setup(path, scores):
+    return await _setup_on(Database(str(path), readers=1), scores)
+
+
+async def _setup_on(database, scores):
+    await database.init_tables()
+    users = []
+    for i, score in enumerate(scores):
+        await database.create_user(f"u{i}", "pw", initial_score=score)
+        users.append(await database.get_user_by_username(f"u{i}"))
+    return database, users
+
+
+def _result(winner, loser, score_change):
+    now = time.time()
+    return GameResult(winner["id"], loser["id"], winner["username"], loser["username"], True,
+                      score_change, "zimo", 1, [{"name": "自摸", "fan": 1}], "room", 1, now - 60, now)
+
+
+@pytest.fixture
+def run(tmp_path):
+    """在新事件循环里执行 body(database, users)，结束时关闭数据库。"""
+    def runner(body, scores=(1000, 1000)):
+        async def main():
+            database, users = await _setup(tmp_path / "test.db", scores)
+            try:
+                return await body(database, users)
+            finally:
+                await database.close()
+        return asyncio.run(main())
+    return runner
+
+
+def test_leaderboard_overlay_matches_written_result(run):
+    async def body(database, users):
+        writer = GameResultWriter(database)
+        # 榜外的 u0 大涨进前三，榜首 u5 大跌跌出前三
+        writer.submit(_result(users[0], users[5], 300))
+        writer.submit(_result(users[1], users[2], 5))
+        overlaid = await writer.leaderboard(3)
+        await writer.flush()
+        assert not writer._pending and not writer._unsettled
+        return overlaid, await database.get_leaderboard(3)
+
+    overlaid, written = run(body, scores=(900, 950, 1000, 1050, 1100, 1150))
+    assert [(r["username"], r["score"]) for r in overlaid] == [(r["username"], r["score"]) for r in written]
+    assert [r["username"] for r in overlaid] == ["u0", "u4", "u3"]
+
+
+def test_stats_overlay_matches_written_stats(run):
+    async def body(database, users):
+        a, b = users
+        await database.write_game_results([_result(a, b, 8)])
+        writer = GameResultWriter(database)
+        writer.submit(_result(b, a, 32))
+        writer.submit(_result(a, b, 2))
+        overlaid = [writer.overlay_stats(u["id"], await database.get_user_stats(u["id"])) for u in users]
+        await writer.flush()
+        written = [await database.get_user_stats(u["id"]) for u in users]
+        return overlaid, written
+
+    overlaid, written = run(body)
+    assert overlaid == written
+    assert written[0]["total_games"] == 3 and written[0]["wins"] == 2 and written[0]["max_score_change"] == 32
+
+
+class FlakyDatabase(Database):
+    def __init__(self, path, failures):
+        super().__init__(path, readers=0)
+        self.failures = failures
+        self.calls = 0
+
+    async def write_game_results(self, results):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("database is locked")
+        return await super().write_game_results(results)
+
+
+def test_commit_retries_with_backoff(tmp_path):
+    async def main():
+        database = FlakyDatabase(str(tmp_path / "test.db"), failures=2)
+        await database.init_tables()
+        await database.create_user("a", "pw")
+        await database.create_user("b", "pw")
+        a, b = await database.get_user_by_username("a"), await database.get_user_by_username("b")
+        writer = GameResultWriter(database, retries=3)
+        writer.submit(_result(a, b, 16))
+        assert writer.overlay(a)["score"] == 1016
+        await writer.flush()
+        score = (await database.get_user_by_username("a"))["score"]
+        await database.close()
+        return database.calls, score, writer.pending_score(a["id"])
+
+    assert asyncio.run(main()) == (3, 1016, 0)
+
+
+def test_bad_result_is_isolated_and_dropped(run):
+    async def body(database, users):
+        a, b = users
+        ghost = {"id": 999, "username": "ghost"}
+        writer = GameResultWriter(database, retries=1)
+        writer.submit(_result(a, b, 4))
+        writer.submit(_result(ghost, b, 100))
+        writer.submit(_result(b, a, 1))
+        await writer.flush()
+        return ([(await database.get_user_by_username(u["username"]))["score"] for u in users],
+                dict(writer._pending), writer._unsettled)
+
+    scores, pending, unsettled = run(body)
+    assert scores == [1003, 997]  # 两局正常写入，未知用户那局丢弃
+    assert pending == {} and unsettled == []
+
+
+def test_background_writer_batches_and_stop_flushes(run):
+    async def body(database, users):
+        a, b = users
+        writer = GameResultWriter(database, batch_size=2, interval=60)
+        writer.start()
+        writer.submit(_result(a, b, 1))
+        writer.submit(_result(a, b, 1))  # 满一批，立即写入
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if not writer._unsettled:
+                break
+        after_batch = (await database.get_user_by_username("u0"))["score"]
+        writer.submit(_result(a, b, 1))  # 不满一批，interval 很长：靠 stop 写完
+        await writer.stop()
+        return after_batch, (await database.get_user_by_username("u0"))["score"], len(writer)
+
+    assert run(body) == (1002, 1003, 0)
+
+
+class OutageDatabase(Database):
+    """在 down 为真期间所有写入都失败（数据库被锁住）。"""
+
+    def __init__(self, path):
+        super().__init__(path, readers=0)
+        self.down = False
+        self.failed = 0
+
+    async def write_game_results(self, results):
+        if self.down:
+            self.failed += 1
+            raise sqlite3.OperationalError("database is locked")
+        return await super().write_game_results(results)
+
+
+def test_outage_longer_than_retries_keeps_results(tmp_path):
+    async def main():
+        database = OutageDatabase(str(tmp_path / "test.db"))
+        database, (a, b) = await _setup_on(database, (1000, 1000))
+        writer = GameResultWriter(database, interval=0.01, retries=1, max_delay=0.05)
+        writer.start()
+        database.down = True
+        writer.submit(_result(a, b, 7))
+        writer.submit(_result(b, a, 2))
+        while database.failed < 10:  # 远超重试次数
+            await asyncio.sleep(0.01)
+        assert writer.overlay(a)["score"] == 1005  # 仍在叠加，没有被丢弃
+        assert len(writer._unsettled) == 2
+        database.down = False
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not writer._unsettled:
+                break
+        await writer.stop()
+        scores = [(await database.get_user_by_username(u["username"]))["score"] for u in (a, b)]
+        stats = await database.get_user_stats(a["id"])
+        await database.close()
+        return scores, stats["total_games"], dict(writer._pending)
+
+    assert asyncio.run(main()) == ([1005, 995], 2, {})
+
+
+def test_stop_during_outage_reports_unwritten(tmp_path, capsys):
+    async def main():
+        database = OutageDatabase(str(tmp_path / "test.db"))
+        database, (a, b) = await _setup_on(database, (1000, 1000))
+        writer = GameResultWriter(database, retries=0)
+        database.down = True
+        writer.submit(_result(a, b, 7))
+        await writer.flush()
+        await database.close()
+        return len(writer), writer.pending_score(a["id"])
+
+    assert asyncio.run(main()) == (1, 7)
+    assert "仍有 1 局结算未写入" in capsys.readouterr().out
@@ -0,0 +1,73 @@
+import pytest
+
+from mahjong_duo.room_registry import InvalidRoomId, RoomLimitReached, RoomRegistry, deep_sizeof
+
+
+class FakeRoom:
+    def __init__(self, room_id):
+        self.id = room_id
+        self.sess = {}
+        self.state = object()
+        self.measured = 0
+
+    def memory_usage(self):
+        self.measured += 1
+        return 100
+
+
+def test_room_ids():
+    registry = RoomRegistry(FakeRoom)
+    for rid in ("default", "room1", "房间-1", "room 1", "a.b#c!", "x" * 64):
+        assert registry.get_or_create(rid).id == rid
+    for rid in ("", "x" * 65, "a/b", "..\\x", "../etc", "a\nb", None):
+        with pytest.raises(InvalidRoomId):
+            registry.get_or_create(rid)
+
+
+def test_sweep_evicts_only_idle_empty_rooms():
+    evicted = []
+    registry = RoomRegistry(FakeRoom, idle_timeout=10, on_evict=evicted.append)
+    idle, busy, fresh = (registry.get_or_create(rid) for rid in ("idle", "busy", "fresh"))
+    busy.sess[0] = object()
+    start = registry._last_active["idle"]
+    registry._last_active["busy"] = start
+    registry._last_active["fresh"] = start + 5
+
+    assert registry.sweep(now=start + 11) == 1
+    assert evicted == ["idle"] and idle.state is None
+    assert sorted(registry) == ["busy", "fresh"]
+    assert registry.sweep(now=start + 14) == 0
+    assert registry.sweep(now=start + 15) == 1
+
+
+def test_capacity_evicts_oldest_empty_room_then_rejects():
+    registry = RoomRegistry(FakeRoom, max_rooms=2)
+    registry.get_or_create("a")
+    registry.get_or_create("b")
+    registry._last_active["a"] -= 100
+    registry.get_or_create("c")
+    assert sorted(registry) == ["b", "c"]
+
+    for rid in ("b", "c"):
+        registry.get(rid).sess[0] = object()
+    with pytest.raises(RoomLimitReached):
+        registry.get_or_create("d")
+    assert registry.get_or_create("b") is registry.get("b")  # 已有房间不受上限影响
+
+
+def test_memory_is_sampled_and_extrapolated():
+    registry = RoomRegistry(FakeRoom, memory_sample=4)
+    for i in range(10):
+        registry.get_or_create(f"r{i}")
+    assert registry.memory_bytes() == 0
+    registry.sweep()
+    assert sum(room.measured for room in registry.values()) == 4
+    assert registry.memory_bytes() == 1000
+    assert registry.stats() == {"rooms": 10, "occupied": 0, "max_rooms": 1000, "memory_bytes": 1000}
+
+
+def test_deep_sizeof_counts_shared_objects_once():
+    part = list(range(100))
+    single = deep_sizeof(part)
+    assert single > deep_sizeof([])
+    assert deep_sizeof((part, part)) < 2 * single
@@ -0,0 +1,187 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from mahjong_duo import room_store
+from mahjong_duo.room_store import (
+    MemoryRoomStore,
+    RoomPersister,
+    RoomSnapshot,
+    SqliteRoomStore,
+    decode_snapshot,
+    encode_snapshot,
+)
+from mahjong_duo.rules_core import draw, init_game, replace
+
+
+def _snapshot(room_id="room", state=None):
+    if state is None:
+        game = init_game(12345)
+        state = draw(game, game.turn)[0]
+    return RoomSnapshot(room_id, state, {0: True, 1: False}, {0: "alice", 1: "AI"}, 1, True)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make():
+        if request.param == "memory":
+            return MemoryRoomStore()
+        return SqliteRoomStore(str(tmp_path / "rooms.db"))
+    return make
+
+
+def test_snapshot_round_trip():
+    snap = _snapshot()
+    restored = decode_snapshot(encode_snapshot(snap))
+    assert restored == snap
+    assert restored.state.zobrist == snap.state.zobrist
+    empty = snap._replace(state=None)
+    assert decode_snapshot(encode_snapshot(empty)) == empty
+
+
+def test_snapshot_version_checked(monkeypatch):
+    monkeypatch.setattr(room_store, "FORMAT_VERSION", room_store.FORMAT_VERSION + 1)
+    blob = encode_snapshot(_snapshot())
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        decode_snapshot(blob)
+
+
+def test_store_save_load_delete_purge(make_store):
+    async def run():
+        store = make_store()
+        await store.save_many([("a", b"1"), ("b", b"2")])
+        await store.save_many([("a", b"3")])
+        assert await store.load("a") == b"3"
+        assert await store.load("missing") is None
+        await store.delete_many(["b", "missing"])
+        assert await store.load("b") is None
+        assert await store.purge(3600) == 0
+        await asyncio.sleep(0.05)
+        assert await store.purge(0.01) == 1
+        assert await store.load("a") is None
+        await store.close()
+    asyncio.run(run())
+
+
+def test_sqlite_store_concurrent_first_use_opens_one_connection(tmp_path, monkeypatch):
+    opened = []
+    connect = room_store.aiosqlite.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args)
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(room_store.aiosqlite, "connect", counting_connect)
+
+    async def run():
+        store = SqliteRoomStore(str(tmp_path / "rooms.db"))
+        await asyncio.gather(store.save_many([("a", b"1")]), *(store.load("a") for _ in range(5)))
+        await store.close()
+    asyncio.run(run())
+    assert len(opened) == 1
+
+
+def test_persister_writes_only_on_key_change_and_deletes_ended_games():
+    async def run():
+        store = MemoryRoomStore()
+        persister = RoomPersister(store)
+        calls = []
+
+        def snapshot():
+            calls.append(1)
+            return _snapshot()
+
+        persister.track("room", 1, snapshot)
+        persister.track("room", 1, snapshot)
+        assert len(calls) == 1
+        assert (await persister.load("room")) == _snapshot()  # 尚未写入时从待写队列读取
+        await persister.flush()
+        assert decode_snapshot(await store.load("room")) == _snapshot()
+
+        ended = _snapshot(state=replace(init_game(1), ended=True))
+        persister.track("room", 2, lambda: ended)
+        assert await persister.load("room") is None  # 待删除
+        await persister.flush()
+        assert await store.load("room") is None
+    asyncio.run(run())
+
+
+class FlakyStore(MemoryRoomStore):
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    async def save_many(self, items):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        await super().save_many(items)
+
+
+def test_failed_flush_is_retried_without_overwriting_newer_snapshots(capsys):
+    async def run():
+        store = FlakyStore()
+        persister = RoomPersister(store)
+        first, second = _snapshot("a"), _snapshot("b")
+        persister.track("a", 1, lambda: first)
+        persister.track("b", 1, lambda: second)
+        await persister.flush()
+        assert await store.load("a") is None
+        game = init_game(7)
+        newer = _snapshot("a", state=draw(game, game.turn)[0])
+        persister.track("a", 2, lambda: newer)  # 失败期间又有新快照
+        await persister.flush()
+        return store
+
+    store = asyncio.run(run())
+    assert "房间快照写入失败" in capsys.readouterr().out
+    assert decode_snapshot(asyncio.run(store.load("a"))).state.seed == 7
+    assert decode_snapshot(asyncio.run(store.load("b"))) == _snapshot("b")
+
+
+def test_background_writer_and_flush_on_stop(tmp_path):
+    path = str(tmp_path / "rooms.db")
+
+    async def run():
+        persister = RoomPersister(SqliteRoomStore(path))
+        persister.start()
+        persister.track("a", 1, lambda: _snapshot("a"))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if await persister.store.load("a") is not None:
+                break
+        assert await persister.store.load("a") is not None
+        persister.track("b", 1, lambda: _snapshot("b"))
+        persister._task.cancel()  # 模拟后台任务来不及写：stop 时补写
+        await persister.stop()
+
+        reopened = RoomPersister(SqliteRoomStore(path))
+        try:
+            return await reopened.load("a"), await reopened.load("b")
+        finally:
+            await reopened.stop()
+
+    assert asyncio.run(run()) == (_snapshot("a"), _snapshot("b"))
+
+
+def test_undecodable_snapshot_is_dropped(capsys):
+    async def run():
+        store = MemoryRoomStore()
+        await store.save_many([("room", b"garbage")])
+        return await RoomPersister(store).load("room")
+    assert asyncio.run(run()) is None
+    assert "无法解析" in capsys.readouterr().out
+
+
+def test_incomplete_backend_fails_on_construction():
+    class NoDelete(room_store.RoomStore):
+        async def save_many(self, items):
+            pass
+
+        async def load(self, room_id):
+            return None
+
+    with pytest.raises(TypeError):
+        NoDelete()
@@ -0,0 +1,106 @@
+import random
+
+from mahjong_duo.rules_core import (
+    TILE_TYPES,
+    canonicalize_counts,
+    canonical_tile_to_original,
+    counts_from_tiles,
+    can_hu_four_plus_one,
+    decompose_tiles_canonical,
+    decompose_final_all,
+    _can_form_melds,
+    _decompose_tiles_all,
+)
+
+
+def _permute(counts, suits, flips):
+    out = []
+    for s, flip in zip(suits, flips):
+        block = counts[s*9:(s+1)*9]
+        out.extend(block[::-1] if flip else block)
+    return tuple(out)
+
+
+def _random_winning_hand(rng):
+    counts = [0] * TILE_TYPES
+    for _ in range(4):
+        while True:
+            if rng.random() < 0.5:
+                t = rng.randrange(TILE_TYPES)
+                if counts[t] <= 1:
+                    counts[t] += 3
+                    break
+            else:
+                t = rng.randrange(3) * 9 + rng.randrange(7)
+                if all(counts[t+k] < 4 for k in range(3)):
+                    for k in range(3):
+                        counts[t+k] += 1
+                    break
+    while True:
+        t = rng.randrange(TILE_TYPES)
+        if counts[t] <= 2:
+            counts[t] += 2
+            break
+    return tuple(t for t, c in enumerate(counts) for _ in range(c))
+
+
+def _raw_can_hu(tiles, need):
+    c0 = counts_from_tiles(tiles)
+    for i in range(TILE_TYPES):
+        if c0[i] >= 2:
+            arr = list(c0); arr[i] -= 2
+            if _can_form_melds(tuple(arr), need):
+                return True
+    return False
+
+
+def test_canonical_form_invariant_under_symmetries():
+    rng = random.Random(7)
+    hand = tuple(sorted(rng.randrange(TILE_TYPES) for _ in range(14)))
+    counts = counts_from_tiles(hand)
+    canon, _ = canonicalize_counts(counts)
+    for suits in ((1, 2, 0), (2, 0, 1), (0, 2, 1)):
+        for flips in ((False, False, False), (True, False, True), (True, True, True)):
+            assert canonicalize_counts(_permute(counts, suits, flips))[0] == canon
+
+
+def test_canonical_tile_mapping_restores_counts():
+    rng = random.Random(11)
+    for _ in range(200):
+        counts = tuple(rng.randrange(5) for _ in range(TILE_TYPES))
+        canon, transform = canonicalize_counts(counts)
+        restored = [0] * TILE_TYPES
+        for t, c in enumerate(canon):
+            restored[canonical_tile_to_original(t, transform)] = c
+        assert tuple(restored) == counts
+
+
+def test_can_hu_matches_raw_check():
+    rng = random.Random(3)
+    for _ in range(300):
+        tiles = _random_winning_hand(rng) if rng.random() < 0.5 else tuple(sorted(rng.randrange(TILE_TYPES) for _ in range(14)))
+        if max(counts_from_tiles(tiles)) > 4:
+            continue
+        assert can_hu_four_plus_one(tiles) == _raw_can_hu(tiles, 4)
+
+
+def test_decompose_canonical_matches_raw():
+    rng = random.Random(5)
+    for _ in range(300):
+        counts = counts_from_tiles(_random_winning_hand(rng))
+        raw = {tuple(sorted(p)) for p in _decompose_tiles_all(counts, 4, False)}
+        canonical = set(decompose_tiles_canonical(counts, 4, False))
+        assert raw and canonical == raw
+
+
+def test_decompose_final_all_mirrored_hand():
+    # 9 8 7 的顺子在翻转花色中仍应还原成起点为 7 的顺子
+    hand = (6, 7, 8, 6, 7, 8, 6, 7, 8, 17, 17, 17, 26, 26)
+    sols = decompose_final_all(hand, ())
+    shapes = {tuple(sorted((m.kind, m.tiles) for m in sol)) for sol in sols}
+    assert (
+        ("sequence", (6, 7, 8)), ("sequence", (6, 7, 8)), ("sequence", (6, 7, 8)), ("triplet", (17, 17, 17))
+    ) in shapes
+    assert (
+        ("triplet", (6, 6, 6)), ("triplet", (7, 7, 7)), ("triplet", (8, 8, 8)), ("triplet", (17, 17, 17))
+    ) in shapes
@@ -1,6 +1,9 @@
+from dataclasses import fields
+
 import pytest
 
 from mahjong_duo.rules_core import (
+    GameState,
     init_game,
     draw,
     discard,
@@ -189,3 +192,24 @@ def test_kong_added_tile_not_in_hand(game):
 
     with pytest.raises(ValueError):
         kong_added(prepared_game, 0, 1)
+
+
+def test_draw_and_discard_carry_every_field(game):
+    # draw / discard 直接构造 GameState：新增字段时须同步更新它们和这里的列表
+    assert [f.name for f in fields(GameState)] == [
+        "seed", "wall", "players", "turn", "last_discard", "step_no", "started", "ended",
+        "pending_kong_draw", "last_draw_info", "pending_rob_kong", "zobrist",
+    ]
+    state = replace(game, started=True, pending_kong_draw=1, pending_rob_kong=(1, 3))
+    drawn, tile = draw(state, 0)
+    assert drawn == replace(
+        state, wall=state.wall[1:], step_no=state.step_no + 1, last_draw_info=(0, "normal"),
+        players=(replace(state.players[0], hand=tuple(sorted(state.players[0].hand + (tile,)))), state.players[1]),
+    )
+    hand = list(drawn.players[0].hand)
+    hand.remove(tile)
+    discarded = discard(drawn, 0, tile)
+    assert discarded == replace(
+        drawn, turn=1, last_discard=(0, tile), step_no=drawn.step_no + 1, last_draw_info=None,
+        players=(PlayerState(tuple(hand), (), (tile,)), drawn.players[1]),
+    )
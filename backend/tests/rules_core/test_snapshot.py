@@ -0,0 +1,86 @@
+import pytest
+
+from mahjong_duo.rules_core import (
+    GameState,
+    Meld,
+    PlayerState,
+    SNAPSHOT_VERSION,
+    init_game,
+    replace,
+    zobrist_hash,
+)
+
+
+def _assert_round_trip(state):
+    restored = GameState.from_bytes(state.to_bytes())
+    assert restored == state
+    assert restored.zobrist == state.zobrist
+
+
+def test_round_trip_random_playouts(random_playout):
+    for seed in range(30):
+        for state in random_playout(seed).states:
+            _assert_round_trip(state)
+
+
+def test_round_trip_optional_fields():
+    game = init_game(12345)
+    _assert_round_trip(replace(game, ended=True, started=False))
+    _assert_round_trip(replace(game, last_discard=(1, 26), pending_kong_draw=0))
+    _assert_round_trip(replace(game, last_draw_info=(1, "kong"), pending_rob_kong=(0, 3)))
+
+
+def test_round_trip_wall_not_derived_from_seed():
+    game = init_game(12345)
+    custom = replace(game, wall=(5, 5, 5, 0))
+    _assert_round_trip(custom)
+    _assert_round_trip(replace(game, wall=()))
+
+
+def test_round_trip_melds():
+    game = init_game(12345)
+    p0 = PlayerState((1, 2, 3), (Meld("pong", (4, 4, 4)), Meld("kong_added", (7, 7, 7, 7))), (9, 10))
+    p1 = PlayerState((), (Meld("kong_concealed", (0, 0, 0, 0)), Meld("kong_exposed", (26, 26, 26, 26))), ())
+    _assert_round_trip(replace(game, players=(p0, p1)))
+
+
+def test_snapshot_is_compact():
+    game = init_game(12345)
+    # 牌墙由 seed 推出，不写入快照
+    assert len(game.to_bytes()) < 64
+
+
+def test_rejects_unknown_version():
+    blob = bytearray(init_game(12345).to_bytes())
+    assert blob[0] == SNAPSHOT_VERSION
+    blob[0] = SNAPSHOT_VERSION + 1
+    with pytest.raises(ValueError):
+        GameState.from_bytes(bytes(blob))
+    with pytest.raises(ValueError):
+        GameState.from_bytes(init_game(12345).to_bytes() + b"\x00")
+
+
+def test_rejects_truncated_snapshots():
+    p0 = PlayerState((1, 2, 3), (Meld("pong", (4, 4, 4)),), (9, 10))
+    game = replace(init_game(12345), wall=(5, 5, 5, 0), players=(p0, init_game(12345).players[1]))
+    blob = game.to_bytes()
+    for n in range(len(blob)):
+        with pytest.raises(ValueError):
+            GameState.from_bytes(blob[:n])
+
+
+def test_rejects_corrupt_snapshots():
+    blob = init_game(12345).to_bytes()
+    flipped = bytearray(blob)
+    flipped[-1] ^= 0x02  # 改一张弃牌/手牌：哈希对不上
+    with pytest.raises(ValueError, match="hash"):
+        GameState.from_bytes(bytes(flipped))
+    out_of_range = bytearray(blob)
+    out_of_range[-1] = 200
+    with pytest.raises(ValueError, match="tile"):
+        GameState.from_bytes(bytes(out_of_range))
+
+
+def test_loaded_hash_is_recomputed(random_playout):
+    for state in random_playout(3).states[::10]:
+        assert GameState.from_bytes(state.to_bytes()).zobrist == zobrist_hash(state)
@@ -0,0 +1,76 @@
+import pytest
+
+from mahjong_duo.rules_core import (
+    init_game,
+    draw,
+    prepare_added_kong,
+    resolve_rob_kong_hu,
+    zobrist_hash,
+    Meld,
+    PlayerState,
+    replace,
+)
+
+
+def test_initial_hash_matches_full_computation():
+    game = init_game(12345)
+    assert game.zobrist == zobrist_hash(game)
+
+
+def test_incremental_hash_matches_full_computation(random_playout):
+    for seed in range(30):
+        for state in random_playout(seed).states:
+            assert state.zobrist == zobrist_hash(state)
+
+
+def test_hash_ignores_non_hashed_fields():
+    game = init_game(12345)
+    assert replace(game, ended=True).zobrist == game.zobrist
+
+
+def test_hash_distinguishes_turn_and_wall():
+    game = init_game(12345)
+    other_turn = init_game(12345, first_turn=1)
+    assert game.zobrist != other_turn.zobrist
+
+    after_draw, _ = draw(game, 0)
+    assert after_draw.zobrist != game.zobrist
+
+
+def test_same_position_via_different_orders_collides():
+    # 同一手牌经由不同顺序得到，哈希应一致（弃牌不计入哈希）
+    base = init_game(12345)
+    hand = base.players[0].hand
+    a, b = hand[0], hand[1]
+    p0 = base.players[0]
+    s1 = replace(base, players=(replace(p0, discards=(a, b)), base.players[1]))
+    s2 = replace(base, players=(replace(p0, discards=(b, a)), base.players[1]))
+    assert s1.zobrist == s2.zobrist
+
+
+def test_replace_never_keeps_stale_hash():
+    base = init_game(12345)
+    p0 = base.players[0]
+    changed = replace(base, players=(replace(p0, hand=p0.hand[1:]), base.players[1]))
+    assert changed.zobrist == zobrist_hash(changed) != base.zobrist
+    assert replace(base, turn=1 - base.turn).zobrist == zobrist_hash(replace(base, turn=1 - base.turn))
+    with pytest.raises(ValueError):
+        replace(base, zobrist=0)
+
+
+def test_rob_kong_hu_updates_hash():
+    tile = 1
+    game = init_game(12345)
+    game = replace(
+        game,
+        players=(
+            PlayerState((tile, 2, 3, 4, 5), (Meld("pong", (tile, tile, tile)),), ()),
+            PlayerState((0, 0, 2, 3, 9, 9, 9, 10, 11, 12, 13, 13, 13), (), ()),
+        ),
+    )
+    prepared = prepare_added_kong(game, 0, tile)
+    assert prepared.rob_pending
+    assert prepared.state.zobrist == zobrist_hash(prepared.state)
+
+    result = resolve_rob_kong_hu(prepared.state, 1, tile)
+    assert result.state.zobrist == zobrist_hash(result.state)
@@ -0,0 +1,63 @@
+from mahjong_duo.sync import MAX_PENDING_VIEWS, SyncTracker, apply_delta
+
+
+def _view(hand, discards=()):
+    return {
+        "hand": list(hand),
+        "melds_self": [],
+        "melds_opp": [],
+        "discards_self": list(discards),
+        "discards_opp": [],
+        "opponent": "AI",
+    }
+
+
+def _client(tracker, seq, view):
+    tracker.snapshot(seq, view)
+    return dict(view)
+
+
+def test_delta_ack_round_trip():
+    tracker = SyncTracker()
+    client = _client(tracker, 1, _view([1, 2, 3]))
+
+    views = [_view([1, 2, 3, 4]), _view([1, 2, 3], [4]), _view([1, 2, 3, 5], [4])]
+    for seq, view in enumerate(views, start=2):
+        msg = tracker.delta(seq, view)
+        assert msg["type"] == "sync_delta" and msg["seq"] == seq and msg["base"] == 1
+        client = apply_delta(client, msg["changes"])
+        assert client == view
+
+    tracker.ack(3)
+    assert tracker.base_seq == 3 and list(tracker.pending) == [4]
+    tracker.ack(4)
+    assert tracker.base_seq == 4 and not tracker.pending
+    assert tracker.delta(5, views[-1]) is None
+    tracker.ack(99)  # 未知 seq 忽略
+    assert tracker.base_seq == 4
+
+
+def test_field_changed_and_reverted_is_resent():
+    tracker = SyncTracker()
+    base = _view([1, 2, 3])
+    client = _client(tracker, 1, base)
+    client = apply_delta(client, tracker.delta(2, _view([1, 2, 3, 9]))["changes"])
+    # 摸到又打出同一张：手牌回到基准值，仍需下发
+    msg = tracker.delta(3, _view([1, 2, 3], [9]))
+    assert {"op": "set", "field": "hand", "value": [1, 2, 3]} in msg["changes"]
+    assert apply_delta(client, msg["changes"]) == _view([1, 2, 3], [9])
+
+
+def test_too_many_pending_views_falls_back_to_snapshot():
+    tracker = SyncTracker()
+    _client(tracker, 0, _view([]))
+    for seq in range(1, MAX_PENDING_VIEWS + 1):
+        assert tracker.delta(seq, _view([seq]))["type"] == "sync_delta"
+    view = _view([0], [1])
+    msg = tracker.delta(MAX_PENDING_VIEWS + 1, view)
+    assert msg == {"type": "sync_view", "seq": MAX_PENDING_VIEWS + 1, **view}
+    assert tracker.base == view and tracker.base_seq == MAX_PENDING_VIEWS + 1
+    assert not tracker.pending
+    # 旧的 ack 迟到也不会把基准退回去
+    tracker.ack(3)
+    assert tracker.base_seq == MAX_PENDING_VIEWS + 1
@@ -0,0 +1,101 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from mahjong_duo import token_store
+from mahjong_duo.token_store import MemoryTokenStore, SqliteTokenStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemoryTokenStore(**kwargs)
+        return SqliteTokenStore(str(tmp_path / "tokens.db"), **kwargs)
+    return make
+
+
+def test_issue_get_revoke(make_store):
+    async def run():
+        store = make_store()
+        token = await store.issue({"user_id": 7, "username": "alice"})
+        assert await store.get(token) == {"user_id": 7, "username": "alice"}
+        assert await store.get("forged") is None
+        await store.revoke(token)
+        assert await store.get(token) is None
+        await store.close()
+    asyncio.run(run())
+
+
+def test_expired_token_rejected(make_store):
+    async def run():
+        store = make_store(ttl=0.05)
+        token = await store.issue({"user_id": 1, "username": "bob"})
+        await asyncio.sleep(0.1)
+        assert await store.get(token) is None
+        await store.close()
+    asyncio.run(run())
+
+
+def test_memory_store_evicts_least_recently_used():
+    async def run():
+        store = MemoryTokenStore(max_tokens=2)
+        a = await store.issue({"username": "a"})
+        b = await store.issue({"username": "b"})
+        await store.get(a)  # a 变为最近使用
+        c = await store.issue({"username": "c"})
+        assert len(store) == 2
+        assert await store.get(b) is None
+        assert await store.get(a) is not None and await store.get(c) is not None
+    asyncio.run(run())
+
+
+def test_sqlite_store_stores_only_digests(tmp_path):
+    path = str(tmp_path / "tokens.db")
+
+    async def run():
+        store = SqliteTokenStore(path)
+        token = await store.issue({"user_id": 3, "username": "carol"})
+        await store.close()
+        # 另一个 worker 的连接也能验证
+        other = SqliteTokenStore(path)
+        assert await other.get(token) == {"user_id": 3, "username": "carol"}
+        await other.close()
+        return token
+
+    token = asyncio.run(run())
+    hashes = [row[0] for row in sqlite3.connect(path).execute("SELECT token_hash FROM auth_tokens")]
+    assert hashes == [token_store._digest(token)] and token not in hashes
+
+
+def test_sqlite_concurrent_first_use_opens_one_connection(tmp_path, monkeypatch):
+    opened = []
+    real_connect = token_store.aiosqlite.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args)
+        return real_connect(*args, **kwargs)
+
+    monkeypatch.setattr(token_store.aiosqlite, "connect", counting_connect)
+
+    async def run():
+        store = SqliteTokenStore(str(tmp_path / "tokens.db"))
+        conns = await asyncio.gather(*(store.connect() for _ in range(5)))
+        assert all(c is conns[0] for c in conns)
+        await store.close()
+
+    asyncio.run(run())
+    assert len(opened) == 1
+
+
+def test_incomplete_backend_fails_on_construction():
+    class NoRevoke(token_store.TokenStore):
+        async def issue(self, info):
+            return "t"
+
+        async def get(self, token):
+            return None
+
+    with pytest.raises(TypeError):
+        NoRevoke()
@@ -0,0 +1,38 @@
+import asyncio
+import json
+import logging
+import time
+
+from mahjong_duo import metrics
+from mahjong_duo.watchdog import LoopWatchdog
+
+
+def _block(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_stall_reports_message_type_of_running_task(caplog):
+    async def handler():
+        with metrics.track_message("act"):
+            await asyncio.sleep(0)
+            _block(0.4)
+
+    async def idle():
+        await asyncio.sleep(0.05)
+
+    async def run():
+        wd = LoopWatchdog(interval=0.02, threshold=0.1)
+        wd.start()
+        await asyncio.sleep(0.05)
+        await asyncio.gather(idle(), handler())
+        await asyncio.sleep(0.1)
+        await wd.stop()
+
+    with caplog.at_level(logging.WARNING, logger="mahjong_duo.watchdog"):
+        asyncio.run(run())
+    stalls = [json.loads(r.getMessage()) for r in caplog.records]
+    assert stalls and stalls[0]["event"] == "loop_stall"
+    assert stalls[0]["message_type"] == "act"
+    assert stalls[0]["lag_ms"] >= 100
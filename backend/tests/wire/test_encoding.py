@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from mahjong_duo import encoding, wire
+from mahjong_duo.encoding import encode, encode_discard, encode_draw, encode_pass
+
+
+def _check(msg, data):
+    assert json.loads(msg.text) == data
+    assert msg.size == len(msg.text.encode("utf-8"))
+    assert ": " not in msg.text and ", " not in msg.text  # 紧凑格式
+
+
+@pytest.mark.parametrize("seat", [0, 1])
+def test_hot_events_match_generic_encoder(seat):
+    for tile in (*range(27), None):
+        data = {"type": "event", "ev": {"type": "draw", "seat": seat, "tile": tile}}
+        msg = encode_draw(seat, tile)
+        assert msg == encode(data, binary=True)
+        _check(msg, data)
+        assert wire.unpack(msg.binary)["ev"].get("tile") == tile
+    for tile in range(27):
+        data = {"type": "event", "ev": {"type": "discard", "seat": seat, "tile": tile}}
+        assert encode_discard(seat, tile) == encode(data, binary=True)
+    data = {"type": "event", "ev": {"type": "pass", "seat": seat}}
+    assert encode_pass(seat) == encode(data, binary=True)
+    _check(encode_pass(seat), data)
+
+
+def test_hot_events_are_shared():
+    assert encode_discard(0, 5) is encode_discard(0, 5)
+    # 表外的取值仍走通用编码
+    assert json.loads(encode_discard(0, 99).text)["ev"]["tile"] == 99
+
+
+def test_size_counts_utf8_bytes():
+    data = {"type": "chat", "text": "杠上开花", 1: True}
+    msg = encode(data)
+    _check(msg, {"type": "chat", "text": "杠上开花", "1": True})
+    assert msg.type == "chat" and msg.binary is None
+    assert msg.text == encoding.dumps(data)
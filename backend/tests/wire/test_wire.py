@@ -0,0 +1,86 @@
+import pytest
+
+from mahjong_duo import wire
+from mahjong_duo.sync import SyncTracker, apply_delta
+
+VIEW = {
+    "hand": [0, 3, 3, 17, 26],
+    "melds_self": [{"kind": "pong", "tiles": [5, 5, 5]}, {"kind": "kong_concealed", "tiles": [None] * 4}],
+    "melds_opp": [],
+    "discards_self": [9, 10],
+    "discards_opp": [],
+    "opponent": "对手 AI",
+}
+
+ROUND_TRIP = [
+    {"type": "event", "ev": {"type": "draw", "seat": 1, "tile": 4}},
+    {"type": "event", "ev": {"type": "draw", "seat": 0}},
+    {"type": "event", "ev": {"type": "kong", "seat": 0, "tile": 7, "style": "exposed", "from": 1}},
+    {"type": "event", "ev": {"type": "rob_kong", "seat": 1, "tile": 2}},
+    {"type": "choices", "actions": []},
+    {"type": "choices", "actions": [
+        {"type": "discard", "tile": 3},
+        {"type": "kong", "style": "added", "tile": 8},
+        {"type": "hu", "style": "ron", "tile": 12, "from": 0},
+        {"type": "pass"},
+    ]},
+    {"type": "sync_hand", "hand": [1, 2, 3]},
+    {"type": "sync_view", "seq": 7, **VIEW},
+    {"type": "sync_view", **VIEW},
+    {"type": "sync_delta", "seq": 9, "base": 7, "changes": [
+        {"op": "append", "field": "discards_self", "at": 2, "items": [11]},
+        {"op": "set", "field": "hand", "value": [0, 3, 17]},
+        {"op": "set", "field": "melds_opp", "value": [{"kind": "kong_exposed", "tiles": [6, 6, 6, 6]}]},
+        {"op": "set", "field": "opponent", "value": ""},
+    ]},
+    {"type": "sync_delta", "seq": 1, "base": None, "changes": []},
+]
+
+
+@pytest.mark.parametrize("msg", ROUND_TRIP, ids=lambda m: m["type"])
+def test_pack_unpack_round_trip(msg):
+    blob = wire.pack(msg)
+    assert blob is not None
+    assert wire.unpack(blob) == msg
+    assert wire.pack(wire.unpack(blob)) == blob
+
+
+@pytest.mark.parametrize("msg", [
+    {"type": "chat", "text": "hi"},
+    {"type": "event", "ev": {"type": "draw", "seat": 0, "tile": 4, "extra": 1}},
+    {"type": "event", "ev": {"type": "draw", "seat": 0, "tile": 300}},
+    {"type": "event", "ev": {"type": "draw", "seat": 0, "tile": -1}},
+    {"type": "event", "ev": {"type": "draw", "seat": 0, "tile": "4"}},
+    {"type": "event", "ev": {"type": "shout", "seat": 0}},
+    {"type": "choices", "actions": [{"type": "discard", "style": "wild"}]},
+    {"type": "sync_view", "seq": 1, **VIEW, "score": 3},
+    {"type": "sync_view", "seq": 1, **VIEW, "opponent": "长" * 100},
+    {"type": "sync_view", "seq": 1, **VIEW, "melds_self": [{"kind": "chow", "tiles": [1, 2, 3]}]},
+    {"type": "sync_delta", "seq": 2, "base": 1, "changes": [{"op": "remove", "field": "hand", "value": []}]},
+    {"type": "sync_delta", "seq": 2 ** 32, "base": 1, "changes": []},
+])
+def test_unsupported_messages_fall_back_to_json(msg):
+    assert wire.pack(msg) is None
+
+
+def test_unknown_code_rejected():
+    with pytest.raises(ValueError):
+        wire.unpack(bytes((0x7F,)))
+
+
+def test_tracker_deltas_survive_the_wire():
+    # 服务端 delta 经二进制帧往返后，客户端按 base 应用得到同样的视图
+    tracker = SyncTracker()
+    views = [dict(VIEW)]
+    tracker.snapshot(1, views[0])
+    tracker.ack(1)
+    client = dict(VIEW)
+    for seq, change in enumerate([{"discards_self": [9, 10, 11]}, {"hand": [0, 3, 17], "opponent": "AI"}], start=2):
+        view = {**views[-1], **change}
+        views.append(view)
+        msg = tracker.delta(seq, view)
+        msg = wire.unpack(wire.pack(msg))
+        assert msg["type"] == "sync_delta" and msg["base"] == seq - 1
+        client = apply_delta(client, msg["changes"])
+        assert client == view
+        tracker.ack(seq)
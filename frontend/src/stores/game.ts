@@ -84,6 +84,8 @@ watch(username, (newUsername) => {
 const userScore = ref(user.value?.score || 1000)
 const roomId = ref(savedRoomId || 'room1')
 const ws = ref<WebSocket | null>(null)
+// 多分片部署时服务器指定的连接地址（收到 redirect 后设置）
+const shardWsUrl = ref<string | null>(null)
 const connected = ref(false)
 const autoReadyRequested = ref(false)
 const aiPracticePending = ref(false)
@@ -314,6 +316,13 @@ function resolveWebSocketUrl(auth: boolean = true): string {
   return `${wsProtocol}://${safeHost}${portSegment}/ws${auth ? '/auth' : ''}`
 }
 
+function resolveShardUrl(msg: { url?: string | null; port?: number | null }): string {
+  if (msg.url) return msg.url
+  const url = new URL(resolveWebSocketUrl(true))
+  if (typeof msg.port === 'number') url.port = String(msg.port)
+  return url.toString()
+}
+
 watch(
   hand,
   (newHand, oldHand) => {
@@ -557,7 +566,7 @@ function connect() {
     return
   }
 
-  ws.value = new WebSocket(resolveWebSocketUrl(true))
+  ws.value = new WebSocket(shardWsUrl.value ?? resolveWebSocketUrl(true))
   ws.value.onopen = () => {
     // 先进行用户认证
     const tokenToUse = authToken.value || (typeof localStorage !== 'undefined' ? localStorage.getItem('mahjong_token') : null)
@@ -580,6 +589,17 @@ function connect() {
       saveRoomInfo()
       // 认证成功后加入房间
       send({ type: 'join_room', room_id: roomId.value })
+    } else if (msg.type === 'redirect') {
+      // 房间由其他分片负责：改连到该分片，重新认证后加入
+      shardWsUrl.value = resolveShardUrl(msg)
+      const old = ws.value
+      if (old) {
+        old.onclose = null
+        old.close()
+      }
+      ws.value = null
+      connected.value = false
+      connect()
     } else if (msg.type === 'room_joined') {
       seat.value = msg.seat
       attemptAutoReady()